@@ -1,9 +1,9 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import Response
 from pydantic import BaseModel
 import os
-import pandas as pd
-import geopandas as gpd
-import math
+import threading
+import uuid
 
 # =====================================================
 # APP
@@ -23,50 +23,85 @@ class ExpansionRequest(BaseModel):
     tipo_sitio: str | None = None
     tipo_adquisicion: str | None = None
     ubicacion_en_manzana: str | None = None
+    # Pin movido unos metros: reusa la corrida previa del folio
+    # (opt-in; por defecto cada corrida consulta Places completo)
+    modo_movimiento: bool = False
+    # Presupuesto de latencia: etapas lentas regresan valores
+    # gruesos (marcados como degradados) y se refinan después
+    max_latency_ms: int | None = None
+    # Pipeline completo (LLM + mapa + PDF + Drive) vía el DAG memoizado
+    reporte_completo: bool = False
 
 
 # =====================================================
 # IMPORTS PIPELINE
 # =====================================================
-from expansion.geo import load_neto_master, get_nearest_neto_store
-from expansion.inegi import find_municipio_inegi, prefix_inegi_keys
-from expansion.payload_builder import build_payload_flat
-from expansion.inegi_loader import download_inegi_from_drive
-from expansion.google_places import fetch_places_nearby
-from expansion.drive_uploader import upload_file_to_drive
-
-
-# =====================================================
-# UTILS
-# =====================================================
-def sanitize_for_json(obj):
-    """Convierte NaN / inf a None recursivamente."""
-    if isinstance(obj, dict):
-        return {k: sanitize_for_json(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [sanitize_for_json(v) for v in obj]
-    elif isinstance(obj, float):
-        if math.isnan(obj) or math.isinf(obj):
-            return None
-        return obj
-    else:
-        return obj
+# Los módulos pesados (pandas, geopandas, googlemaps, google-api)
+# se importan dentro de warmup() / endpoints, no al cargar la app:
+# el worker responde /health en milisegundos.
+from expansion.payload_builder import build_payload_record, dumps_json
+from expansion.deadline import ExpiringMap
 
 
 # =====================================================
 # GLOBALS (SE CARGAN UNA VEZ)
 # =====================================================
 DF_NETO = None
-GDF_INEGI = None
+# Municipios: solo la malla en memoria; geometrías exactas por bbox
+# del cache FlatGeobuf (bordes / fallback)
+INEGI_SHP_PATH = None
+MUNICIPIO_LOCATOR = None
 DF_INEGI_TABULAR = None
 
+# Último payload por folio (modo movimiento sin esperar al historial)
+LAST_PAYLOAD_BY_FOLIO = ExpiringMap(ttl_s=24 * 3600, max_entries=5000)
+
+# Refinamientos en segundo plano de corridas degradadas (por corrida)
+REFINEMENTS = ExpiringMap(ttl_s=3600, max_entries=2000)
+
+# DAG memoizado del pipeline completo + versiones del contexto
+EXPANSION_DAG = None
+DAG_CTX_VERSIONS = None
+
+READY = threading.Event()
+WARMUP_ERROR = None
+
 
 # =====================================================
-# STARTUP
+# STARTUP (WARMUP EN SEGUNDO PLANO)
 # =====================================================
 @app.on_event("startup")
 def startup():
-    global DF_NETO, GDF_INEGI, DF_INEGI_TABULAR
+    threading.Thread(target=_warmup_safe, name="warmup", daemon=True).start()
+
+
+@app.on_event("shutdown")
+def shutdown():
+    # El escritor del historial es daemon: escribir el último lote
+    from expansion.run_history import close_history_store
+    close_history_store()
+
+
+def _warmup_safe():
+    global WARMUP_ERROR
+    try:
+        warmup()
+    except Exception as e:
+        WARMUP_ERROR = f"{type(e).__name__}: {e}"
+    else:
+        READY.set()
+
+
+def warmup():
+    """
+    Carga datos de referencia (master NETO, INEGI geo y tabular).
+    """
+    global DF_NETO, INEGI_SHP_PATH, MUNICIPIO_LOCATOR, DF_INEGI_TABULAR
+    global EXPANSION_DAG, DAG_CTX_VERSIONS
+
+    import pandas as pd
+    from expansion.geo import load_neto_master
+    from expansion.inegi_loader import download_inegi_from_drive, sync_inegi_dataset
 
     # ---------------------------
     # NETO MASTER
@@ -79,19 +114,33 @@ def startup():
     # INEGI GEO (SHAPEFILE)
     # ---------------------------
     folder_id = os.environ.get("INEGI_DRIVE_FOLDER_ID")
+    manifest_path = os.environ.get("INEGI_MANIFEST_PATH")
     inegi_shp = "data/inegi/municipios/00mun.shp"
 
-    if folder_id and not os.path.exists(inegi_shp):
+    if manifest_path and os.path.exists(manifest_path):
+        # Sync verificado (sha256), paralelo y reanudable
+        sync_inegi_dataset(
+            manifest_path,
+            mirror_dir=os.environ.get("INEGI_MIRROR_DIR"),
+            base_url=os.environ.get("INEGI_BASE_URL")
+        )
+    elif folder_id and not os.path.exists(inegi_shp):
         download_inegi_from_drive(folder_id)
 
     if os.path.exists(inegi_shp):
-        GDF_INEGI = gpd.read_file(inegi_shp)
-
-        # 🔑 CRS FIX (OBLIGATORIO)
-        if GDF_INEGI.crs is None or GDF_INEGI.crs.to_epsg() != 4326:
-            GDF_INEGI = GDF_INEGI.to_crs(epsg=4326)
+        # Malla de municipios (+ cache FlatGeobuf, que se convierte
+        # solo la primera vez o si cambia el .shp). La capa completa
+        # no se queda en memoria; si la malla falla, los lookups leen
+        # una ventana por bbox del cache (inegi.lookup_municipio)
+        INEGI_SHP_PATH = inegi_shp
+        try:
+            from expansion.inegi_grid import load_municipio_locator
+            MUNICIPIO_LOCATOR = load_municipio_locator(inegi_shp)
+        except Exception:
+            MUNICIPIO_LOCATOR = None
     else:
-        GDF_INEGI = None
+        INEGI_SHP_PATH = None
+        MUNICIPIO_LOCATOR = None
 
     # ---------------------------
     # INEGI TABULAR (CSV HOGARES)
@@ -110,6 +159,44 @@ def startup():
     except Exception:
         DF_INEGI_TABULAR = None
 
+    # ---------------------------
+    # MÓDULOS DEL REQUEST + VECTORES REGIONALES
+    # (la primera llamada no paga imports ni parseo del JSON)
+    # ---------------------------
+    import expansion.inegi  # noqa: F401
+    import expansion.google_places  # noqa: F401
+    import expansion.drive_queue  # noqa: F401
+    import expansion.run_history  # noqa: F401
+    import expansion.deadline  # noqa: F401
+    from expansion.region_vectors import get_region_registry
+
+    get_region_registry().regions()
+
+    # ---------------------------
+    # DAG DEL PIPELINE COMPLETO
+    # (versiones del contexto: una vez, no por request)
+    # ---------------------------
+    from expansion.expansion_dag import build_expansion_dag, context_versions
+
+    EXPANSION_DAG = build_expansion_dag()
+    DAG_CTX_VERSIONS = context_versions(_dag_context())
+
+
+def _dag_context() -> dict:
+    from expansion.region_vectors import DEFAULT_REGION_VECTORS_PATH
+    from expansion.report_service import DEFAULT_LOGO_PATH
+
+    return {
+        "df_neto": DF_NETO,
+        "inegi_shp_path": INEGI_SHP_PATH,
+        "municipio_locator": MUNICIPIO_LOCATOR,
+        "df_inegi_tabular": DF_INEGI_TABULAR,
+        "master_path": "data/MASTER_FINAL_TIENDAS.xlsx",
+        "region_vectors_path": DEFAULT_REGION_VECTORS_PATH,
+        "logo_path": DEFAULT_LOGO_PATH,
+        "output_dir": "data/reportes",
+    }
+
 
 # =====================================================
 # HEALTH
@@ -119,12 +206,94 @@ def health():
     return {"ok": True}
 
 
+@app.get("/ready")
+def ready():
+    """
+    Listo para tráfico solo cuando terminó el warmup.
+    """
+    if READY.is_set():
+        return {"ready": True}
+    raise HTTPException(
+        status_code=503,
+        detail={"ready": False, "error": WARMUP_ERROR}
+    )
+
+
+# =====================================================
+# STATUS DE SUBIDAS A DRIVE
+# =====================================================
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    from expansion.drive_queue import get_upload_queue
+
+    job = get_upload_queue().get_status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job no encontrado")
+    return job
+
+
+# =====================================================
+# REFINAMIENTOS (CORRIDAS DEGRADADAS)
+# =====================================================
+@app.get("/refinements/{refinement_id}")
+def refinement_status(refinement_id: str):
+    ref = REFINEMENTS.get(refinement_id)
+    if ref is None:
+        raise HTTPException(status_code=404, detail="refinamiento no encontrado")
+    return Response(content=dumps_json(ref), media_type="application/json")
+
+
+# =====================================================
+# HISTORIAL DE CORRIDAS
+# =====================================================
+@app.get("/history")
+def history(
+    folio: str | None = None,
+    region: str | None = None,
+    cvegeo: str | None = None,
+    geohash: str | None = None,
+    since: str | None = None,
+    until: str | None = None,
+    include_payload: bool = True,
+    limit: int = 1000,
+    offset: int = 0
+):
+    from expansion.run_history import get_history_store
+
+    rows = get_history_store().query(
+        folio=folio,
+        region=region,
+        cvegeo=cvegeo,
+        geohash_prefix=geohash,
+        since=since,
+        until=until,
+        include_payload=include_payload,
+        limit=min(limit, 10_000),
+        offset=offset
+    )
+    return Response(
+        content=dumps_json({"n": len(rows), "rows": rows}),
+        media_type="application/json"
+    )
+
+
 # =====================================================
 # ENDPOINT PRINCIPAL
 # =====================================================
 @app.post("/run-expansion")
 def run_expansion(payload: ExpansionRequest):
 
+    if not READY.is_set():
+        raise HTTPException(
+            status_code=503,
+            detail="Datos de referencia cargando; reintentar"
+        )
+
+    from expansion.geo import get_nearest_neto_store
+    from expansion.google_places import fetch_places_nearby
+    from expansion.run_history import get_history_store
+    from expansion.deadline import Deadline, StageRunner
+
     # ---------------------------
     # INPUT
     # ---------------------------
@@ -133,25 +302,188 @@ def run_expansion(payload: ExpansionRequest):
     lon = input_data["longitud"]
     folio = input_data["id_ubicacion"]
 
+    if input_data.get("reporte_completo"):
+        return _run_full_report(input_data)
+
+    # Deadline del request, propagado a cada etapa
+    runner = StageRunner(Deadline(input_data.get("max_latency_ms")))
+    run_id = uuid.uuid4().hex
+
     # ---------------------------
-    # NETO MÁS CERCANA
+    # MODO MOVIMIENTO (CORRIDA PREVIA DEL FOLIO)
+    # ---------------------------
+    prev_payload = None
+    if input_data.get("modo_movimiento"):
+        prev_payload = LAST_PAYLOAD_BY_FOLIO.get(folio)
+        if prev_payload is None:
+            prev = get_history_store().query(folio=folio, limit=1)
+            if prev:
+                prev_payload = prev[0].get("payload_flat")
+
+    if prev_payload:
+        from expansion.site_move import rerun_moved_site
+
+        runner.submit(
+            "movimiento",
+            rerun_moved_site,
+            folio=folio,
+            lat=lat,
+            lon=lon,
+            prev_payload=prev_payload,
+            df_stores=DF_NETO,
+            municipio_locator=MUNICIPIO_LOCATOR,
+            inegi_src_path=INEGI_SHP_PATH,
+            df_inegi_tabular=DF_INEGI_TABULAR
+        )
+        moved = runner.get(
+            "movimiento",
+            fallback=lambda: (_moved_fallback(lat, lon, folio, prev_payload), "ultimo_conocido")
+        )
+
+        def _refine_moved(results):
+            done = results["movimiento"]
+            if isinstance(done, Exception):
+                REFINEMENTS[run_id] = {"status": "error", "error": repr(done)}
+                return
+            _refine(run_id, input_data, done["nearest_store"], done["inegi_data"],
+                    done["places_count"], done["csv_path"], done["stats"])
+
+        return _finish_run(
+            input_data=input_data,
+            nearest_store=moved["nearest_store"],
+            inegi_data=moved["inegi_data"],
+            places_count=moved["places_count"],
+            csv_path=moved["csv_path"],
+            move_stats=moved["stats"],
+            runner=runner,
+            run_id=run_id,
+            refine=_refine_moved
+        )
+
     # ---------------------------
-    nearest_store = get_nearest_neto_store(
+    # ETAPAS INDEPENDIENTES EN PARALELO
+    # ---------------------------
+    runner.submit("tienda_cercana", get_nearest_neto_store, lat=lat, lon=lon, df_stores=DF_NETO)
+    runner.submit("inegi", _inegi_stage, lat, lon)
+    runner.submit(
+        "google_places",
+        fetch_places_nearby,
+        folio=folio,
         lat=lat,
         lon=lon,
-        df_stores=DF_NETO
+        radius_m=500
+    )
+
+    # ---------------------------
+    # NETO MÁS CERCANA
+    # ---------------------------
+    nearest_store = runner.get("tienda_cercana", fallback=lambda: ({}, "sin_datos"))
+
+    # ---------------------------
+    # INEGI (GEO + TABULAR, PREFIJO INEGI_)
+    # ---------------------------
+    inegi_data = runner.get("inegi", fallback=lambda: _inegi_fallback(lat, lon))
+
+    # ---------------------------
+    # GOOGLE PLACES (GUARDA CSV)
+    # ---------------------------
+    df_places, places_count, csv_path = runner.get(
+        "google_places",
+        fallback=lambda: _places_fallback(lat, lon, folio)
+    )
+
+    def _refine_full(results):
+        if any(isinstance(v, Exception) for v in results.values()):
+            REFINEMENTS[run_id] = {
+                "status": "error",
+                "error": {k: repr(v) for k, v in results.items() if isinstance(v, Exception)}
+            }
+            return
+        _, refined_count, refined_csv = results["google_places"]
+        _refine(run_id, input_data, results["tienda_cercana"], results["inegi"],
+                refined_count, refined_csv, None)
+
+    return _finish_run(
+        input_data=input_data,
+        nearest_store=nearest_store,
+        inegi_data=inegi_data,
+        places_count=places_count,
+        csv_path=csv_path,
+        move_stats=None,
+        runner=runner,
+        run_id=run_id,
+        refine=_refine_full
+    )
+
+
+# =====================================================
+# PIPELINE COMPLETO (DAG MEMOIZADO)
+# =====================================================
+def _run_full_report(input_data: dict):
+    """
+    Corre el DAG completo: las etapas cuyo hash de entradas y código
+    no cambió salen de cache; el deadline (max_latency_ms) aplica a
+    las etapas con respaldo (INEGI, Places, LLM).
+    """
+    from expansion.expansion_dag import run_site
+    from expansion.run_history import get_history_store
+
+    folio = input_data["id_ubicacion"]
+    params = {
+        "lat": input_data["latitud"],
+        "lon": input_data["longitud"],
+        "folio": folio,
+        "radius_m": 500,
+        "drive_folder_id": (
+            input_data.get("id_carpeta_drive")
+            or os.environ.get("GOOGLE_PLACES_DRIVE_FOLDER_ID")
+        ),
+    }
+
+    result = run_site(
+        EXPANSION_DAG,
+        params=params,
+        ctx=_dag_context(),
+        ctx_versions=DAG_CTX_VERSIONS,
+        max_latency_ms=input_data.get("max_latency_ms")
     )
+    out = result["outputs"]
+
+    payload_flat = dict(out["payload"])
+    payload_flat.update({
+        "degradado": bool(result["degradado"]),
+        "etapas_degradadas": result["degradado"],
+    })
+    get_history_store().append(payload_flat=payload_flat, folio=folio, decision=out["llm"])
+
+    drive_job = out["drive"]
+    return Response(
+        content=dumps_json({
+            "status": "pipeline_degradado" if result["degradado"] else "pipeline_ok",
+            "payload_flat": payload_flat,
+            "evaluacion": out["llm"],
+            "google_places_csv_local": out["places"]["csv_path"],
+            "mapa_local": out["mapa"],
+            "reporte_pdf_local": out["pdf"],
+            "drive": {"job_id": drive_job, "status_url": f"/jobs/{drive_job}"} if drive_job else None,
+            "etapas": result["report"]
+        }),
+        media_type="application/json"
+    )
+
+
+# =====================================================
+# ETAPAS + RESPALDOS
+# =====================================================
+def _inegi_stage(lat: float, lon: float) -> dict:
+    from expansion.inegi import lookup_municipio, prefix_inegi_keys
 
     # ---------------------------
     # INEGI GEO
     # ---------------------------
-    inegi_geo_raw = {}
-    if GDF_INEGI is not None:
-        inegi_geo_raw = find_municipio_inegi(
-            lat=lat,
-            lon=lon,
-            gdf_inegi=GDF_INEGI
-        )
+    inegi_geo_raw = lookup_municipio(
+        lat, lon, locator=MUNICIPIO_LOCATOR, src_path=INEGI_SHP_PATH
+    )
 
     # ---------------------------
     # INEGI TABULAR (POR CVEGEO)
@@ -169,23 +501,90 @@ def run_expansion(payload: ExpansionRequest):
     # ---------------------------
     # MERGE + PREFIJO INEGI_
     # ---------------------------
-    inegi_data = prefix_inegi_keys({
+    return prefix_inegi_keys({
         **inegi_geo_raw,
         **inegi_tab_raw
     })
 
-    # ---------------------------
-    # GOOGLE PLACES (GUARDA CSV)
-    # ---------------------------
-    df_places, places_count, csv_path = fetch_places_nearby(
-        folio=folio,
-        lat=lat,
-        lon=lon,
-        radius_m=500
-    )
+
+def _inegi_fallback(lat: float, lon: float):
+    """
+    Datos INEGI de la corrida más reciente en la misma celda
+    geohash (casi siempre el mismo municipio).
+    """
+    from expansion.run_history import get_history_store
+
+    for p in get_history_store().nearby_payloads(lat=lat, lon=lon, limit=1):
+        return {k: v for k, v in p.items() if k.startswith("INEGI_")}, "historial_cercano"
+    return {}, "sin_datos"
+
+
+def _places_fallback(lat: float, lon: float, folio: str):
+    """
+    Últimos conteos conocidos del folio; si no hay, conteos
+    gruesos de corridas cercanas.
+    """
+    from expansion.google_places import last_known_places_count, coarse_places_count
+    from expansion.run_history import get_history_store
+
+    conteo = last_known_places_count(folio=folio, lat=lat, lon=lon)
+    if conteo is not None:
+        return (None, conteo, None), "cache_folio"
+
+    conteo = coarse_places_count(get_history_store().nearby_payloads(lat=lat, lon=lon))
+    if conteo is not None:
+        return (None, conteo, None), "historial_cercano"
+    return (None, {}, None), "sin_datos"
+
+
+def _moved_fallback(lat: float, lon: float, folio: str, prev_payload: dict) -> dict:
+    """
+    Pin movido sin tiempo para re-evaluar: tienda cercana (en
+    memoria, inmediata) + INEGI y Places de la corrida previa.
+    """
+    from expansion.geo import get_nearest_neto_store
+    from expansion.google_places import POI_TYPES, last_known_places_count
+
+    places_count = last_known_places_count(folio=folio, lat=lat, lon=lon)
+    if places_count is None:
+        places_count = {
+            k: prev_payload[k] for k in POI_TYPES + ["total_lugares"] if k in prev_payload
+        }
+
+    return {
+        "nearest_store": get_nearest_neto_store(lat=lat, lon=lon, df_stores=DF_NETO),
+        "inegi_data": {k: v for k, v in prev_payload.items() if k.startswith("INEGI_")},
+        "places_count": places_count,
+        "csv_path": None,
+        "stats": None,
+    }
+
+
+# =====================================================
+# ARMADO FINAL
+# =====================================================
+def _assemble(
+    *,
+    input_data: dict,
+    nearest_store: dict,
+    inegi_data: dict,
+    places_count: dict,
+    csv_path: str | None,
+    flags: dict | None = None
+):
+    """
+    Drive + payload + historial (común a corrida completa,
+    modo movimiento y refinamiento).
+    """
+    from expansion.drive_queue import get_upload_queue
+    from expansion.run_history import get_history_store
+
+    lat = input_data["latitud"]
+    lon = input_data["longitud"]
+    folio = input_data["id_ubicacion"]
 
     # ---------------------------
-    # SUBIR CSV A GOOGLE DRIVE
+    # SUBIR CSV A GOOGLE DRIVE (EN SEGUNDO PLANO)
     # ---------------------------
     drive_folder_id = (
         input_data.get("id_carpeta_drive")
@@ -194,17 +593,22 @@ def run_expansion(payload: ExpansionRequest):
 
     drive_info = None
 
-    if drive_folder_id:
-        drive_info = upload_file_to_drive(
+    if drive_folder_id and csv_path:
+        job_id = get_upload_queue().enqueue(
             local_path=csv_path,
             drive_folder_id=drive_folder_id,
             filename=f"google_places_{folio}.csv"
         )
+        drive_info = {
+            "job_id": job_id,
+            "status_url": f"/jobs/{job_id}"
+        }
 
     # ---------------------------
     # PAYLOAD FINAL BASE
     # ---------------------------
-    payload_flat = build_payload_flat(
+    # NaN / inf -> None ya se resuelve al construir el registro
+    payload_record = build_payload_record(
         lat=lat,
         lon=lon,
         neto_data=nearest_store,
@@ -213,12 +617,84 @@ def run_expansion(payload: ExpansionRequest):
         competencia_data={}
     )
 
-    payload_flat = sanitize_for_json(payload_flat)
+    payload_flat = payload_record.to_dict()
+    payload_flat.update(flags or {"degradado": False, "etapas_degradadas": {}})
 
-    return {
-        "status": "base_pipeline_ok",
+    # ---------------------------
+    # HISTORIAL (ESCRITURA EN LOTE, NO BLOQUEA)
+    # ---------------------------
+    get_history_store().append(payload_flat=payload_flat, folio=folio)
+    if not payload_flat["degradado"] or folio not in LAST_PAYLOAD_BY_FOLIO:
+        LAST_PAYLOAD_BY_FOLIO[folio] = payload_flat
+
+    return payload_flat, drive_info
+
+
+def _refine(run_id, input_data, nearest_store, inegi_data, places_count, csv_path, move_stats):
+    """
+    Corre al terminar TODAS las etapas de una corrida degradada:
+    guarda la versión completa (historial + /refinements/{run_id}).
+    """
+    payload_flat, drive_info = _assemble(
+        input_data=input_data,
+        nearest_store=nearest_store,
+        inegi_data=inegi_data,
+        places_count=places_count,
+        csv_path=csv_path
+    )
+    REFINEMENTS[run_id] = {
+        "status": "listo",
+        "folio": input_data["id_ubicacion"],
         "payload_flat": payload_flat,
         "google_places_csv_local": csv_path,
-        "google_places_drive": drive_info
+        "google_places_drive": drive_info,
+        "modo_movimiento": move_stats
     }
 
+
+def _finish_run(
+    *,
+    input_data: dict,
+    nearest_store: dict,
+    inegi_data: dict,
+    places_count: dict,
+    csv_path: str | None,
+    move_stats: dict | None,
+    runner,
+    run_id: str,
+    refine
+):
+    payload_flat, drive_info = _assemble(
+        input_data=input_data,
+        nearest_store=nearest_store,
+        inegi_data=inegi_data,
+        places_count=places_count,
+        csv_path=csv_path,
+        flags=runner.flags()
+    )
+
+    # ---------------------------
+    # REFINAMIENTO ASÍNCRONO (SOLO SI HUBO DEGRADACIÓN)
+    # ---------------------------
+    refinement = None
+    if runner.is_degraded:
+        REFINEMENTS[run_id] = {"status": "en_proceso", "folio": input_data["id_ubicacion"]}
+        runner.on_complete(refine)
+        refinement = {
+            "id": run_id,
+            "status_url": f"/refinements/{run_id}"
+        }
+
+    # Serialización en un paso (orjson), sin el encoder por defecto
+    return Response(
+        content=dumps_json({
+            "status": "base_pipeline_degradado" if runner.is_degraded else "base_pipeline_ok",
+            "payload_flat": payload_flat,
+            "google_places_csv_local": csv_path,
+            "google_places_drive": drive_info,
+            "modo_movimiento": move_stats,
+            "tiempos_etapas_ms": runner.timings_ms,
+            "refinamiento": refinement
+        }),
+        media_type="application/json"
+    )
@@ -1,46 +1,161 @@
+import asyncio
+import hashlib
 import json
-from typing import Dict, Any
-from openai import OpenAI
+import logging
 import os
-from expansion.prompt_builder import build_expansion_prompt_semaforo_v12
+import threading
+import time
+import weakref
+from typing import Dict, Any
+
+from expansion.prompt_builder import build_expansion_prompt_compact_with_stats
+
+logger = logging.getLogger(__name__)
 
 
 # --------------------------------------------------
-# Cliente OpenAI
+# Configuración del modelo
 # --------------------------------------------------
-GOOGLE_MAPS_API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4.1")
+OPENAI_TEMPERATURE = 0.2
 
-if not GOOGLE_MAPS_API_KEY:
-    raise RuntimeError("GOOGLE_MAPS_API_KEY not set")
+# TTL del cache de resultados (segundos)
+AGENT_CACHE_TTL_S = int(os.getenv("AGENT_CACHE_TTL_S", str(7 * 24 * 3600)))
+AGENT_CACHE_MAX_ENTRIES = 5000
+
+SYSTEM_PROMPT = (
+    "Eres un analista senior de expansión retail hard-discount. "
+    "Debes responder exclusivamente con JSON válido, sin texto adicional."
+)
 
 
 # --------------------------------------------------
-# Función interna segura para ejecutar el agente
+# Cliente OpenAI (lazy, uno por event loop)
 # --------------------------------------------------
-def _run_agent(prompt: str) -> Dict[str, Any]:
-    response = client.chat.completions.create(
-        model="gpt-4.1",
-        temperature=0.2,
-        messages=[
-            {
-                "role": "system",
-                "content": (
-                    "Eres un analista senior de expansión retail hard-discount. "
-                    "Debes responder exclusivamente con JSON válido, sin texto adicional."
-                )
-            },
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ]
-    )
+# El cliente async queda ligado al loop donde se usa por primera vez;
+# OPENAI_API_KEY / OPENAI_BASE_URL se leen del entorno al crearlo
+# (OPENAI_BASE_URL permite apuntar a un stub compatible local).
+_CLIENTS = weakref.WeakKeyDictionary()
+
+
+def get_async_client():
+    """
+    Cliente del loop actual. Las llamadas síncronas usan SIEMPRE el
+    loop de fondo (ver _background_loop): un solo cliente y un solo
+    pool de conexiones por proceso.
+    """
+    from openai import AsyncOpenAI
+
+    loop = asyncio.get_running_loop()
+    client = _CLIENTS.get(loop)
+    if client is None:
+        client = AsyncOpenAI()
+        _CLIENTS[loop] = client
+    return client
+
+
+# --------------------------------------------------
+# Loop de fondo (llamadas síncronas)
+# --------------------------------------------------
+# asyncio.run por llamada crearía un loop, un cliente y un pool de
+# conexiones nuevos cada vez (y falla dentro de un loop activo).
+_BG_LOOP = None
+_BG_LOCK = threading.Lock()
+
 
-    raw = response.choices[0].message.content.strip()
+def _background_loop() -> asyncio.AbstractEventLoop:
+    global _BG_LOOP
+    with _BG_LOCK:
+        if _BG_LOOP is None or _BG_LOOP.is_closed():
+            loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=loop.run_forever,
+                name="agent-evaluator-loop",
+                daemon=True
+            ).start()
+            _BG_LOOP = loop
+        return _BG_LOOP
+
+
+def _run_sync(coro):
+    """
+    Ejecuta una corrutina en el loop de fondo y espera el resultado.
+    Funciona también desde un hilo con un loop activo.
+    """
+    return asyncio.run_coroutine_threadsafe(coro, _background_loop()).result()
+
+
+def reset_agent_client():
+    """
+    Cierra y descarta el cliente del loop de fondo (p.ej. tras
+    cambiar OPENAI_BASE_URL).
+    """
+    with _BG_LOCK:
+        loop = _BG_LOOP
+    if loop is None:
+        return
+
+    async def _close():
+        client = _CLIENTS.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.close()
+
+    asyncio.run_coroutine_threadsafe(_close(), loop).result()
+
+
+# --------------------------------------------------
+# Cache de resultados por hash de prompt
+# --------------------------------------------------
+_CACHE: Dict[str, tuple] = {}
+_CACHE_LOCK = threading.Lock()
+CACHE_STATS = {"hits": 0, "misses": 0}
+
+
+def _cache_key(prompt: str, model: str, temperature: float, slot: int) -> str:
+    h = hashlib.sha256()
+    for part in (prompt, model, repr(temperature), str(slot)):
+        h.update(part.encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+def _cache_get(key: str):
+    with _CACHE_LOCK:
+        hit = _CACHE.get(key)
+        if hit and hit[0] > time.monotonic():
+            CACHE_STATS["hits"] += 1
+            return dict(hit[1])
+        if hit:
+            del _CACHE[key]
+        CACHE_STATS["misses"] += 1
+        return None
+
+
+def _cache_put(key: str, value: Dict[str, Any]):
+    with _CACHE_LOCK:
+        if len(_CACHE) >= AGENT_CACHE_MAX_ENTRIES:
+            # Expulsa la entrada que vence primero
+            oldest = min(_CACHE, key=lambda k: _CACHE[k][0])
+            del _CACHE[oldest]
+        _CACHE[key] = (time.monotonic() + AGENT_CACHE_TTL_S, dict(value))
+
+
+def clear_agent_cache():
+    with _CACHE_LOCK:
+        _CACHE.clear()
+
+
+# --------------------------------------------------
+# Parseo / validación de la respuesta
+# --------------------------------------------------
+def _parse_agent_output(raw: str) -> Dict[str, Any]:
+    raw = raw.strip()
 
     # Limpieza defensiva
     if raw.startswith("```"):
         raw = raw.strip("```").strip()
+        if raw.startswith("json"):
+            raw = raw[4:].strip()
 
     output = json.loads(raw)
 
@@ -49,16 +164,58 @@ def _run_agent(prompt: str) -> Dict[str, Any]:
     output["explicacion"] = output["explicacion"].strip()
 
     # Validaciones mínimas
-    assert output["decision"] in ["DESCARTAR", "EVALUAR", "AVANZAR"]
-    assert isinstance(output["explicacion"], str)
+    if output["decision"] not in ["DESCARTAR", "EVALUAR", "AVANZAR"]:
+        raise ValueError(f"Decisión inválida del agente: {output['decision']}")
+    if not isinstance(output["explicacion"], str):
+        raise ValueError("Explicación inválida del agente")
+
+    return output
+
+
+# --------------------------------------------------
+# Función interna segura para ejecutar el agente
+# --------------------------------------------------
+async def _run_agent(
+    prompt: str,
+    *,
+    slot: int = 1,
+    model: str = OPENAI_MODEL,
+    temperature: float = OPENAI_TEMPERATURE
+) -> Dict[str, Any]:
+    """
+    Ejecuta el agente con cache por hash(prompt, modelo, temperatura, slot).
+    El slot separa las evaluaciones independientes del mismo prompt.
+    """
+    key = _cache_key(prompt, model, temperature, slot)
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached
+
+    response = await get_async_client().chat.completions.create(
+        model=model,
+        temperature=temperature,
+        messages=[
+            {
+                "role": "system",
+                "content": SYSTEM_PROMPT
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+    )
 
+    output = _parse_agent_output(response.choices[0].message.content)
+
+    _cache_put(key, output)
     return output
 
 
 # --------------------------------------------------
 # FUNCIÓN PÚBLICA: DOS EVALUACIONES
 # --------------------------------------------------
-def evaluate_site_dual(
+async def evaluate_site_dual_async(
     *,
     payload: dict,
     region_vector: dict,
@@ -66,35 +223,33 @@ def evaluate_site_dual(
     tabla_maduras: dict
 ) -> Dict[str, Any]:
     """
-    Ejecuta dos evaluaciones independientes del agente.
-    Retorna salida plana y legacy-compatible.
+    Ejecuta dos evaluaciones independientes del agente EN PARALELO
+    sobre el mismo prompt (se construye una sola vez).
+    Retorna salida plana y legacy-compatible + "prompt_stats"
+    (tokens estáticos / dinámicos / total contra el presupuesto).
     """
-
-    # -------------------------------
-    # Evaluación 1 – estándar
-    # -------------------------------
-    prompt_1 = build_expansion_prompt_semaforo_v12(
+    prompt, prompt_stats = build_expansion_prompt_compact_with_stats(
         payload=payload,
         region_vector=region_vector,
         tabla_global=tabla_global,
         tabla_maduras=tabla_maduras
     )
 
-    eval_1 = _run_agent(prompt_1)
+    if prompt_stats["over_budget"]:
+        logger.warning("prompt sobre presupuesto (region=%s): %s", payload.get("region"), prompt_stats)
+    else:
+        logger.debug("prompt (region=%s): %s", payload.get("region"), prompt_stats)
 
     # -------------------------------
+    # Evaluación 1 – estándar
     # Evaluación 2 – contraste
     # (misma data, razonamiento independiente)
     # -------------------------------
-    prompt_2 = build_expansion_prompt_semaforo_v12(
-        payload=payload,
-        region_vector=region_vector,
-        tabla_global=tabla_global,
-        tabla_maduras=tabla_maduras
+    eval_1, eval_2 = await asyncio.gather(
+        _run_agent(prompt, slot=1),
+        _run_agent(prompt, slot=2),
     )
 
-    eval_2 = _run_agent(prompt_2)
-
     # -------------------------------
     # Salida final
     # -------------------------------
@@ -103,5 +258,27 @@ def evaluate_site_dual(
         "explicacion_1": eval_1["explicacion"],
 
         "decision_modelo_2": eval_2["decision"],
-        "explicacion_2": eval_2["explicacion"]
+        "explicacion_2": eval_2["explicacion"],
+
+        "prompt_stats": prompt_stats
     }
+
+
+def evaluate_site_dual(
+    *,
+    payload: dict,
+    region_vector: dict,
+    tabla_global: dict,
+    tabla_maduras: dict
+) -> Dict[str, Any]:
+    """
+    Versión síncrona (para endpoints `def` / scripts): corre en el
+    loop de fondo, reutilizando cliente y conexiones entre llamadas.
+    Desde código async usar evaluate_site_dual_async.
+    """
+    return _run_sync(evaluate_site_dual_async(
+        payload=payload,
+        region_vector=region_vector,
+        tabla_global=tabla_global,
+        tabla_maduras=tabla_maduras
+    ))
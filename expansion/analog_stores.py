@@ -0,0 +1,291 @@
+# expansion/analog_stores.py
+
+import os
+from typing import Dict, Any, List
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from expansion.competition import normalize_chain
+from expansion.region_vectors import (
+    DEFAULT_REGION_VECTORS_PATH,
+    feature_to_float,
+    get_region_registry,
+)
+
+
+# =====================================================
+# CONFIG
+# =====================================================
+DEFAULT_FEATURE_STORE_PATH = "data/store_features.npz"
+DEFAULT_COMPETENCIA_RADIO_M = 500
+
+# Columna de feature_cols -> patrón en CADENA normalizada
+COMPETENCIA_FEATURES = {
+    "TIENDAS_3B": "3B",
+    "Zorro": "ZORRO",
+    "Neto_limpio": "NETO",
+}
+
+STORE_OUTPUT_COLUMNS = [
+    "STORE_ID",
+    "FCTIENDA",
+    "FCREGION",
+    "FCESTADO",
+    "Venta Sin Impuestos",
+    "Ticket Promedio",
+]
+
+EARTH_KM_PER_DEG = 111.32
+
+
+# =====================================================
+# UTILIDADES
+# =====================================================
+def _to_local_km(lat, lon, lat0: float) -> np.ndarray:
+    """
+    Proyección equirectangular a km (suficiente para radios < 50 km).
+    """
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    return np.column_stack([
+        lon * EARTH_KM_PER_DEG * np.cos(np.radians(lat0)),
+        lat * EARTH_KM_PER_DEG,
+    ])
+
+
+def _parse_coord(s: pd.Series) -> pd.Series:
+    return pd.to_numeric(
+        s.astype(str).str.replace("°", "", regex=False).str.strip(),
+        errors="coerce"
+    )
+
+
+def _competition_counts(
+    df_neto: pd.DataFrame,
+    df_generales: pd.DataFrame,
+    radio_m: int
+) -> pd.DataFrame:
+    """
+    Conteo de tiendas por cadena en un radio alrededor de cada NETO.
+    Un KD-tree por cadena; sin matriz densa tiendas × competidores.
+    """
+    lat0 = float(df_neto["FCLATITUD"].mean())
+    neto_xy = _to_local_km(df_neto["FCLATITUD"], df_neto["FCLONGITUD"], lat0)
+
+    gen = df_generales.copy()
+    gen["lat"] = _parse_coord(gen["LAT"])
+    gen["lon"] = _parse_coord(gen["LONG"])
+    gen["CADENA_NORM"] = gen["CADENA"].apply(normalize_chain)
+    gen = gen.dropna(subset=["lat", "lon"])
+
+    out = pd.DataFrame(index=df_neto.index)
+    radio_km = radio_m / 1000.0
+
+    for col, pattern in COMPETENCIA_FEATURES.items():
+        sub = gen[gen["CADENA_NORM"].str.contains(pattern, regex=False)]
+        if sub.empty:
+            out[col] = 0
+            continue
+
+        tree = cKDTree(_to_local_km(sub["lat"], sub["lon"], lat0))
+        counts = tree.query_ball_point(neto_xy, r=radio_km, return_length=True)
+
+        if col == "Neto_limpio":
+            # La propia tienda aparece en la base general
+            counts = np.maximum(counts - 1, 0)
+
+        out[col] = counts
+
+    return out
+
+
+def _inegi_by_store(
+    df_neto: pd.DataFrame,
+    gdf_inegi,
+    df_inegi_tabular: pd.DataFrame
+) -> pd.DataFrame:
+    """
+    Variables INEGI_* del municipio de cada tienda (un solo sjoin).
+    """
+    import geopandas as gpd
+
+    pts = gpd.GeoDataFrame(
+        index=df_neto.index,
+        geometry=gpd.points_from_xy(df_neto["FCLONGITUD"], df_neto["FCLATITUD"]),
+        crs="EPSG:4326"
+    )
+
+    hit = gpd.sjoin(pts, gdf_inegi[["CVEGEO", "geometry"]], how="left", predicate="within")
+    hit = hit[~hit.index.duplicated(keep="first")]
+
+    tab = df_inegi_tabular.drop_duplicates("CVEGEO").set_index("CVEGEO")
+    tab = tab.apply(pd.to_numeric, errors="coerce")
+    tab.columns = [f"INEGI_{c}" for c in tab.columns]
+
+    return tab.reindex(hit["CVEGEO"].astype(str).values).set_axis(df_neto.index)
+
+
+# =====================================================
+# FEATURE STORE
+# =====================================================
+def build_store_feature_frame(
+    *,
+    df_neto: pd.DataFrame,
+    df_places_counts: pd.DataFrame | None = None,
+    gdf_inegi=None,
+    df_inegi_tabular: pd.DataFrame | None = None,
+    df_generales: pd.DataFrame | None = None,
+    json_path: str = DEFAULT_REGION_VECTORS_PATH,
+    competencia_radio_m: int = DEFAULT_COMPETENCIA_RADIO_M
+) -> pd.DataFrame:
+    """
+    Vector de features por tienda NETO en el MISMO espacio que
+    feature_cols de los vectores regionales.
+
+    - df_places_counts: conteos de Places por tienda (índice o columna
+      STORE_ID, columnas = tipos POI / total_lugares)
+    - gdf_inegi + df_inegi_tabular: variables INEGI_* por municipio
+    - df_generales: base general de autoservicios (competencia)
+
+    Columnas sin datos para ninguna tienda se eliminan.
+    """
+    feature_cols = get_region_registry(json_path).stacked()["feature_cols"]
+
+    df = df_neto.reset_index(drop=True)
+    parts = []
+
+    if df_places_counts is not None:
+        pc = df_places_counts
+        if "STORE_ID" in pc.columns:
+            pc = pc.set_index("STORE_ID")
+        parts.append(pc.reindex(df["STORE_ID"].values).set_axis(df.index))
+
+    if gdf_inegi is not None and df_inegi_tabular is not None:
+        parts.append(_inegi_by_store(df, gdf_inegi, df_inegi_tabular))
+
+    if df_generales is not None:
+        parts.append(_competition_counts(df, df_generales, competencia_radio_m))
+
+    feats = pd.concat(parts, axis=1) if parts else pd.DataFrame(index=df.index)
+    feats = feats.loc[:, ~feats.columns.duplicated()]
+
+    cols = [c for c in feature_cols if c in feats.columns]
+    feats = feats[cols].apply(pd.to_numeric, errors="coerce")
+    feats = feats.dropna(axis=1, how="all")
+
+    feats.insert(0, "STORE_ID", df["STORE_ID"].values)
+    return feats
+
+
+# =====================================================
+# ÍNDICE DE TIENDAS ANÁLOGAS
+# =====================================================
+class AnalogStoreIndex:
+    """
+    KD-tree sobre vectores de tiendas escalados (robust scaling:
+    mediana / IQR de la red). NaN se imputa con la mediana (= 0 escalado).
+    """
+
+    def __init__(
+        self,
+        *,
+        store_ids: np.ndarray,
+        feature_cols: List[str],
+        X: np.ndarray,
+        center: np.ndarray,
+        scale: np.ndarray,
+        stores: pd.DataFrame
+    ):
+        self.store_ids = np.asarray(store_ids)
+        self.feature_cols = list(feature_cols)
+        self.center = center
+        self.scale = scale
+        self.stores = stores.set_index("STORE_ID")
+
+        self._Z = self._scale(X)
+        self._tree = cKDTree(self._Z)
+
+    @classmethod
+    def from_feature_frame(cls, feats: pd.DataFrame, df_neto: pd.DataFrame) -> "AnalogStoreIndex":
+        cols = [c for c in feats.columns if c != "STORE_ID"]
+        X = feats[cols].to_numpy(dtype=float)
+
+        center = np.nanmedian(X, axis=0)
+        q75, q25 = np.nanpercentile(X, [75, 25], axis=0)
+        scale = q75 - q25
+        scale = np.where((scale == 0) | ~np.isfinite(scale), 1.0, scale)
+
+        return cls(
+            store_ids=feats["STORE_ID"].to_numpy(),
+            feature_cols=cols,
+            X=X,
+            center=center,
+            scale=scale,
+            stores=df_neto[STORE_OUTPUT_COLUMNS].drop_duplicates("STORE_ID")
+        )
+
+    def _scale(self, X: np.ndarray) -> np.ndarray:
+        Z = (np.asarray(X, dtype=float) - self.center) / self.scale
+        return np.where(np.isfinite(Z), Z, 0.0)
+
+    # -------------------------------------------------
+    # CONSULTA
+    # -------------------------------------------------
+    def query(self, payload: Dict[str, Any], k: int = 10) -> pd.DataFrame:
+        """
+        Las k tiendas NETO cuyo entorno más se parece al candidato,
+        con sus ventas y ticket promedio del master.
+        """
+        return self.query_many([payload], k=k)[0]
+
+    def query_many(self, payloads: List[Dict[str, Any]], k: int = 10) -> List[pd.DataFrame]:
+        X = np.array([
+            [feature_to_float(p.get(c)) for c in self.feature_cols]
+            for p in payloads
+        ], dtype=float).reshape(len(payloads), len(self.feature_cols))
+
+        k = min(k, len(self.store_ids))
+        dist, idx = self._tree.query(self._scale(X), k=k)
+        dist = np.atleast_2d(dist).reshape(len(payloads), k)
+        idx = np.atleast_2d(idx).reshape(len(payloads), k)
+
+        out = []
+        for d_row, i_row in zip(dist, idx):
+            ids = self.store_ids[i_row]
+            df = self.stores.reindex(ids).reset_index()
+            df.insert(1, "distancia_similitud", np.round(d_row, 4))
+            out.append(df)
+        return out
+
+    # -------------------------------------------------
+    # PERSISTENCIA
+    # -------------------------------------------------
+    def save(self, path: str = DEFAULT_FEATURE_STORE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.tmp.npz"
+        np.savez(
+            tmp,
+            store_ids=self.store_ids,
+            feature_cols=np.array(self.feature_cols, dtype=object),
+            X=self._Z * self.scale + self.center,
+            center=self.center,
+            scale=self.scale,
+            stores=self.stores.reset_index().to_numpy(dtype=object),
+            stores_cols=np.array(STORE_OUTPUT_COLUMNS, dtype=object),
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_FEATURE_STORE_PATH) -> "AnalogStoreIndex":
+        with np.load(path, allow_pickle=True) as z:
+            stores = pd.DataFrame(z["stores"], columns=list(z["stores_cols"]))
+            return cls(
+                store_ids=z["store_ids"],
+                feature_cols=list(z["feature_cols"]),
+                X=z["X"],
+                center=z["center"],
+                scale=z["scale"],
+                stores=stores
+            )
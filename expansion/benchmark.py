@@ -1,4 +1,7 @@
 # expansion/benchmark.py
+import threading
+from collections import OrderedDict
+
 import numpy as np
 import pandas as pd
 
@@ -45,3 +48,122 @@ def build_region_benchmark_table(
         })
 
     return pd.DataFrame(rows)
+
+
+# =====================================================
+# VERSIÓN BATCH (PORTAFOLIO)
+# =====================================================
+_REGION_BENCH_CACHE: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+_REGION_BENCH_CACHE_MAX = 1024
+# Lo usan a la vez los hilos de etapas y del DAG
+_REGION_BENCH_LOCK = threading.Lock()
+
+
+def _region_bench_array(registry, region: str, vector_keys: tuple) -> np.ndarray:
+    """
+    Valores de benchmark de una región alineados a vector_keys.
+    Cacheado (LRU) por (región, llaves, versión del archivo de vectores).
+    Región desconocida / faltante ("") -> fila NaN: un sitio malo
+    no tumba el lote.
+    """
+    cache_key = (registry.json_path, registry.version, region, vector_keys)
+
+    with _REGION_BENCH_LOCK:
+        arr = _REGION_BENCH_CACHE.get(cache_key)
+        if arr is not None:
+            _REGION_BENCH_CACHE.move_to_end(cache_key)
+            return arr
+
+    try:
+        entry = registry.get(region)
+    except KeyError:
+        arr = np.full(len(vector_keys), np.nan)
+    else:
+        idx = entry["col_index"]
+        arr = np.array([
+            entry["profile"][idx[k]] if k in idx else np.nan
+            for k in vector_keys
+        ], dtype=float)
+
+    with _REGION_BENCH_LOCK:
+        _REGION_BENCH_CACHE[cache_key] = arr
+        while len(_REGION_BENCH_CACHE) > _REGION_BENCH_CACHE_MAX:
+            _REGION_BENCH_CACHE.popitem(last=False)
+    return arr
+
+
+def build_region_benchmark_matrix(
+    *,
+    payloads,
+    variables_map: dict,
+    region_col: str = "region",
+    id_col: str = "id_ubicacion",
+    json_path: str | None = None,
+    return_components: bool = False
+):
+    """
+    Variante vectorizada de build_region_benchmark_table para
+    muchos sitios a la vez.
+
+    payloads: DataFrame (una fila por sitio) o lista de payloads planos.
+    Cada sitio se compara contra el perfil de equilibrio de SU región
+    (columna `region_col`).
+
+    Retorna DataFrame ancho (sitio × variable) con Δ vs benchmark (%).
+    Con return_components=True retorna dict con
+    "delta", "benchmark" y "sitio" (mismas dimensiones).
+    """
+    from expansion.region_vectors import DEFAULT_REGION_VECTORS_PATH, get_region_registry
+
+    registry = get_region_registry(json_path or DEFAULT_REGION_VECTORS_PATH)
+
+    df = payloads if isinstance(payloads, pd.DataFrame) else pd.DataFrame(list(payloads))
+
+    labels = list(variables_map.keys())
+    vector_keys = tuple(variables_map[l]["vector"] for l in labels)
+    payload_keys = [variables_map[l]["payload"] for l in labels]
+
+    # -----------------------------
+    # Sitio: (N, V)
+    # -----------------------------
+    site = np.column_stack([
+        df[k].map(_safe_number).to_numpy(dtype=float)
+        if k in df.columns else np.full(len(df), np.nan)
+        for k in payload_keys
+    ]) if labels else np.empty((len(df), 0))
+
+    # -----------------------------
+    # Benchmark: una fila por región única, luego gather
+    # -----------------------------
+    # None / NaN -> "" antes de np.unique (con pandas 3 astype(str)
+    # deja NaN como float y la comparación str/float truena)
+    region_values = (
+        df[region_col].fillna("").map(str).to_numpy(dtype=object)
+        if region_col in df.columns else np.full(len(df), "", dtype=object)
+    )
+    regions, inverse = np.unique(region_values, return_inverse=True)
+    region_rows = np.vstack([
+        _region_bench_array(registry, r, vector_keys) for r in regions
+    ]) if len(regions) else np.empty((0, len(labels)))
+    bench = region_rows[inverse]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        delta = np.where(
+            np.isfinite(bench) & (bench != 0),
+            (site - bench) / bench * 100,
+            np.nan
+        )
+
+    index = df[id_col] if id_col in df.columns else df.index
+
+    def _frame(arr):
+        return pd.DataFrame(np.round(arr), index=index, columns=labels)
+
+    if return_components:
+        return {
+            "delta": _frame(delta),
+            "benchmark": _frame(bench),
+            "sitio": _frame(site),
+        }
+
+    return _frame(delta)
@@ -0,0 +1,177 @@
+# expansion/benchmark_tables.py
+
+import os
+import threading
+from typing import Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+from expansion.region_vectors import normalize_region_name
+
+
+# =====================================================
+# CONFIG
+# =====================================================
+BENCHMARK_METRICS = [
+    "Venta Sin Impuestos",
+    "Ticket Promedio",
+    "Transacciones",
+]
+
+PERCENTILES = [0.25, 0.50, 0.75]
+
+# Si el master trae fecha de apertura, madura = >= N meses abierta.
+MATURITY_DATE_COL = "FECHA_APERTURA"
+MATURE_MIN_MONTHS = 24
+
+# Sin fecha de apertura: proxy = fuera del cuartil inferior de
+# transacciones de su región (excluye tiendas en ramp-up).
+MATURITY_PROXY_COL = "Transacciones"
+MATURITY_PROXY_QUANTILE = 0.25
+
+_CACHE_LOCK = threading.Lock()
+_MEMORY_CACHE = {}
+
+
+# =====================================================
+# MADUREZ
+# =====================================================
+def mature_store_mask(df: pd.DataFrame) -> pd.Series:
+    if MATURITY_DATE_COL in df.columns:
+        opened = pd.to_datetime(df[MATURITY_DATE_COL], errors="coerce")
+        cutoff = pd.Timestamp.today() - pd.DateOffset(months=MATURE_MIN_MONTHS)
+        return opened.notna() & (opened <= cutoff)
+
+    threshold = df.groupby("FCREGION")[MATURITY_PROXY_COL].transform(
+        lambda s: s.quantile(MATURITY_PROXY_QUANTILE)
+    )
+    return df[MATURITY_PROXY_COL] >= threshold
+
+
+# =====================================================
+# CONSTRUCCIÓN (UNA SOLA AGRUPACIÓN)
+# =====================================================
+def build_benchmark_tables(df_neto: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """
+    Agregados por región para tiendas globales y maduras en una
+    sola pasada agrupada sobre (universo, región).
+
+    Retorna {"global": DataFrame, "maduras": DataFrame}, ambos con
+    índice FCREGION y columnas "<métrica>|<estadístico>" + n_tiendas.
+    """
+    df = df_neto[["FCREGION"] + BENCHMARK_METRICS].copy()
+    if MATURITY_DATE_COL in df_neto.columns:
+        df[MATURITY_DATE_COL] = df_neto[MATURITY_DATE_COL]
+
+    mature = mature_store_mask(df)
+
+    stacked = pd.concat([
+        df.assign(universo="global"),
+        df[mature].assign(universo="maduras"),
+    ], ignore_index=True)
+
+    grouped = stacked.groupby(["universo", "FCREGION"])[BENCHMARK_METRICS]
+
+    stats = grouped.quantile(PERCENTILES).unstack(level=-1)
+    stats.columns = [f"{m}|p{int(q * 100)}" for m, q in stats.columns]
+
+    means = grouped.mean()
+    means.columns = [f"{m}|mean" for m in means.columns]
+
+    counts = stacked.groupby(["universo", "FCREGION"]).size().rename("n_tiendas")
+
+    table = pd.concat([counts, stats, means], axis=1)
+    table = table[["n_tiendas"] + sorted(c for c in table.columns if c != "n_tiendas")]
+
+    return {
+        universo: table.xs(universo, level="universo")
+        if universo in table.index.get_level_values("universo")
+        else table.iloc[0:0].droplevel("universo")
+        for universo in ("global", "maduras")
+    }
+
+
+# =====================================================
+# CACHE JUNTO AL SNAPSHOT DEL MASTER
+# =====================================================
+def _master_signature(excel_path: str) -> Tuple[int, int]:
+    st = os.stat(excel_path)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _cache_path(excel_path: str) -> str:
+    root, _ = os.path.splitext(excel_path)
+    return f"{root}.benchmarks.pkl"
+
+
+def get_benchmark_tables(
+    *,
+    excel_path: str = "data/MASTER_FINAL_TIENDAS.xlsx",
+    df_neto: pd.DataFrame | None = None
+) -> Dict[str, pd.DataFrame]:
+    """
+    Tablas materializadas. Se recalculan SOLO si cambia el master
+    (mtime / tamaño); si no, se leen de memoria o del pickle en disco.
+    """
+    signature = _master_signature(excel_path)
+
+    with _CACHE_LOCK:
+        cached = _MEMORY_CACHE.get(excel_path)
+        if cached and cached["signature"] == signature:
+            return cached["tables"]
+
+        path = _cache_path(excel_path)
+        if os.path.exists(path):
+            on_disk = pd.read_pickle(path)
+            if on_disk.get("signature") == signature:
+                _MEMORY_CACHE[excel_path] = on_disk
+                return on_disk["tables"]
+
+        if df_neto is None:
+            from expansion.geo import load_neto_master
+            df_neto = load_neto_master(excel_path=excel_path)
+
+        entry = {
+            "signature": signature,
+            "tables": build_benchmark_tables(df_neto),
+        }
+
+        tmp = f"{path}.tmp"
+        pd.to_pickle(entry, tmp)
+        os.replace(tmp, path)
+
+        _MEMORY_CACHE[excel_path] = entry
+        return entry["tables"]
+
+
+def region_benchmark_tables(
+    region: str,
+    *,
+    excel_path: str = "data/MASTER_FINAL_TIENDAS.xlsx",
+    df_neto: pd.DataFrame | None = None
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    (tabla_global, tabla_maduras) de una región en formato largo
+    (métrica × estadístico), lista para build_expansion_prompt_*.
+    """
+    tables = get_benchmark_tables(excel_path=excel_path, df_neto=df_neto)
+    region_norm = normalize_region_name(region)
+
+    def _pick(table: pd.DataFrame) -> pd.DataFrame:
+        match = [r for r in table.index if normalize_region_name(str(r)) == region_norm]
+        if not match:
+            return pd.DataFrame()
+
+        row = table.loc[match[0]]
+        n = row["n_tiendas"]
+        long = (
+            row.drop("n_tiendas")
+            .rename(lambda c: tuple(c.split("|")))
+        )
+        long.index = pd.MultiIndex.from_tuples(long.index, names=["metrica", "estadistico"])
+        out = long.unstack("estadistico").round(1)
+        out.insert(0, "n_tiendas", int(n) if np.isfinite(n) else 0)
+        return out.reset_index()
+
+    return _pick(tables["global"]), _pick(tables["maduras"])
@@ -0,0 +1,151 @@
+# expansion/cannibalization.py
+
+from typing import Dict, Any
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.spatial import cKDTree
+
+from expansion.geo import haversine_km
+
+
+# =====================================================
+# CONFIG
+# =====================================================
+EARTH_RADIUS_KM = 6371.0
+DEFAULT_RADIO_KM = 2.0
+
+# "exponential": w = exp(-d / decay_km)
+# "linear":      w = max(0, 1 - d / radio_km)
+DEFAULT_DECAY = "exponential"
+DEFAULT_DECAY_KM = 0.75
+
+SALES_COL = "Venta Sin Impuestos"
+
+
+# =====================================================
+# UTILIDADES
+# =====================================================
+def _unit_xyz(lat, lon) -> np.ndarray:
+    """
+    Lat/lon -> vector unitario 3D. La distancia euclidiana (cuerda)
+    es monótona con la distancia sobre la esfera, así que un KD-tree
+    3D sirve para búsquedas por radio en todo el país.
+    """
+    lat = np.radians(np.asarray(lat, dtype=float))
+    lon = np.radians(np.asarray(lon, dtype=float))
+    return np.column_stack([
+        np.cos(lat) * np.cos(lon),
+        np.cos(lat) * np.sin(lon),
+        np.sin(lat),
+    ])
+
+
+def _chord_for_km(radio_km: float) -> float:
+    return 2.0 * np.sin(radio_km / (2.0 * EARTH_RADIUS_KM))
+
+
+def distance_decay(d_km: np.ndarray, *, decay: str, decay_km: float, radio_km: float) -> np.ndarray:
+    if decay == "linear":
+        return np.clip(1.0 - d_km / radio_km, 0.0, 1.0)
+    if decay == "exponential":
+        return np.exp(-d_km / decay_km)
+    raise ValueError(f"decay no soportado: {decay}")
+
+
+# =====================================================
+# MOTOR
+# =====================================================
+class CannibalizationEngine:
+    """
+    Índice espacial de la red NETO (se construye una vez) para medir
+    exposición de ventas de candidatos contra tiendas existentes.
+    """
+
+    def __init__(self, df_neto: pd.DataFrame):
+        df = df_neto.dropna(subset=["FCLATITUD", "FCLONGITUD"]).reset_index(drop=True)
+
+        self.store_ids = df["STORE_ID"].to_numpy()
+        self.store_lat = df["FCLATITUD"].to_numpy(dtype=float)
+        self.store_lon = df["FCLONGITUD"].to_numpy(dtype=float)
+        self.store_sales = pd.to_numeric(df[SALES_COL], errors="coerce").fillna(0.0).to_numpy()
+
+        self._tree = cKDTree(_unit_xyz(self.store_lat, self.store_lon))
+
+    def impact_matrix(
+        self,
+        lat,
+        lon,
+        *,
+        radio_km: float = DEFAULT_RADIO_KM,
+        decay: str = DEFAULT_DECAY,
+        decay_km: float = DEFAULT_DECAY_KM
+    ) -> Dict[str, Any]:
+        """
+        Matriz dispersa candidato × tienda con venta expuesta
+        (peso por distancia × Venta Sin Impuestos). Solo se evalúan
+        pares dentro de `radio_km`; nunca se arma una matriz densa.
+
+        Retorna:
+        {
+            "impacto": scipy.sparse.csr_matrix (N, S),
+            "distancia_km": scipy.sparse.csr_matrix (N, S),
+            "store_ids": np.ndarray (S)
+        }
+        """
+        lat = np.atleast_1d(np.asarray(lat, dtype=float))
+        lon = np.atleast_1d(np.asarray(lon, dtype=float))
+        n = len(lat)
+
+        neighbors = self._tree.query_ball_point(
+            _unit_xyz(lat, lon),
+            r=_chord_for_km(radio_km)
+        )
+
+        counts = np.fromiter((len(x) for x in neighbors), dtype=np.int64, count=n)
+        rows = np.repeat(np.arange(n), counts)
+        cols = (
+            np.concatenate([np.asarray(x, dtype=np.int64) for x in neighbors])
+            if counts.sum() else np.empty(0, dtype=np.int64)
+        )
+
+        d_km = haversine_km(lat[rows], lon[rows], self.store_lat[cols], self.store_lon[cols])
+        w = distance_decay(d_km, decay=decay, decay_km=decay_km, radio_km=radio_km)
+
+        shape = (n, len(self.store_ids))
+        return {
+            "impacto": sparse.csr_matrix((w * self.store_sales[cols], (rows, cols)), shape=shape),
+            "distancia_km": sparse.csr_matrix((d_km, (rows, cols)), shape=shape),
+            "store_ids": self.store_ids,
+        }
+
+    def summarize(
+        self,
+        lat,
+        lon,
+        *,
+        radio_km: float = DEFAULT_RADIO_KM,
+        decay: str = DEFAULT_DECAY,
+        decay_km: float = DEFAULT_DECAY_KM
+    ) -> pd.DataFrame:
+        """
+        Resumen plano por candidato (listo para payload):
+        canibalizacion_n_tiendas, canibalizacion_venta_expuesta,
+        canibalizacion_tienda_mas_expuesta.
+        """
+        res = self.impact_matrix(lat, lon, radio_km=radio_km, decay=decay, decay_km=decay_km)
+        impacto = res["impacto"]
+
+        n_tiendas = np.diff(impacto.indptr)
+        total = np.asarray(impacto.sum(axis=1)).ravel()
+
+        top = np.asarray(impacto.argmax(axis=1)).ravel()
+        top_ids = np.where(n_tiendas > 0, self.store_ids[top], None)
+
+        return pd.DataFrame({
+            "canibalizacion_radio_km": radio_km,
+            "canibalizacion_n_tiendas": n_tiendas,
+            "canibalizacion_venta_expuesta": np.round(total, 2),
+            "canibalizacion_tienda_mas_expuesta": top_ids,
+        })
@@ -0,0 +1,188 @@
+# expansion/catchment_demographics.py
+
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+from scipy import sparse
+from shapely.strtree import STRtree
+
+
+# =====================================================
+# CONFIG
+# =====================================================
+PROJECTED_EPSG = 6372
+
+# Tamaño de celda (m) para cachear intersecciones: candidatos en la
+# misma celda y mismo radio comparten pesos.
+DEFAULT_CACHE_CELL_M = 25
+DEFAULT_CACHE_MAX = 50_000
+
+# Columnas de data_hogares.csv que NO son indicadores
+NON_NUMERIC_COLS = {"CVE_ENT", "NOM_ENT", "CVE_MUN", "NOM_MUN", "CVEGEO"}
+
+
+# =====================================================
+# AGREGADOR
+# =====================================================
+class DemographicAggregator:
+    """
+    Estima indicadores INEGI dentro del radio de un candidato
+    ponderando cada polígono (municipio, o AGEB si está disponible)
+    por la fracción de su área que cae dentro del buffer.
+
+    - extensivas (conteos / montos): Σ valor_i · área(buffer ∩ i) / área(i)
+    - intensivas (tasas / promedios): promedio ponderado por área(buffer ∩ i)
+    """
+
+    def __init__(
+        self,
+        *,
+        gdf_polygons: gpd.GeoDataFrame,
+        df_values: pd.DataFrame,
+        key_col: str = "CVEGEO",
+        level: str = "municipio",
+        intensive_cols: List[str] | None = None,
+        cache_cell_m: float = DEFAULT_CACHE_CELL_M,
+        cache_max: int = DEFAULT_CACHE_MAX
+    ):
+        gdf = gdf_polygons[[key_col, "geometry"]].to_crs(epsg=PROJECTED_EPSG)
+        gdf = gdf.reset_index(drop=True)
+
+        values = df_values.drop_duplicates(key_col).set_index(key_col)
+        value_cols = [c for c in values.columns if c not in NON_NUMERIC_COLS]
+        values = values[value_cols].apply(pd.to_numeric, errors="coerce")
+        values = values.reindex(gdf[key_col].astype(str).values)
+
+        self.level = level
+        self.value_cols = value_cols
+        self.intensive_cols = [c for c in (intensive_cols or []) if c in value_cols]
+        self._extensive_idx = [i for i, c in enumerate(value_cols) if c not in self.intensive_cols]
+        self._intensive_idx = [i for i, c in enumerate(value_cols) if c in self.intensive_cols]
+
+        self._polys = gdf.geometry.values
+        self._poly_area = shapely.area(self._polys)
+        self._values = values.to_numpy(dtype=float)
+        self._tree = STRtree(self._polys)
+
+        self.cache_cell_m = cache_cell_m
+        self.cache_max = cache_max
+        self._cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    # -------------------------------------------------
+    # PESOS (CON CACHE POR CELDA)
+    # -------------------------------------------------
+    def _cell_key(self, x: float, y: float, radius_m: float) -> tuple:
+        c = self.cache_cell_m
+        return (int(np.floor(x / c)), int(np.floor(y / c)), float(radius_m))
+
+    def _compute_weights(self, keys: List[tuple]) -> Dict[tuple, tuple]:
+        """
+        Intersecciones en bloque para celdas no cacheadas.
+        Retorna {key: (idx_poligonos, area_interseccion, area_buffer)}.
+        """
+        c = self.cache_cell_m
+        centers = shapely.points(
+            [(kx + 0.5) * c for kx, _, _ in keys],
+            [(ky + 0.5) * c for _, ky, _ in keys],
+        )
+        buffers = shapely.buffer(centers, [r for _, _, r in keys])
+
+        b_idx, p_idx = self._tree.query(buffers, predicate="intersects")
+        inter = shapely.area(shapely.intersection(buffers[b_idx], self._polys[p_idx]))
+
+        out = {}
+        for n, key in enumerate(keys):
+            mask = b_idx == n
+            out[key] = (p_idx[mask], inter[mask], float(shapely.area(buffers[n])))
+        return out
+
+    def _weights_for(self, keys: List[tuple]) -> List[tuple]:
+        with self._lock:
+            missing = list({k for k in keys if k not in self._cache})
+
+        if missing:
+            computed = self._compute_weights(missing)
+            with self._lock:
+                for k, v in computed.items():
+                    self._cache[k] = v
+                while len(self._cache) > self.cache_max:
+                    self._cache.popitem(last=False)
+
+        with self._lock:
+            result = []
+            for k in keys:
+                v = self._cache.get(k)
+                if v is None:
+                    v = self._compute_weights([k])[k]
+                else:
+                    self._cache.move_to_end(k)
+                result.append(v)
+            return result
+
+    # -------------------------------------------------
+    # AGREGACIÓN
+    # -------------------------------------------------
+    def aggregate_many(self, lats, lons, radius_m: float = 500) -> pd.DataFrame:
+        """
+        Estimaciones ponderadas por área para N candidatos.
+        Columnas: INEGI_<radio>m_<indicador> + cobertura / nivel.
+        """
+        lats = np.atleast_1d(np.asarray(lats, dtype=float))
+        lons = np.atleast_1d(np.asarray(lons, dtype=float))
+
+        pts = gpd.GeoSeries(
+            gpd.points_from_xy(lons, lats), crs="EPSG:4326"
+        ).to_crs(epsg=PROJECTED_EPSG)
+
+        keys = [self._cell_key(p.x, p.y, radius_m) for p in pts.values]
+        weights = self._weights_for(keys)
+
+        n, P = len(keys), len(self._polys)
+        rows, cols, frac, inter_w = [], [], [], []
+        coverage = np.zeros(n)
+        for i, (p_idx, inter, buf_area) in enumerate(weights):
+            rows.append(np.full(len(p_idx), i))
+            cols.append(p_idx)
+            frac.append(inter / self._poly_area[p_idx])
+            inter_w.append(inter)
+            coverage[i] = inter.sum() / buf_area if buf_area else 0.0
+
+        rows = np.concatenate(rows) if rows else np.empty(0, dtype=int)
+        cols = np.concatenate(cols) if cols else np.empty(0, dtype=int)
+        frac = np.concatenate(frac) if frac else np.empty(0)
+        inter_w = np.concatenate(inter_w) if inter_w else np.empty(0)
+
+        V = np.nan_to_num(self._values)
+        out = np.full((n, len(self.value_cols)), np.nan)
+
+        if self._extensive_idx:
+            W = sparse.csr_matrix((frac, (rows, cols)), shape=(n, P))
+            out[:, self._extensive_idx] = W @ V[:, self._extensive_idx]
+
+        if self._intensive_idx:
+            A = sparse.csr_matrix((inter_w, (rows, cols)), shape=(n, P))
+            total = np.asarray(A.sum(axis=1)).ravel()
+            with np.errstate(invalid="ignore", divide="ignore"):
+                out[:, self._intensive_idx] = (A @ V[:, self._intensive_idx]) / total[:, None]
+
+        prefix = f"INEGI_{int(radius_m)}m_"
+        df = pd.DataFrame(out, columns=[prefix + c for c in self.value_cols])
+        df[prefix + "cobertura"] = np.round(coverage, 4)
+        df[prefix + "nivel"] = self.level
+        return df
+
+    def aggregate(self, lat: float, lon: float, radius_m: float = 500) -> Dict[str, Any]:
+        """
+        Versión de un solo punto; dict plano listo para payload.
+        """
+        row = self.aggregate_many([lat], [lon], radius_m).iloc[0]
+        return {
+            k: (None if isinstance(v, float) and np.isnan(v) else v)
+            for k, v in row.to_dict().items()
+        }
@@ -0,0 +1,248 @@
+# expansion/catchments.py
+
+import os
+from typing import Dict, Any, List
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+from shapely.geometry import MultiPoint, Point
+from shapely.strtree import STRtree
+
+
+# =====================================================
+# CONFIG
+# =====================================================
+PROJECTED_EPSG = 6372
+DEFAULT_MAX_RADIUS_M = 2000
+DEFAULT_CATCHMENTS_PATH = "data/neto_catchments.pkl"
+
+
+# =====================================================
+# UTILIDADES
+# =====================================================
+def _stores_projected(df_neto: pd.DataFrame) -> gpd.GeoDataFrame:
+    df = df_neto.dropna(subset=["FCLATITUD", "FCLONGITUD"])
+    gdf = gpd.GeoDataFrame(
+        df[["STORE_ID"]].copy(),
+        geometry=gpd.points_from_xy(df["FCLONGITUD"], df["FCLATITUD"]),
+        crs="EPSG:4326"
+    ).to_crs(epsg=PROJECTED_EPSG)
+    return gdf.drop_duplicates("STORE_ID").set_index("STORE_ID")
+
+
+def _voronoi_cells(points: gpd.GeoSeries, max_radius_m: float) -> Dict[Any, Any]:
+    """
+    Celda de Voronoi de cada punto, recortada a un círculo de
+    `max_radius_m`. Retorna {STORE_ID: Polygon}.
+    """
+    if len(points) == 0:
+        return {}
+
+    geoms = points.values
+    if len(points) == 1:
+        return {points.index[0]: geoms[0].buffer(max_radius_m)}
+
+    envelope = MultiPoint(list(geoms)).envelope.buffer(2 * max_radius_m)
+    diagram = shapely.voronoi_polygons(MultiPoint(list(geoms)), extend_to=envelope)
+    cells = np.array(shapely.get_parts(diagram))
+
+    # Asignar cada punto a su celda
+    pt_idx, cell_idx = STRtree(cells).query(geoms, predicate="intersects")
+    cell_for_point = {}
+    for p, c in zip(pt_idx, cell_idx):
+        cell_for_point.setdefault(p, c)
+
+    out = {}
+    for p, store_id in enumerate(points.index):
+        c = cell_for_point.get(p)
+        circle = geoms[p].buffer(max_radius_m)
+        out[store_id] = circle if c is None else cells[c].intersection(circle)
+    return out
+
+
+# =====================================================
+# CATCHMENTS DE LA RED
+# =====================================================
+class StoreCatchments:
+    """
+    Áreas de influencia naturales (Voronoi) de cada tienda NETO,
+    recortadas al radio máximo y, si se da, al municipio INEGI de
+    la tienda. Indexadas con STRtree para consultas de punto y polígono.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_radius_m: float = DEFAULT_MAX_RADIUS_M,
+        gdf_inegi: gpd.GeoDataFrame | None = None
+    ):
+        self.max_radius_m = max_radius_m
+        self._municipios = (
+            gdf_inegi[["CVEGEO", "geometry"]].to_crs(epsg=PROJECTED_EPSG)
+            if gdf_inegi is not None else None
+        )
+
+        self._stores = gpd.GeoDataFrame(geometry=[], crs=f"EPSG:{PROJECTED_EPSG}")
+        self._cells: Dict[Any, Any] = {}
+        self._tree = None
+        self._tree_ids: List[Any] = []
+
+    # -------------------------------------------------
+    # CONSTRUCCIÓN
+    # -------------------------------------------------
+    def build(self, df_neto: pd.DataFrame) -> "StoreCatchments":
+        self._stores = _stores_projected(df_neto)
+        cells = _voronoi_cells(self._stores.geometry, self.max_radius_m)
+        self._cells = self._clip_to_municipio(cells)
+        self._rebuild_tree()
+        return self
+
+    def update(self, df_neto: pd.DataFrame) -> Dict[str, int]:
+        """
+        Recalcula SOLO las celdas afectadas por altas, bajas o
+        cambios de ubicación en el master.
+
+        Con el recorte a max_radius, la celda de una tienda solo
+        depende de tiendas a <= 2·max_radius; se recalculan las
+        tiendas en ese vecindario usando como contexto las que
+        están a <= 4·max_radius.
+        """
+        new = _stores_projected(df_neto)
+        old = self._stores
+
+        removed = old.index.difference(new.index)
+        added = new.index.difference(old.index)
+        common = old.index.intersection(new.index)
+        moved = common[
+            ~old.loc[common].geometry.geom_equals_exact(new.loc[common].geometry, tolerance=0.5)
+        ]
+
+        changed_pts = list(old.loc[removed.union(moved)].geometry) + list(new.loc[added.union(moved)].geometry)
+
+        stats = {"altas": len(added), "bajas": len(removed), "movidas": len(moved), "recalculadas": 0}
+        if not changed_pts:
+            return stats
+
+        changed = shapely.union_all(changed_pts)
+        affected = new[new.geometry.dwithin(changed, 2 * self.max_radius_m)]
+        context = new[new.geometry.dwithin(changed, 4 * self.max_radius_m)]
+
+        cells = _voronoi_cells(context.geometry, self.max_radius_m)
+        cells = {k: v for k, v in cells.items() if k in affected.index}
+
+        self._stores = new
+        for store_id in removed:
+            self._cells.pop(store_id, None)
+        self._cells.update(self._clip_to_municipio(cells))
+
+        self._rebuild_tree()
+
+        stats["recalculadas"] = len(cells)
+        return stats
+
+    def _clip_to_municipio(self, cells: Dict[Any, Any]) -> Dict[Any, Any]:
+        if self._municipios is None or not cells:
+            return cells
+
+        ids = list(cells.keys())
+        pts = gpd.GeoDataFrame(
+            {"STORE_ID": ids},
+            geometry=self._stores.loc[ids].geometry.values,
+            crs=f"EPSG:{PROJECTED_EPSG}"
+        )
+        hit = gpd.sjoin(pts, self._municipios, how="left", predicate="within")
+        hit = hit[~hit["STORE_ID"].duplicated(keep="first")]
+
+        out = {}
+        for store_id, mun_idx in zip(hit["STORE_ID"], hit["index_right"]):
+            cell = cells[store_id]
+            if pd.notna(mun_idx):
+                cell = cell.intersection(self._municipios.geometry.loc[mun_idx])
+            out[store_id] = cell
+        return out
+
+    def _rebuild_tree(self):
+        self._tree_ids = list(self._cells.keys())
+        self._tree = STRtree([self._cells[k] for k in self._tree_ids]) if self._tree_ids else None
+
+    # -------------------------------------------------
+    # CONSULTAS
+    # -------------------------------------------------
+    def _project(self, geom_4326):
+        return gpd.GeoSeries([geom_4326], crs="EPSG:4326").to_crs(epsg=PROJECTED_EPSG).iloc[0]
+
+    def locate_point(self, lat: float, lon: float) -> Any | None:
+        """
+        STORE_ID cuya área de influencia contiene el punto (o None).
+        """
+        if self._tree is None:
+            return None
+        pt = self._project(Point(lon, lat))
+        hits = self._tree.query(pt, predicate="within")
+        if len(hits) == 0:
+            hits = self._tree.query(pt, predicate="intersects")
+        return self._tree_ids[hits[0]] if len(hits) else None
+
+    def overlap(self, lat: float, lon: float, radius_m: float) -> pd.DataFrame:
+        """
+        Qué parte del área natural de cada tienda tomaría una tienda
+        nueva con área de influencia circular de `radius_m`.
+        """
+        circle = self._project(Point(lon, lat)).buffer(radius_m)
+        return self.overlap_polygon(circle, projected=True)
+
+    def overlap_polygon(self, polygon, *, projected: bool = False) -> pd.DataFrame:
+        cols = ["STORE_ID", "area_interseccion_m2", "porcentaje_area_tienda"]
+        if self._tree is None:
+            return pd.DataFrame(columns=cols)
+
+        poly = polygon if projected else self._project(polygon)
+        rows = []
+        for i in self._tree.query(poly, predicate="intersects"):
+            store_id = self._tree_ids[i]
+            cell = self._cells[store_id]
+            inter = cell.intersection(poly).area
+            if inter <= 0:
+                continue
+            rows.append({
+                "STORE_ID": store_id,
+                "area_interseccion_m2": round(inter, 1),
+                "porcentaje_area_tienda": round(100 * inter / cell.area, 2) if cell.area else 0.0,
+            })
+
+        return pd.DataFrame(rows, columns=cols).sort_values(
+            "porcentaje_area_tienda", ascending=False
+        ).reset_index(drop=True)
+
+    def to_geodataframe(self) -> gpd.GeoDataFrame:
+        return gpd.GeoDataFrame(
+            {"STORE_ID": self._tree_ids},
+            geometry=[self._cells[k] for k in self._tree_ids],
+            crs=f"EPSG:{PROJECTED_EPSG}"
+        )
+
+    # -------------------------------------------------
+    # PERSISTENCIA
+    # -------------------------------------------------
+    def save(self, path: str = DEFAULT_CATCHMENTS_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.tmp"
+        pd.to_pickle({
+            "max_radius_m": self.max_radius_m,
+            "municipios": self._municipios,
+            "stores": self._stores,
+            "cells": self._cells,
+        }, tmp)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_CATCHMENTS_PATH) -> "StoreCatchments":
+        data = pd.read_pickle(path)
+        obj = cls(max_radius_m=data["max_radius_m"])
+        obj._municipios = data["municipios"]
+        obj._stores = data["stores"]
+        obj._cells = data["cells"]
+        obj._rebuild_tree()
+        return obj
@@ -0,0 +1,298 @@
+# expansion/dataset_sync.py
+
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import time
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, List
+
+
+# =====================================================
+# CONFIG
+# =====================================================
+CHUNK_SIZE = 1 << 20
+DEFAULT_MAX_WORKERS = 4
+# Versiones anteriores que se conservan junto a la activa (lectores
+# que resolvieron el symlink antes del swap)
+KEEP_OLD_VERSIONS = 1
+
+
+# =====================================================
+# MANIFEST
+# =====================================================
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def build_manifest(dataset_dir: str, manifest_path: str | None = None) -> Dict:
+    """
+    Genera el manifest {files: [{path, size, sha256}]} de un
+    directorio de referencia (se corre una vez al publicar datos).
+    """
+    files = []
+    for root, _, names in os.walk(dataset_dir):
+        for name in sorted(names):
+            full = os.path.join(root, name)
+            files.append({
+                "path": os.path.relpath(full, dataset_dir).replace(os.sep, "/"),
+                "size": os.path.getsize(full),
+                "sha256": file_sha256(full),
+            })
+
+    manifest = {"files": sorted(files, key=lambda f: f["path"])}
+
+    if manifest_path:
+        tmp = f"{manifest_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(tmp, manifest_path)
+
+    return manifest
+
+
+def _is_valid(path: str, entry: Dict) -> bool:
+    return (
+        os.path.exists(path)
+        and os.path.getsize(path) == entry["size"]
+        and file_sha256(path) == entry["sha256"]
+    )
+
+
+# =====================================================
+# FUENTES
+# =====================================================
+def _fetch_from_mirror(mirror_dir: str, entry: Dict, part_path: str):
+    """
+    Copia desde un directorio espejo local, reanudando desde
+    el tamaño actual del .part.
+    """
+    src = os.path.join(mirror_dir, entry["path"])
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+
+    with open(src, "rb") as fin, open(part_path, "ab") as fout:
+        fin.seek(offset)
+        shutil.copyfileobj(fin, fout, CHUNK_SIZE)
+
+
+def _fetch_from_http(base_url: str, entry: Dict, part_path: str):
+    """
+    Descarga HTTP reanudable (Range). Si el servidor ignora el
+    Range (200 en vez de 206) se reinicia el archivo.
+    """
+    url = entry.get("url") or f"{base_url.rstrip('/')}/{entry['path']}"
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+
+    req = urllib.request.Request(url)
+    if offset:
+        req.add_header("Range", f"bytes={offset}-")
+
+    with urllib.request.urlopen(req, timeout=60) as resp:
+        mode = "ab" if offset and resp.status == 206 else "wb"
+        with open(part_path, mode) as fout:
+            shutil.copyfileobj(resp, fout, CHUNK_SIZE)
+
+
+# =====================================================
+# LOCK + VERSIONES
+# =====================================================
+@contextmanager
+def _dataset_lock(target_dir: str):
+    """
+    Lock exclusivo entre procesos (flock sobre `<target_dir>.lock`)
+    para descarga, staging y swap. Otro worker que llegue a la vez
+    espera y luego encuentra el dataset ya sincronizado.
+    """
+    os.makedirs(os.path.dirname(target_dir) or ".", exist_ok=True)
+    with open(f"{target_dir}.lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _versions_dir(target_dir: str) -> str:
+    return f"{target_dir}.versions"
+
+
+def _point_to(target_dir: str, version_dir: str):
+    """
+    `target_dir` pasa a ser un symlink a `version_dir` en UN solo
+    rename (symlink temporal + os.replace): los lectores ven la
+    versión anterior o la nueva, nunca un hueco.
+    """
+    link = f"{target_dir}.link.tmp"
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(os.path.relpath(version_dir, os.path.dirname(target_dir) or "."), link)
+    os.replace(link, target_dir)
+
+
+def _migrate_plain_dir(target_dir: str):
+    """
+    Layout previo (directorio real): se mueve a versions/ y se deja
+    el symlink. Solo ocurre una vez por instalación.
+    """
+    if os.path.isdir(target_dir) and not os.path.islink(target_dir):
+        legacy = os.path.join(_versions_dir(target_dir), f"{time.time_ns()}-legacy")
+        os.rename(target_dir, legacy)
+        _point_to(target_dir, legacy)
+
+
+def _prune_versions(target_dir: str, keep: int = KEEP_OLD_VERSIONS):
+    versions = _versions_dir(target_dir)
+    current = os.path.realpath(target_dir)
+    # Nombres "<epoch>-<sufijo>": orden por nombre = orden de creación
+    old = sorted(
+        (
+            os.path.join(versions, name) for name in os.listdir(versions)
+            if name != "staging"
+            and os.path.realpath(os.path.join(versions, name)) != current
+        ),
+        reverse=True
+    )
+    for path in old[keep:]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+# =====================================================
+# SYNC
+# =====================================================
+def sync_dataset(
+    *,
+    manifest: Dict,
+    target_dir: str,
+    mirror_dir: str | None = None,
+    base_url: str | None = None,
+    max_workers: int = DEFAULT_MAX_WORKERS
+) -> Dict[str, List[str]]:
+    """
+    Deja `target_dir` idéntico al manifest:
+
+    1. Archivos válidos (tamaño + sha256) del directorio actual
+       se reutilizan (hardlink / copia) en un staging.
+    2. Faltantes o corruptos se descargan en paralelo, reanudando
+       desde `.part` si una corrida previa se interrumpió.
+    3. Todo se verifica; el staging pasa a ser una versión en
+       `<target_dir>.versions/` y `target_dir` (symlink) se apunta
+       a ella con un solo rename. Nunca queda un directorio a medias.
+
+    Todo corre bajo un lock de archivo: workers concurrentes no
+    comparten staging ni se pisan en el swap.
+
+    Fuente: `mirror_dir` (directorio local, útil en pruebas) o
+    `base_url` (HTTP; cada entrada puede traer su propia "url").
+    """
+    if not mirror_dir and not base_url:
+        raise ValueError("Se requiere mirror_dir o base_url")
+
+    target_dir = os.path.normpath(target_dir)
+
+    with _dataset_lock(target_dir):
+        # Otro worker pudo sincronizar mientras se esperaba el lock
+        if os.path.exists(target_dir) and not verify_dataset(manifest, target_dir):
+            return {"reutilizados": [e["path"] for e in manifest["files"]], "descargados": []}
+
+        return _sync_locked(
+            manifest=manifest,
+            target_dir=target_dir,
+            mirror_dir=mirror_dir,
+            base_url=base_url,
+            max_workers=max_workers
+        )
+
+
+def _sync_locked(
+    *,
+    manifest: Dict,
+    target_dir: str,
+    mirror_dir: str | None,
+    base_url: str | None,
+    max_workers: int
+) -> Dict[str, List[str]]:
+    versions = _versions_dir(target_dir)
+    staging = os.path.join(versions, "staging")
+    os.makedirs(staging, exist_ok=True)
+    _migrate_plain_dir(target_dir)
+
+    report = {"reutilizados": [], "descargados": []}
+    pending = []
+
+    for entry in manifest["files"]:
+        dst = os.path.join(staging, entry["path"])
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+
+        if _is_valid(dst, entry):
+            report["reutilizados"].append(entry["path"])
+            continue
+
+        current = os.path.join(target_dir, entry["path"])
+        if _is_valid(current, entry):
+            if os.path.exists(dst):
+                os.remove(dst)
+            try:
+                os.link(current, dst)
+            except OSError:
+                shutil.copy2(current, dst)
+            report["reutilizados"].append(entry["path"])
+            continue
+
+        pending.append(entry)
+
+    def _download(entry: Dict) -> str:
+        dst = os.path.join(staging, entry["path"])
+        part = f"{dst}.part"
+
+        if os.path.exists(part) and os.path.getsize(part) > entry["size"]:
+            os.remove(part)
+
+        if mirror_dir:
+            _fetch_from_mirror(mirror_dir, entry, part)
+        else:
+            _fetch_from_http(base_url, entry, part)
+
+        if not _is_valid(part, entry):
+            os.remove(part)
+            raise RuntimeError(f"Checksum inválido para {entry['path']}")
+
+        os.replace(part, dst)
+        return entry["path"]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        report["descargados"] = list(pool.map(_download, pending))
+
+    # Archivos de más en staging (p.ej. de un manifest anterior)
+    expected = {os.path.normpath(e["path"]) for e in manifest["files"]}
+    for root, _, names in os.walk(staging):
+        for name in names:
+            rel = os.path.normpath(os.path.relpath(os.path.join(root, name), staging))
+            if rel not in expected:
+                os.remove(os.path.join(root, name))
+
+    # Swap atómico: staging -> versión nueva -> symlink
+    version = os.path.join(versions, f"{time.time_ns()}-{uuid.uuid4().hex[:8]}")
+    os.rename(staging, version)
+    _point_to(target_dir, version)
+    _prune_versions(target_dir)
+
+    return report
+
+
+def verify_dataset(manifest: Dict, target_dir: str) -> List[str]:
+    """
+    Lista de archivos faltantes o corruptos (vacía = dataset íntegro).
+    """
+    return [
+        e["path"] for e in manifest["files"]
+        if not _is_valid(os.path.join(target_dir, e["path"]), e)
+    ]
@@ -0,0 +1,280 @@
+# expansion/deadline.py
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturesTimeout, wait
+from typing import Any, Callable, Dict
+
+
+# =====================================================
+# CONFIG
+# =====================================================
+STAGE_WORKERS = int(os.environ.get("LATENCY_STAGE_WORKERS", "16"))
+# Etapas que se pasaron del deadline y siguen corriendo en el pool
+# de etapas; por encima de esto las etapas nuevas con presupuesto
+# van directo a respaldo + refinamiento
+ABANDONED_LIMIT = int(os.environ.get("LATENCY_ABANDONED_LIMIT", "8"))
+# Pool aparte para el cálculo completo (refinamiento)
+REFINEMENT_WORKERS = int(os.environ.get("LATENCY_REFINEMENT_WORKERS", "4"))
+MAX_PENDING_REFINEMENTS = int(os.environ.get("LATENCY_MAX_PENDING_REFINEMENTS", "64"))
+# Margen para armar payload + serializar después de la última etapa
+ASSEMBLY_RESERVE_MS = 50
+
+_EXECUTOR = None
+_REFINE_EXECUTOR = None
+_EXECUTOR_LOCK = threading.Lock()
+
+_COUNTS = {"abandonadas": 0, "refinamientos_pendientes": 0}
+_COUNTS_LOCK = threading.Lock()
+
+
+def get_stage_executor() -> ThreadPoolExecutor:
+    """
+    Pool de etapas. Tiene ABANDONED_LIMIT hilos extra: las etapas
+    abandonadas nunca ocupan los STAGE_WORKERS del camino rápido.
+    """
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = ThreadPoolExecutor(
+                max_workers=STAGE_WORKERS + ABANDONED_LIMIT,
+                thread_name_prefix="stage"
+            )
+        return _EXECUTOR
+
+
+def _get_refine_executor() -> ThreadPoolExecutor:
+    global _REFINE_EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _REFINE_EXECUTOR is None:
+            _REFINE_EXECUTOR = ThreadPoolExecutor(
+                max_workers=REFINEMENT_WORKERS,
+                thread_name_prefix="refine"
+            )
+        return _REFINE_EXECUTOR
+
+
+def _add_count(name: str, delta: int):
+    with _COUNTS_LOCK:
+        _COUNTS[name] += delta
+
+
+def load_stats() -> Dict[str, int]:
+    with _COUNTS_LOCK:
+        return dict(_COUNTS)
+
+
+def stage_pool_saturated() -> bool:
+    with _COUNTS_LOCK:
+        return _COUNTS["abandonadas"] >= ABANDONED_LIMIT
+
+
+def submit_refinement(fn: Callable, *args, **kwargs) -> Future | None:
+    """
+    Encola el cálculo completo en el pool de refinamiento.
+    None si ya hay demasiados pendientes (se descarta).
+    """
+    with _COUNTS_LOCK:
+        if _COUNTS["refinamientos_pendientes"] >= MAX_PENDING_REFINEMENTS:
+            return None
+        _COUNTS["refinamientos_pendientes"] += 1
+
+    fut = _get_refine_executor().submit(fn, *args, **kwargs)
+    fut.add_done_callback(lambda _: _add_count("refinamientos_pendientes", -1))
+    return fut
+
+
+def abandon(fut: Future, fn: Callable, *args, **kwargs) -> Future | None:
+    """
+    La etapa no cupo en el deadline. Si aún no arrancaba se cancela
+    y pasa al pool de refinamiento; si ya corre, se deja terminar
+    (cuenta contra ABANDONED_LIMIT). Retorna el future que dará el
+    resultado completo (None si se descartó).
+    """
+    if fut.cancel():
+        return submit_refinement(fn, *args, **kwargs)
+
+    _add_count("abandonadas", 1)
+    fut.add_done_callback(lambda _: _add_count("abandonadas", -1))
+    return fut
+
+
+def _discarded() -> Future:
+    fut = Future()
+    fut.set_exception(RuntimeError("refinamiento descartado: demasiados pendientes"))
+    return fut
+
+
+# =====================================================
+# DEADLINE
+# =====================================================
+class Deadline:
+    """
+    Deadline del request (reloj monotónico). Sin max_latency_ms
+    no hay límite: remaining_s() -> None.
+    """
+
+    def __init__(self, max_latency_ms: float | None = None):
+        self.max_latency_ms = max_latency_ms
+        self.t_end = (
+            time.monotonic() + max_latency_ms / 1000.0
+            if max_latency_ms else None
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.t_end is not None
+
+    def remaining_s(self, reserve_ms: float = 0.0) -> float | None:
+        if self.t_end is None:
+            return None
+        return max(0.0, self.t_end - time.monotonic() - reserve_ms / 1000.0)
+
+    def expired(self) -> bool:
+        return self.t_end is not None and time.monotonic() >= self.t_end
+
+
+# =====================================================
+# ETAPAS CON PRESUPUESTO
+# =====================================================
+class StageRunner:
+    """
+    Corre etapas en threads bajo un Deadline.
+
+    - submit(etapa, fn): arranca la etapa (etapas independientes
+      corren en paralelo)
+    - get(etapa, fallback): espera lo que quede del presupuesto; si
+      no alcanza, usa fallback() -> (valor, fuente) y marca la etapa
+      como degradada con esa fuente.
+      El cálculo completo sigue (ver abandon) y queda para el
+      refinamiento (on_complete).
+    - Con el pool de etapas saturado de trabajo abandonado, las
+      etapas con presupuesto van directo al respaldo y su cálculo
+      completo al pool de refinamiento.
+    """
+
+    def __init__(self, deadline: Deadline, *, reserve_ms: float = ASSEMBLY_RESERVE_MS):
+        self.deadline = deadline
+        self.reserve_ms = reserve_ms
+        self.futures: Dict[str, Future] = {}
+        self.degraded: Dict[str, str] = {}
+        self.timings_ms: Dict[str, float] = {}
+        self._calls: Dict[str, tuple] = {}
+        self._saturated = set()
+        self._t0: Dict[str, float] = {}
+
+    def submit(self, stage: str, fn: Callable, *args, **kwargs):
+        self._t0[stage] = time.perf_counter()
+        self._calls[stage] = (fn, args, kwargs)
+
+        if self.deadline.enabled and stage_pool_saturated():
+            self._saturated.add(stage)
+            self.futures[stage] = submit_refinement(fn, *args, **kwargs) or _discarded()
+        else:
+            self.futures[stage] = get_stage_executor().submit(fn, *args, **kwargs)
+        return self.futures[stage]
+
+    def get(self, stage: str, *, fallback: Callable[[], tuple], source: str = "fallback"):
+        """
+        La fuente describe de dónde sale el valor degradado
+        (p.ej. "cache_folio", "historial_cercano"); si fallback()
+        no la da se usa `source`.
+        """
+        fut = self.futures[stage]
+        try:
+            if stage in self._saturated:
+                raise FuturesTimeout()
+            value = fut.result(timeout=self.deadline.remaining_s(self.reserve_ms))
+        except FuturesTimeout:
+            if stage not in self._saturated:
+                fn, args, kwargs = self._calls[stage]
+                self.futures[stage] = abandon(fut, fn, *args, **kwargs) or _discarded()
+            value, used = fallback()
+            self.degraded[stage] = used or source
+        self.timings_ms[stage] = round((time.perf_counter() - self._t0[stage]) * 1000, 1)
+        return value
+
+    def run(self, stage: str, fn: Callable, *, fallback: Callable[[], tuple], source: str = "fallback"):
+        self.submit(stage, fn)
+        return self.get(stage, fallback=fallback, source=source)
+
+    @property
+    def is_degraded(self) -> bool:
+        return bool(self.degraded)
+
+    def flags(self) -> Dict[str, Any]:
+        """
+        Campos que se agregan al payload.
+        """
+        return {
+            "degradado": self.is_degraded,
+            "etapas_degradadas": dict(self.degraded),
+        }
+
+    def on_complete(self, callback: Callable[[Dict[str, Any]], None]):
+        """
+        Cuando TODAS las etapas terminen (incluidas las que se
+        pasaron del deadline) llama callback({etapa: resultado |
+        excepción}) en un thread aparte.
+        """
+        futures = dict(self.futures)
+
+        def _wait():
+            wait(list(futures.values()))
+            results = {
+                k: (f.exception() if f.exception() is not None else f.result())
+                for k, f in futures.items()
+            }
+            callback(results)
+
+        threading.Thread(target=_wait, name="refinement", daemon=True).start()
+
+
+# =====================================================
+# MAPA ACOTADO (TTL + TAMAÑO)
+# =====================================================
+class ExpiringMap:
+    """
+    Dict con TTL y tamaño máximo (expulsa el más antiguo) para
+    estado de proceso en workers de larga vida.
+    """
+
+    def __init__(self, *, ttl_s: float, max_entries: int):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            if item[0] <= time.monotonic():
+                del self._data[key]
+                return default
+            return item[1]
+
+    def __contains__(self, key) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __setitem__(self, key, value):
+        now = time.monotonic()
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (now + self.ttl_s, value)
+            # Expirados al frente (misma TTL -> orden de inserción)
+            while self._data and (
+                len(self._data) > self.max_entries
+                or next(iter(self._data.values()))[0] <= now
+            ):
+                self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+
+_MISSING = object()
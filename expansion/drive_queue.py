@@ -0,0 +1,369 @@
+# expansion/drive_queue.py
+
+import json
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List
+
+from expansion.drive_uploader import upload_bundle_to_drive, upload_or_update_file
+from expansion.run_history import DEFAULT_HISTORY_PATH
+
+
+# =====================================================
+# CONFIG
+# =====================================================
+# Mismo SQLite que el historial de corridas: compartido por todos
+# los workers del host (status y reanudación entre procesos)
+DEFAULT_STATE_PATH = os.environ.get("DRIVE_QUEUE_STATE_PATH", DEFAULT_HISTORY_PATH)
+DEFAULT_MAX_WORKERS = int(os.environ.get("DRIVE_QUEUE_MAX_WORKERS", "2"))
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_BACKOFF_BASE_S = 1.0
+DEFAULT_BACKOFF_MAX_S = 60.0
+# Un job activo es del proceso que lo tomó mientras renueve su lease;
+# si el dueño muere, otro proceso lo reclama al vencer
+DEFAULT_LEASE_S = 60.0
+# Jobs terminados (done / failed) se borran pasado este tiempo
+DEFAULT_FINISHED_TTL_S = 24 * 3600
+
+# Errores que NO tiene sentido reintentar
+PERMANENT_ERRORS = (FileNotFoundError, ValueError)
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_RETRYING = "retrying"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+ACTIVE_STATUSES = (STATUS_PENDING, STATUS_RUNNING, STATUS_RETRYING)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS drive_jobs (
+    job_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    owner TEXT,
+    lease_until REAL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    request TEXT NOT NULL,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_drive_jobs_status ON drive_jobs (status, lease_until);
+"""
+
+JOB_COLUMNS = [
+    "job_id", "kind", "status", "attempts", "owner", "lease_until",
+    "created_at", "updated_at", "request", "result", "error",
+]
+
+
+# =====================================================
+# COLA DE SUBIDAS
+# =====================================================
+class DriveUploadQueue:
+    """
+    Cola de subidas a Drive en segundo plano.
+
+    - Concurrencia acotada (ThreadPoolExecutor)
+    - Reintentos con backoff exponencial + jitter
+    - Estado en SQLite compartido entre workers: cualquier proceso
+      responde el status de cualquier job; cada escritura toca
+      solo la fila de su job
+    - Ownership por lease: el dueño lo renueva mientras el job
+      está activo; jobs con lease vencido (dueño caído) se
+      reclaman y reencolan, nunca los de un proceso vivo
+    - Jobs terminados se podan pasado finished_ttl_s
+    """
+
+    def __init__(
+        self,
+        *,
+        state_path: str = DEFAULT_STATE_PATH,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        backoff_base_s: float = DEFAULT_BACKOFF_BASE_S,
+        backoff_max_s: float = DEFAULT_BACKOFF_MAX_S,
+        lease_s: float = DEFAULT_LEASE_S,
+        finished_ttl_s: float = DEFAULT_FINISHED_TTL_S,
+        upload_fn: Callable[..., Dict] = upload_or_update_file,
+        bundle_fn: Callable[..., Dict] = upload_bundle_to_drive
+    ):
+        self.state_path = state_path
+        self.max_attempts = max_attempts
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self.lease_s = lease_s
+        self.finished_ttl_s = finished_ttl_s
+        self.upload_fn = upload_fn
+        self.bundle_fn = bundle_fn
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        os.makedirs(os.path.dirname(state_path) or ".", exist_ok=True)
+        with self._db() as conn:
+            conn.executescript(SCHEMA)
+
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="drive-upload"
+        )
+
+        self._stop = threading.Event()
+        self._reclaim_and_prune()
+        self._keeper = threading.Thread(target=self._keeper_loop, name="drive-lease", daemon=True)
+        self._keeper.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.state_path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def _db(self):
+        """
+        Conexión de una operación: commit (o rollback) y SIEMPRE se
+        cierra (`with conn` solo hace commit).
+        """
+        conn = self._connect()
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # -------------------------------------------------
+    # API PÚBLICA
+    # -------------------------------------------------
+    def enqueue(
+        self,
+        *,
+        local_path: str,
+        drive_folder_id: str,
+        filename: str | None = None,
+        mimetype: str = "text/csv"
+    ) -> str:
+        """
+        Encola una subida y retorna el job_id inmediatamente.
+        """
+        return self._submit("file", {
+            "local_path": local_path,
+            "drive_folder_id": drive_folder_id,
+            "filename": filename,
+            "mimetype": mimetype,
+        })
+
+    def enqueue_bundle(
+        self,
+        *,
+        paths: List[str],
+        drive_folder_id: str,
+        bundle_name: str
+    ) -> str:
+        """
+        Encola varios artefactos para subirse como UN solo ZIP.
+        """
+        return self._submit("bundle", {
+            "paths": list(paths),
+            "drive_folder_id": drive_folder_id,
+            "bundle_name": bundle_name,
+        })
+
+    def _submit(self, kind: str, request: Dict) -> str:
+        job_id = uuid.uuid4().hex
+        now = _now_iso()
+
+        with self._db() as conn:
+            conn.execute(
+                f"INSERT INTO drive_jobs ({', '.join(JOB_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(JOB_COLUMNS))})",
+                (
+                    job_id, kind, STATUS_PENDING, 0, self.owner,
+                    time.time() + self.lease_s, now, now,
+                    json.dumps(request, ensure_ascii=False), None, None,
+                )
+            )
+
+        self._pool.submit(self._run, job_id)
+        return job_id
+
+    def get_status(self, job_id: str) -> Dict | None:
+        with self._db() as conn:
+            row = conn.execute(
+                f"SELECT {', '.join(JOB_COLUMNS)} FROM drive_jobs WHERE job_id = ?",
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+
+        job = dict(zip(JOB_COLUMNS, row))
+        job["request"] = json.loads(job["request"])
+        if job["result"] is not None:
+            job["result"] = json.loads(job["result"])
+        return job
+
+    def shutdown(self, wait: bool = True):
+        self._stop.set()
+        self._pool.shutdown(wait=wait)
+
+    # -------------------------------------------------
+    # WORKER
+    # -------------------------------------------------
+    def _run(self, job_id: str):
+        while True:
+            job = self._claim_attempt(job_id)
+            if job is None:
+                # Ya no es nuestro (lease perdido) o ya terminó
+                return
+
+            attempt = job["attempts"]
+            fn = self.bundle_fn if job["kind"] == "bundle" else self.upload_fn
+
+            try:
+                result = fn(**job["request"])
+            except PERMANENT_ERRORS as e:
+                self._update(job_id, status=STATUS_FAILED, error=str(e), owner=None)
+                return
+            except Exception as e:
+                if attempt >= self.max_attempts:
+                    self._update(job_id, status=STATUS_FAILED, error=str(e), owner=None)
+                    return
+
+                self._update(job_id, status=STATUS_RETRYING, error=str(e))
+                time.sleep(self._backoff(attempt))
+                continue
+
+            self._update(
+                job_id,
+                status=STATUS_DONE,
+                result=json.dumps(result, ensure_ascii=False),
+                error=None,
+                owner=None
+            )
+            return
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(
+            self.backoff_max_s,
+            self.backoff_base_s * (2 ** (attempt - 1))
+        )
+        return delay * (0.5 + random.random() / 2)
+
+    # -------------------------------------------------
+    # PERSISTENCIA (UNA FILA POR ESCRITURA)
+    # -------------------------------------------------
+    def _claim_attempt(self, job_id: str) -> Dict | None:
+        """
+        Marca el job como running y suma el intento, solo si sigue
+        activo y es de este proceso.
+        """
+        with self._db() as conn:
+            cur = conn.execute(
+                "UPDATE drive_jobs SET status = ?, attempts = attempts + 1, "
+                "lease_until = ?, updated_at = ? "
+                f"WHERE job_id = ? AND owner = ? AND status IN ({', '.join('?' * len(ACTIVE_STATUSES))})",
+                (STATUS_RUNNING, time.time() + self.lease_s, _now_iso(),
+                 job_id, self.owner, *ACTIVE_STATUSES)
+            )
+            if cur.rowcount != 1:
+                return None
+            kind, attempts, request = conn.execute(
+                "SELECT kind, attempts, request FROM drive_jobs WHERE job_id = ?",
+                (job_id,)
+            ).fetchone()
+        return {"kind": kind, "attempts": attempts, "request": json.loads(request)}
+
+    def _update(self, job_id: str, **fields):
+        fields["updated_at"] = _now_iso()
+        sets = ", ".join(f"{k} = ?" for k in fields)
+        with self._db() as conn:
+            conn.execute(
+                f"UPDATE drive_jobs SET {sets} WHERE job_id = ? AND owner = ?",
+                (*fields.values(), job_id, self.owner)
+            )
+
+    # -------------------------------------------------
+    # LEASES + PODA
+    # -------------------------------------------------
+    def _keeper_loop(self):
+        while not self._stop.wait(self.lease_s / 3):
+            try:
+                self._renew_leases()
+                self._reclaim_and_prune()
+            except sqlite3.Error:
+                # Base ocupada: se reintenta en la siguiente vuelta
+                continue
+
+    def _renew_leases(self):
+        with self._db() as conn:
+            conn.execute(
+                "UPDATE drive_jobs SET lease_until = ? "
+                f"WHERE owner = ? AND status IN ({', '.join('?' * len(ACTIVE_STATUSES))})",
+                (time.time() + self.lease_s, self.owner, *ACTIVE_STATUSES)
+            )
+
+    def _reclaim_and_prune(self):
+        """
+        Toma los jobs activos con lease vencido (su proceso murió)
+        y borra los terminados viejos.
+        """
+        now = time.time()
+        active = ", ".join("?" * len(ACTIVE_STATUSES))
+        cutoff = (datetime.now(timezone.utc) - timedelta(seconds=self.finished_ttl_s)).isoformat()
+
+        with self._db() as conn:
+            stale = [
+                r[0] for r in conn.execute(
+                    f"SELECT job_id FROM drive_jobs WHERE status IN ({active}) "
+                    "AND (lease_until IS NULL OR lease_until < ?)",
+                    (*ACTIVE_STATUSES, now)
+                )
+            ]
+
+            claimed = []
+            for job_id in stale:
+                # Condicional: si otro proceso lo reclamó primero, rowcount = 0
+                cur = conn.execute(
+                    "UPDATE drive_jobs SET owner = ?, lease_until = ? "
+                    f"WHERE job_id = ? AND status IN ({active}) "
+                    "AND (lease_until IS NULL OR lease_until < ?)",
+                    (self.owner, now + self.lease_s, job_id, *ACTIVE_STATUSES, now)
+                )
+                if cur.rowcount == 1:
+                    claimed.append(job_id)
+
+            conn.execute(
+                "DELETE FROM drive_jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (STATUS_DONE, STATUS_FAILED, cutoff)
+            )
+
+        for job_id in claimed:
+            self._pool.submit(self._run, job_id)
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+# =====================================================
+# SINGLETON DE PROCESO
+# =====================================================
+_QUEUE = None
+_QUEUE_LOCK = threading.Lock()
+
+
+def get_upload_queue() -> DriveUploadQueue:
+    global _QUEUE
+    with _QUEUE_LOCK:
+        if _QUEUE is None:
+            _QUEUE = DriveUploadQueue()
+        return _QUEUE
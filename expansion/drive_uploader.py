@@ -2,11 +2,15 @@
 
 import os
 import json
-from typing import Dict
+import fcntl
+import hashlib
+import sqlite3
+import threading
+import zipfile
+from contextlib import closing, contextmanager
+from typing import Dict, List
 
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
+from expansion.run_history import DEFAULT_HISTORY_PATH
 
 
 # =====================================================
@@ -16,15 +20,51 @@ SCOPES = [
     "https://www.googleapis.com/auth/drive"
 ]
 
+# Permite apuntar a un endpoint Drive local (fake) en pruebas
+DRIVE_API_ENDPOINT = os.environ.get("GOOGLE_DRIVE_API_ENDPOINT")
+
+_CREDS_LOCK = threading.Lock()
+_CREDS_CACHE = {"raw": None, "creds": None}
+_THREAD_LOCAL = threading.local()
+
+# Manifest (folder_id, filename) -> {sha256, file_id, name, webViewLink}
+# en el SQLite compartido (mismo que historial y cola de subidas)
+DRIVE_MANIFEST_DB = os.environ.get("DRIVE_MANIFEST_DB", DEFAULT_HISTORY_PATH)
+# Manifest JSON anterior: se importa una vez a la tabla
+DRIVE_MANIFEST_PATH = os.environ.get(
+    "DRIVE_MANIFEST_PATH", "data/drive_manifest.json"
+)
+# Un lock de archivo por (folder_id, filename): lookup + create/update
+# de un mismo nombre nunca corren a la vez, ni entre procesos
+DRIVE_LOCK_DIR = os.environ.get("DRIVE_LOCK_DIR", "data/drive_locks")
+
+MANIFEST_SCHEMA = """
+CREATE TABLE IF NOT EXISTS drive_manifest (
+    folder_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    entry TEXT NOT NULL,
+    PRIMARY KEY (folder_id, name)
+);
+"""
+
+_MANIFEST_LOCK = threading.Lock()
+_MANIFEST_READY = set()
+
+# Fecha fija para que el ZIP sea determinista (mismo contenido => mismo hash)
+_ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)
+
+
+class DriveFileNotFound(RuntimeError):
+    """El file_id ya no existe en Drive (borrado / sin acceso)."""
+
 
 # =====================================================
 # DRIVE SERVICE
 # =====================================================
-def get_drive_service():
+def _load_credentials():
     """
-    Crea cliente de Google Drive usando Service Account
-    cargada desde la variable de entorno GOOGLE_SERVICE_ACCOUNT_JSON.
-    Compatible con Shared Drives.
+    Parsea GOOGLE_SERVICE_ACCOUNT_JSON y construye credenciales
+    UNA vez por proceso (se reconstruyen solo si la variable cambia).
     """
     raw = os.environ.get("GOOGLE_SERVICE_ACCOUNT_JSON")
     if not raw:
@@ -32,25 +72,61 @@ def get_drive_service():
             "GOOGLE_SERVICE_ACCOUNT_JSON no definido en variables de entorno"
         )
 
-    try:
-        info = json.loads(raw)
-    except json.JSONDecodeError as e:
-        raise RuntimeError(
-            "GOOGLE_SERVICE_ACCOUNT_JSON no es JSON válido"
-        ) from e
+    with _CREDS_LOCK:
+        if _CREDS_CACHE["raw"] == raw:
+            return _CREDS_CACHE["creds"]
+
+        from google.oauth2 import service_account
+
+        try:
+            info = json.loads(raw)
+        except json.JSONDecodeError as e:
+            raise RuntimeError(
+                "GOOGLE_SERVICE_ACCOUNT_JSON no es JSON válido"
+            ) from e
+
+        creds = service_account.Credentials.from_service_account_info(
+            info,
+            scopes=SCOPES
+        )
+
+        _CREDS_CACHE["raw"] = raw
+        _CREDS_CACHE["creds"] = creds
+        return creds
 
-    creds = service_account.Credentials.from_service_account_info(
-        info,
-        scopes=SCOPES
+
+def get_drive_service():
+    """
+    Crea cliente de Google Drive usando Service Account
+    cargada desde la variable de entorno GOOGLE_SERVICE_ACCOUNT_JSON.
+    Compatible con Shared Drives.
+
+    Las credenciales se cachean por proceso; el cliente discovery
+    se cachea por hilo (httplib2 no es thread-safe).
+    """
+    creds = _load_credentials()
+
+    cached = getattr(_THREAD_LOCAL, "service", None)
+    if cached is not None and cached[0] is creds:
+        return cached[1]
+
+    from googleapiclient.discovery import build
+
+    client_options = (
+        {"api_endpoint": DRIVE_API_ENDPOINT} if DRIVE_API_ENDPOINT else None
     )
 
-    return build(
+    service = build(
         "drive",
         "v3",
         credentials=creds,
+        client_options=client_options,
         cache_discovery=False  # 🔑 evita warnings y errores raros en prod
     )
 
+    _THREAD_LOCAL.service = (creds, service)
+    return service
+
 
 # =====================================================
 # UPLOAD
@@ -79,6 +155,8 @@ def upload_file_to_drive(
     if not drive_folder_id:
         raise ValueError("drive_folder_id es obligatorio")
 
+    from googleapiclient.http import MediaFileUpload
+
     service = get_drive_service()
 
     file_metadata = {
@@ -113,3 +191,298 @@ def upload_file_to_drive(
         "name": file.get("name"),
         "webViewLink": file.get("webViewLink"),
     }
+
+
+# =====================================================
+# MANIFEST (HASH -> FILE ID)
+# =====================================================
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _manifest_connect() -> sqlite3.Connection:
+    path = DRIVE_MANIFEST_DB
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+
+    with _MANIFEST_LOCK:
+        if path not in _MANIFEST_READY:
+            with conn:
+                conn.executescript(MANIFEST_SCHEMA)
+                _import_legacy_manifest(conn)
+            _MANIFEST_READY.add(path)
+    return conn
+
+
+def _import_legacy_manifest(conn: sqlite3.Connection):
+    """
+    Entradas del manifest JSON anterior (si existe); no pisa las
+    que ya estén en la tabla.
+    """
+    if not os.path.exists(DRIVE_MANIFEST_PATH):
+        return
+    try:
+        with open(DRIVE_MANIFEST_PATH, "r", encoding="utf-8") as f:
+            legacy = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return
+
+    conn.executemany(
+        "INSERT OR IGNORE INTO drive_manifest (folder_id, name, entry) VALUES (?, ?, ?)",
+        [
+            (folder_id, name, json.dumps(entry, ensure_ascii=False))
+            for folder_id, entries in legacy.items()
+            for name, entry in entries.items()
+        ]
+    )
+
+
+def _get_manifest_entry(drive_folder_id: str, name: str) -> Dict | None:
+    with closing(_manifest_connect()) as conn:
+        row = conn.execute(
+            "SELECT entry FROM drive_manifest WHERE folder_id = ? AND name = ?",
+            (drive_folder_id, name)
+        ).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def _set_manifest_entry(drive_folder_id: str, name: str, entry: Dict):
+    with closing(_manifest_connect()) as conn, conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO drive_manifest (folder_id, name, entry) VALUES (?, ?, ?)",
+            (drive_folder_id, name, json.dumps(entry, ensure_ascii=False))
+        )
+
+
+@contextmanager
+def _manifest_entry_lock(drive_folder_id: str, name: str):
+    """
+    flock exclusivo por (folder_id, filename). Cada llamada abre su
+    propio descriptor, así que también excluye entre hilos.
+    """
+    os.makedirs(DRIVE_LOCK_DIR, exist_ok=True)
+    key = hashlib.sha1(f"{drive_folder_id}/{name}".encode("utf-8")).hexdigest()
+    with open(os.path.join(DRIVE_LOCK_DIR, f"{key}.lock"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+# =====================================================
+# UPDATE IN PLACE
+# =====================================================
+def update_file_on_drive(
+    *,
+    file_id: str,
+    local_path: str,
+    mimetype: str = "text/csv"
+) -> Dict[str, str]:
+    """
+    Reemplaza el contenido de un archivo existente en Drive
+    (conserva file_id y link).
+    """
+
+    if not os.path.exists(local_path):
+        raise FileNotFoundError(f"Archivo no encontrado: {local_path}")
+
+    from googleapiclient.http import MediaFileUpload
+
+    service = get_drive_service()
+
+    media = MediaFileUpload(
+        local_path,
+        mimetype=mimetype,
+        resumable=True
+    )
+
+    try:
+        file = (
+            service.files()
+            .update(
+                fileId=file_id,
+                media_body=media,
+                fields="id,name,webViewLink",
+                supportsAllDrives=True
+            )
+            .execute()
+        )
+    except Exception as e:
+        if getattr(getattr(e, "resp", None), "status", None) == 404:
+            raise DriveFileNotFound(
+                f"Archivo {file_id} no existe en Google Drive"
+            ) from e
+        raise RuntimeError(
+            f"Error actualizando archivo en Google Drive: {e}"
+        ) from e
+
+    return {
+        "file_id": file.get("id"),
+        "name": file.get("name"),
+        "webViewLink": file.get("webViewLink"),
+    }
+
+
+# =====================================================
+# UPLOAD CON DEDUPLICACIÓN
+# =====================================================
+def upload_or_update_file(
+    *,
+    local_path: str,
+    drive_folder_id: str,
+    filename: str | None = None,
+    mimetype: str = "text/csv"
+) -> Dict[str, str]:
+    """
+    Sube un archivo usando el manifest de hashes (SQLite compartido):
+
+    - mismo hash que la última subida  -> no sube nada ("skipped")
+    - hash distinto y archivo conocido -> update in place
+    - archivo nuevo                    -> create
+    - file_id del manifest ya no existe (404) -> create y se
+      reescribe la entrada del manifest
+
+    Retorna el mismo dict que upload_file_to_drive + "action".
+    """
+
+    if not os.path.exists(local_path):
+        raise FileNotFoundError(f"Archivo no encontrado: {local_path}")
+
+    if not drive_folder_id:
+        raise ValueError("drive_folder_id es obligatorio")
+
+    name = filename or os.path.basename(local_path)
+    digest = file_sha256(local_path)
+    # El lock cubre lookup + create/update + manifest: dos jobs del
+    # mismo nombre no crean dos archivos en Drive
+    with _manifest_entry_lock(drive_folder_id, name):
+        return _upload_or_update_locked(
+            local_path=local_path,
+            drive_folder_id=drive_folder_id,
+            name=name,
+            digest=digest,
+            mimetype=mimetype
+        )
+
+
+def _upload_or_update_locked(
+    *,
+    local_path: str,
+    drive_folder_id: str,
+    name: str,
+    digest: str,
+    mimetype: str
+) -> Dict[str, str]:
+    entry = _get_manifest_entry(drive_folder_id, name)
+
+    if entry and entry.get("sha256") == digest:
+        return {
+            "file_id": entry["file_id"],
+            "name": entry["name"],
+            "webViewLink": entry["webViewLink"],
+            "action": "skipped",
+        }
+
+    info = None
+    if entry:
+        try:
+            info = update_file_on_drive(
+                file_id=entry["file_id"],
+                local_path=local_path,
+                mimetype=mimetype
+            )
+            action = "updated"
+        except DriveFileNotFound:
+            # Borrado en Drive: se crea de nuevo (abajo)
+            pass
+
+    if info is None:
+        info = upload_file_to_drive(
+            local_path=local_path,
+            drive_folder_id=drive_folder_id,
+            filename=name,
+            mimetype=mimetype
+        )
+        action = "created"
+
+    _set_manifest_entry(drive_folder_id, name, {**info, "sha256": digest})
+
+    return {**info, "action": action}
+
+
+# =====================================================
+# BUNDLE (ZIP) DE ARTEFACTOS
+# =====================================================
+def build_artifact_bundle(paths: List[str], output_path: str) -> str:
+    """
+    Empaqueta artefactos en un ZIP determinista
+    (orden y fechas fijas => mismo contenido, mismo hash).
+    Nombres repetidos (mismo basename en carpetas distintas)
+    se desambiguan con sufijo: reporte.csv, reporte_2.csv, ...
+    """
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+
+    with zipfile.ZipFile(output_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for path, arcname in _unique_arcnames(sorted(paths)):
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Archivo no encontrado: {path}")
+
+            info = zipfile.ZipInfo(arcname, date_time=_ZIP_EPOCH)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with open(path, "rb") as f:
+                zf.writestr(info, f.read())
+
+    return output_path
+
+
+def _unique_arcnames(paths: List[str]) -> List[tuple]:
+    """
+    [(path, nombre_en_zip)] sin nombres repetidos. Determinista:
+    depende solo del orden de `paths`.
+    """
+    taken = {os.path.basename(p) for p in paths}
+    seen = set()
+    out = []
+    for path in paths:
+        name = os.path.basename(path)
+        if name in seen:
+            root, ext = os.path.splitext(name)
+            n = 2
+            while f"{root}_{n}{ext}" in taken:
+                n += 1
+            name = f"{root}_{n}{ext}"
+            taken.add(name)
+        seen.add(name)
+        out.append((path, name))
+    return out
+
+
+def upload_bundle_to_drive(
+    *,
+    paths: List[str],
+    drive_folder_id: str,
+    bundle_name: str,
+    local_dir: str = "data/bundles"
+) -> Dict[str, str]:
+    """
+    Sube varios artefactos relacionados (CSV, mapa, PDF)
+    como UN solo ZIP, con deduplicación por hash.
+    """
+    bundle_path = build_artifact_bundle(
+        paths,
+        os.path.join(local_dir, bundle_name)
+    )
+
+    return upload_or_update_file(
+        local_path=bundle_path,
+        drive_folder_id=drive_folder_id,
+        filename=bundle_name,
+        mimetype="application/zip"
+    )
@@ -0,0 +1,350 @@
+# expansion/expansion_dag.py
+
+import os
+from typing import Dict, Any
+
+from expansion.deadline import Deadline
+from expansion.pipeline_dag import DEFAULT_CACHE_DIR, Node, PipelineDAG, hash_inputs
+
+
+# =====================================================
+# ETAPAS
+# =====================================================
+# Firma común: fn(ctx, params, **salidas_de_dependencias)
+# (+ node_key en las etapas que escriben archivos)
+
+def _artifact_path(ctx, kind: str, folio, node_key: str, ext: str) -> str:
+    """
+    Ruta única por llave de nodo: un hit de una llave anterior no
+    regresa un archivo que otra corrida del folio ya sobrescribió.
+    """
+    out_dir = ctx.get("output_dir", "data/reportes")
+    os.makedirs(out_dir, exist_ok=True)
+    return os.path.join(out_dir, f"{kind}_{folio}_{node_key[:16]}.{ext}")
+
+
+def _nearest_store(ctx, params):
+    from expansion.geo import get_nearest_neto_store
+    return get_nearest_neto_store(
+        lat=params["lat"], lon=params["lon"], df_stores=ctx["df_neto"]
+    )
+
+
+def _inegi(ctx, params):
+    from expansion.inegi import lookup_municipio, prefix_inegi_keys
+
+    # municipio_locator (malla, ver inegi_grid) sale de inegi_shp_path:
+    # no entra a las llaves, ya las versiona la ruta (mtime / tamaño)
+    geo_raw = lookup_municipio(
+        params["lat"],
+        params["lon"],
+        locator=ctx.get("municipio_locator"),
+        src_path=ctx.get("inegi_shp_path")
+    )
+
+    tab_raw = {}
+    cvegeo = geo_raw.get("CVEGEO")
+    df_tab = ctx.get("df_inegi_tabular")
+    if cvegeo and df_tab is not None:
+        row = df_tab.loc[df_tab["CVEGEO"] == str(cvegeo)]
+        if not row.empty:
+            tab_raw = row.iloc[0].to_dict()
+
+    return prefix_inegi_keys({**geo_raw, **tab_raw})
+
+
+def _places(ctx, params, node_key):
+    import shutil
+    from expansion.google_places import fetch_places_nearby
+    df_places, places_count, csv_path = fetch_places_nearby(
+        folio=params["folio"],
+        lat=params["lat"],
+        lon=params["lon"],
+        radius_m=params.get("radius_m", 500)
+    )
+    # raw_places.csv del folio se reescribe en cada corrida
+    keyed_path = _artifact_path(ctx, "places", params["folio"], node_key, "csv")
+    shutil.copyfile(csv_path, keyed_path)
+    return {"df": df_places, "count": places_count, "csv_path": keyed_path}
+
+
+def _integracion(ctx, params, places):
+    if not places["csv_path"]:
+        return {
+            "integracion_score": 0,
+            "integracion_clasificacion": "SIN_DATOS",
+            "integracion_diagnostico": "Sin lugares disponibles dentro del presupuesto de latencia."
+        }
+    from expansion.integracion_comercial import evaluar_integracion_comercial_desde_csv
+    return evaluar_integracion_comercial_desde_csv(places["csv_path"])
+
+
+def _generadores(ctx, params, places):
+    from expansion.generators import build_generators_summary
+    resumen, _ = build_generators_summary(
+        df_places=places["df"], lat=params["lat"], lon=params["lon"]
+    )
+    return resumen
+
+
+def _competencia(ctx, params):
+    if ctx.get("df_generales") is None or ctx.get("df_aurrera") is None:
+        return {}
+    from expansion.competition import get_competencia_por_radio
+    return get_competencia_por_radio(
+        lat=params["lat"],
+        lon=params["lon"],
+        df_generales=ctx["df_generales"],
+        df_aurrera=ctx["df_aurrera"]
+    )
+
+
+def _payload(ctx, params, nearest_store, inegi, places, integracion, generadores, competencia):
+    from expansion.payload_builder import build_payload_flat
+    payload = build_payload_flat(
+        lat=params["lat"],
+        lon=params["lon"],
+        neto_data=nearest_store,
+        inegi_data=inegi,
+        places_count=places["count"],
+        competencia_data=competencia
+    )
+    payload["id_ubicacion"] = params["folio"]
+    payload.update(integracion)
+    payload.update(generadores)
+    return payload
+
+
+def _region_vector(ctx, params, payload):
+    from expansion.region_vectors import DEFAULT_REGION_VECTORS_PATH, load_region_vector_for_prompt
+    return load_region_vector_for_prompt(
+        ctx.get("region_vectors_path", DEFAULT_REGION_VECTORS_PATH),
+        payload["region"]
+    )
+
+
+def _benchmark(ctx, params, payload, region_vector):
+    import pandas as pd
+    from expansion.benchmark import build_region_benchmark_table
+
+    variables_map = ctx.get("variables_map")
+    if not variables_map:
+        return pd.DataFrame(columns=[
+            "Variable", "Benchmark regional", "Punto candidato", "Δ vs benchmark (%)"
+        ])
+    return build_region_benchmark_table(
+        payload=payload, region_vector=region_vector, variables_map=variables_map
+    )
+
+
+def _tablas(ctx, params, payload):
+    master = ctx.get("master_path")
+    if not master or not os.path.exists(master):
+        return {"global": None, "maduras": None}
+    from expansion.benchmark_tables import region_benchmark_tables
+    tabla_global, tabla_maduras = region_benchmark_tables(
+        payload["region"], excel_path=master, df_neto=ctx.get("df_neto")
+    )
+    return {"global": tabla_global, "maduras": tabla_maduras}
+
+
+def _llm(ctx, params, payload, region_vector, benchmark, tablas):
+    from expansion.prescreen import evaluate_site_with_prescreen
+    return evaluate_site_with_prescreen(
+        payload=payload,
+        region_vector=region_vector,
+        tabla_global=tablas["global"],
+        tabla_maduras=tablas["maduras"],
+        df_benchmark=benchmark
+    )
+
+
+def _mapa(ctx, params, places, node_key):
+    if not places["csv_path"]:
+        return None
+    from expansion.places_map import generate_places_map
+    output_path = _artifact_path(ctx, "mapa", params["folio"], node_key, "png")
+    generate_places_map(csv_path=places["csv_path"], output_path=output_path)
+    return output_path
+
+
+def _pdf(ctx, params, payload, benchmark, llm, mapa, node_key):
+    # En proceso: la etapa ya corre en el pool de etapas (con deadline);
+    # esperar aquí al pool del ReportService bloquearía ese hilo
+    from expansion.pdf_report import generate_expansion_pdf
+    from expansion.report_service import DEFAULT_LOGO_PATH
+    output_path = _artifact_path(ctx, "reporte", params["folio"], node_key, "pdf")
+    return generate_expansion_pdf(
+        output_path=output_path,
+        logo_path=ctx.get("logo_path") or DEFAULT_LOGO_PATH,
+        payload=payload,
+        df_benchmark=benchmark,
+        decision_modelo_1={"decision": llm["decision_modelo_1"], "explicacion": llm["explicacion_1"]},
+        decision_modelo_2={"decision": llm["decision_modelo_2"], "explicacion": llm["explicacion_2"]},
+        site_image_path=mapa
+    )
+
+
+def _drive(ctx, params, places, mapa, pdf):
+    folder = params.get("drive_folder_id")
+    if not folder:
+        return None
+    from expansion.drive_queue import get_upload_queue
+    return get_upload_queue().enqueue_bundle(
+        paths=[p for p in (places["csv_path"], mapa, pdf) if p],
+        drive_folder_id=folder,
+        bundle_name=f"expansion_{params['folio']}.zip"
+    )
+
+
+# =====================================================
+# RESPALDOS (PRESUPUESTO DE LATENCIA)
+# =====================================================
+def _inegi_fallback(ctx, params):
+    return {}
+
+
+def _places_fallback(ctx, params):
+    """
+    Últimos lugares conocidos del folio; si no hay, conteos gruesos
+    de corridas cercanas (sin CSV).
+    """
+    import pandas as pd
+    from expansion.google_places import last_known_places_count, coarse_places_count
+    from expansion.run_history import get_history_store
+
+    radius_m = params.get("radius_m", 500)
+    conteo = last_known_places_count(
+        folio=params["folio"], lat=params["lat"], lon=params["lon"], radius_m=radius_m
+    )
+    csv_path = os.path.join("data/google_places", f"folio_{params['folio']}", "raw_places.csv")
+
+    if conteo is not None and os.path.exists(csv_path):
+        return {"df": pd.read_csv(csv_path, encoding="utf-8-sig"), "count": conteo, "csv_path": csv_path}
+
+    conteo = coarse_places_count(
+        get_history_store().nearby_payloads(lat=params["lat"], lon=params["lon"])
+    )
+    return {"df": pd.DataFrame(), "count": conteo or {}, "csv_path": None}
+
+
+def _llm_fallback(ctx, params):
+    explicacion = "Evaluación pendiente: el agente no respondió dentro del presupuesto de latencia."
+    return {
+        "decision_modelo_1": "EVALUAR",
+        "explicacion_1": explicacion,
+
+        "decision_modelo_2": "EVALUAR",
+        "explicacion_2": explicacion,
+
+        "fuente_decision": "pendiente"
+    }
+
+
+# =====================================================
+# DAG COMPLETO
+# =====================================================
+SITE_PARAMS = ("lat", "lon")
+
+
+def build_expansion_dag(cache_dir: str = DEFAULT_CACHE_DIR) -> PipelineDAG:
+    """
+    nearest store → INEGI → Places → integración → generadores →
+    competencia → benchmark → LLM → mapa → PDF → Drive
+    """
+    from expansion.google_places import AREA_MAX_AGE_H
+
+    # code_refs: módulos que implementan cada etapa (por nombre, sin
+    # importarlos); editar cualquiera invalida el nodo y sus dependientes.
+    # Places expira como el área de move mode (AREA_MAX_AGE_H)
+    nodes = [
+        Node("nearest_store", _nearest_store, params=SITE_PARAMS, context_keys=["df_neto"],
+             code_refs=["expansion.geo"]),
+        Node("inegi", _inegi, params=SITE_PARAMS,
+             context_keys=["inegi_shp_path", "df_inegi_tabular"],
+             code_refs=["expansion.inegi"], fallback=_inegi_fallback),
+        Node("places", _places, params=SITE_PARAMS + ("folio", "radius_m"), context_keys=["output_dir"],
+             code_refs=["expansion.google_places"], max_age_s=AREA_MAX_AGE_H * 3600,
+             artifacts=lambda out: [out["csv_path"]], fallback=_places_fallback),
+        Node("integracion", _integracion, deps=["places"],
+             code_refs=["expansion.integracion_comercial"]),
+        Node("generadores", _generadores, deps=["places"], params=SITE_PARAMS,
+             code_refs=["expansion.generators"]),
+        Node("competencia", _competencia, params=SITE_PARAMS, context_keys=["df_generales", "df_aurrera"],
+             code_refs=["expansion.competition"]),
+        Node("payload", _payload, params=SITE_PARAMS + ("folio",),
+             deps=["nearest_store", "inegi", "places", "integracion", "generadores", "competencia"],
+             code_refs=["expansion.payload_builder"]),
+        Node("region_vector", _region_vector, deps=["payload"], context_keys=["region_vectors_path"],
+             code_refs=["expansion.region_vectors"]),
+        Node("benchmark", _benchmark, deps=["payload", "region_vector"], context_keys=["variables_map"],
+             code_refs=["expansion.benchmark"]),
+        Node("tablas", _tablas, deps=["payload"], context_keys=["master_path", "df_neto"],
+             code_refs=["expansion.benchmark_tables"]),
+        Node("llm", _llm, deps=["payload", "region_vector", "benchmark", "tablas"],
+             code_refs=["expansion.prescreen", "expansion.agent_evaluator", "expansion.prompt_builder"],
+             fallback=_llm_fallback),
+        Node("mapa", _mapa, deps=["places"], params=("folio",), context_keys=["output_dir"],
+             code_refs=["expansion.places_map"], artifacts=lambda out: [out]),
+        Node("pdf", _pdf, deps=["payload", "benchmark", "llm", "mapa"], params=("folio",),
+             context_keys=["logo_path", "output_dir"],
+             code_refs=["expansion.pdf_report"], artifacts=lambda out: [out]),
+        Node("drive", _drive, deps=["places", "mapa", "pdf"], params=("folio", "drive_folder_id"),
+             code_refs=["expansion.drive_queue", "expansion.drive_uploader"]),
+    ]
+
+    return PipelineDAG(nodes, cache_dir=cache_dir)
+
+
+def context_versions(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Versión de cada recurso de contexto para las llaves del DAG.
+    Rutas -> (mtime, tamaño); DataFrames -> hash de contenido.
+    Calcular una vez al cargar (warmup), no por request.
+    """
+    import pandas as pd
+
+    versions = {}
+    for key, value in ctx.items():
+        if isinstance(value, str):
+            if os.path.exists(value):
+                st = os.stat(value)
+                versions[key] = (value, st.st_mtime_ns, st.st_size)
+            else:
+                versions[key] = value
+        elif isinstance(value, pd.DataFrame):
+            cols = [c for c in value.columns if c != "geometry"]
+            versions[key] = (
+                value.shape,
+                int(pd.util.hash_pandas_object(value[cols], index=True).sum()),
+            )
+        elif isinstance(value, dict):
+            versions[key] = hash_inputs(value)
+        elif value is None:
+            versions[key] = None
+    return versions
+
+
+def run_site(
+    dag: PipelineDAG,
+    *,
+    params: Dict[str, Any],
+    ctx: Dict[str, Any],
+    ctx_versions: Dict[str, Any] | None = None,
+    targets=None,
+    force=(),
+    max_latency_ms: float | None = None
+) -> Dict[str, Any]:
+    """
+    Ejecuta el DAG para un sitio; incluye reporte por etapa
+    (cache hit/miss y ms). Con max_latency_ms las etapas lentas
+    con respaldo regresan valores gruesos marcados en "degradado".
+    """
+    return dag.run(
+        params,
+        ctx,
+        ctx_versions=ctx_versions,
+        targets=targets,
+        force=force,
+        deadline=Deadline(max_latency_ms) if max_latency_ms else None
+    )
@@ -27,6 +27,11 @@ RELEVANT_COLUMNS = [
     "Prom Monto Sin Imp"
 ]
 
+# Columnas que se conservan solo si el master las trae
+OPTIONAL_COLUMNS = [
+    "FECHA_APERTURA",
+]
+
 
 # =====================================================
 # UTILIDADES
@@ -61,7 +66,9 @@ def load_neto_master(
     Carga y normaliza el master de tiendas NETO.
     """
     df = pd.read_excel(excel_path)
-    df = df[RELEVANT_COLUMNS].copy()
+    df = df[
+        RELEVANT_COLUMNS + [c for c in OPTIONAL_COLUMNS if c in df.columns]
+    ].copy()
 
     df["FCLATITUD"] = pd.to_numeric(df["FCLATITUD"], errors="coerce")
     df["FCLONGITUD"] = pd.to_numeric(df["FCLONGITUD"], errors="coerce")
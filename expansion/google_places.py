@@ -3,8 +3,9 @@ import json
 import os
 from collections import defaultdict
 from datetime import datetime
+from typing import Dict, Any, List
 
-import googlemaps
+import numpy as np
 import pandas as pd
 
 
@@ -30,7 +31,52 @@ POI_TYPES = [
 # GOOGLE MAPS CLIENT
 # ======================================================
 GOOGLE_MAPS_API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")
-gmaps = googlemaps.Client(key=GOOGLE_MAPS_API_KEY)
+_GMAPS = None
+
+
+def get_gmaps_client():
+    """
+    Cliente googlemaps creado en el primer uso (no al importar).
+    """
+    global _GMAPS
+    if _GMAPS is None:
+        import googlemaps
+        _GMAPS = googlemaps.Client(key=os.getenv("GOOGLE_MAPS_API_KEY"))
+    return _GMAPS
+
+
+# ======================================================
+# FILA CSV
+# ======================================================
+def _place_row(r: dict, *, folio, lat, lon, radius_m, poi_type) -> dict:
+    return {
+        "folio": folio,
+        "query_lat": lat,
+        "query_lon": lon,
+        "search_radius_m": radius_m,
+        "poi_type_searched": poi_type,
+
+        "place_id": r.get("place_id"),
+        "name": r.get("name"),
+        "business_status": r.get("business_status"),
+
+        "place_lat": r.get("geometry", {}).get("location", {}).get("lat"),
+        "place_lon": r.get("geometry", {}).get("location", {}).get("lng"),
+
+        "vicinity": r.get("vicinity"),
+        "types": json.dumps(r.get("types"), ensure_ascii=False),
+
+        "rating": r.get("rating"),
+        "user_ratings_total": r.get("user_ratings_total"),
+        "price_level": r.get("price_level"),
+
+        "opening_hours": json.dumps(
+            r.get("opening_hours"), ensure_ascii=False
+        ),
+
+        # GUARDA TODO
+        "raw_json": json.dumps(r, ensure_ascii=False)
+    }
 
 
 # ======================================================
@@ -64,6 +110,7 @@ def fetch_places_nearby(
 
     all_rows = []
     conteo = defaultdict(int)
+    gmaps = get_gmaps_client()
 
     # ---------------------------
     # Loop por tipo de POI
@@ -80,34 +127,14 @@ def fetch_places_nearby(
             conteo[poi_type] += len(results)
 
             for r in results:
-                all_rows.append({
-                    "folio": folio,
-                    "query_lat": lat,
-                    "query_lon": lon,
-                    "search_radius_m": radius_m,
-                    "poi_type_searched": poi_type,
-
-                    "place_id": r.get("place_id"),
-                    "name": r.get("name"),
-                    "business_status": r.get("business_status"),
-
-                    "place_lat": r.get("geometry", {}).get("location", {}).get("lat"),
-                    "place_lon": r.get("geometry", {}).get("location", {}).get("lng"),
-
-                    "vicinity": r.get("vicinity"),
-                    "types": json.dumps(r.get("types"), ensure_ascii=False),
-
-                    "rating": r.get("rating"),
-                    "user_ratings_total": r.get("user_ratings_total"),
-                    "price_level": r.get("price_level"),
-
-                    "opening_hours": json.dumps(
-                        r.get("opening_hours"), ensure_ascii=False
-                    ),
-
-                    # GUARDA TODO
-                    "raw_json": json.dumps(r, ensure_ascii=False)
-                })
+                all_rows.append(_place_row(
+                    r,
+                    folio=folio,
+                    lat=lat,
+                    lon=lon,
+                    radius_m=radius_m,
+                    poi_type=poi_type
+                ))
 
             if "next_page_token" in response:
                 time.sleep(2)
@@ -125,6 +152,337 @@ def fetch_places_nearby(
     df_places = pd.DataFrame(all_rows)
     df_places.to_csv(csv_path, index=False, encoding="utf-8-sig")
 
+    # Área cubierta -> base para re-evaluar si se mueve el pin
+    _save_area_cache(folio_dir, circles=[(lat, lon, radius_m)], df_cache=df_places)
+
     conteo["total_lugares"] = int(sum(conteo.values()))
 
     return df_places, dict(conteo), csv_path
+
+
+# ======================================================
+# PIN MOVIDO: REUSO DEL ÁREA YA CONSULTADA
+# ======================================================
+AREA_STATE_FILE = "places_area.json"
+AREA_CACHE_FILE = "places_cache.csv"
+# Edad máxima del área en cache (desde la última corrida completa)
+AREA_MAX_AGE_H = float(os.getenv("PLACES_AREA_MAX_AGE_H", "168"))
+
+MOVE_MAX_SHIFT_FRAC = 0.5      # desplazamiento > 50% del radio -> corrida completa
+MOVE_SLIVER_M = 5.0            # franjas más delgadas que esto se consideran cubiertas
+MOVE_MIN_QUERY_RADIUS_M = 60
+NEARBY_MAX_RESULTS = 60        # tope de Places Nearby (3 páginas x 20)
+
+_M_PER_DEG_LAT = 110_540.0
+_M_PER_DEG_LON = 111_320.0
+
+
+def _to_local_m(lat, lon, lat0, lon0):
+    """
+    Proyección equirectangular local (metros) alrededor de (lat0, lon0).
+    Suficiente para radios de cientos de metros.
+    """
+    x = (np.asarray(lon, dtype=float) - lon0) * _M_PER_DEG_LON * np.cos(np.radians(lat0))
+    y = (np.asarray(lat, dtype=float) - lat0) * _M_PER_DEG_LAT
+    return x, y
+
+
+def _from_local_m(x, y, lat0, lon0):
+    lat = lat0 + np.asarray(y) / _M_PER_DEG_LAT
+    lon = lon0 + np.asarray(x) / (_M_PER_DEG_LON * np.cos(np.radians(lat0)))
+    return lat, lon
+
+
+def _load_area_cache(folio_dir: str):
+    state_path = os.path.join(folio_dir, AREA_STATE_FILE)
+    cache_path = os.path.join(folio_dir, AREA_CACHE_FILE)
+    if not (os.path.exists(state_path) and os.path.exists(cache_path)):
+        return None, None
+
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        df_cache = pd.read_csv(cache_path, encoding="utf-8-sig")
+    except (ValueError, pd.errors.EmptyDataError):
+        return None, None
+    return state, df_cache
+
+
+def _save_area_cache(
+    folio_dir: str,
+    *,
+    circles: list,
+    df_cache: pd.DataFrame,
+    fetched_at: str | None = None
+):
+    """
+    fetched_at: fecha de la corrida completa que originó el área
+    (se conserva en los movimientos para expirar el cache).
+    """
+    now = datetime.utcnow().isoformat()
+    state = {
+        "circles": [[float(a), float(b), float(c)] for a, b, c in circles],
+        "fetched_at": fetched_at or now,
+        "updated_at": now,
+    }
+    cache_path = os.path.join(folio_dir, AREA_CACHE_FILE)
+    df_cache.to_csv(cache_path, index=False, encoding="utf-8-sig")
+
+    state_path = os.path.join(folio_dir, AREA_STATE_FILE)
+    tmp = f"{state_path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, state_path)
+
+
+def uncovered_query_circles(
+    *,
+    lat: float,
+    lon: float,
+    radius_m: float,
+    covered: list,
+    query_radius_m: float,
+    sliver_m: float = MOVE_SLIVER_M
+) -> list:
+    """
+    Círculos (lat, lon, radio) que cubren la parte del círculo
+    nuevo que NO está dentro de `covered` (la "media luna" que deja
+    un pin movido). Cobertura greedy sobre una malla de muestras.
+    """
+    step = max(query_radius_m / 3.0, 5.0)
+    g = np.arange(-radius_m, radius_m + step, step)
+    gx, gy = np.meshgrid(g, g)
+    gx, gy = gx.ravel(), gy.ravel()
+    inside = gx ** 2 + gy ** 2 <= radius_m ** 2
+    gx, gy = gx[inside], gy[inside]
+
+    pending = np.ones(len(gx), dtype=bool)
+    for c_lat, c_lon, c_r in covered:
+        cx, cy = _to_local_m(c_lat, c_lon, lat, lon)
+        pending &= (gx - cx) ** 2 + (gy - cy) ** 2 > (c_r + sliver_m) ** 2
+
+    px, py = gx[pending], gy[pending]
+    if len(px) == 0:
+        return []
+
+    # Candidatos = las mismas muestras pendientes
+    d2 = (px[:, None] - px[None, :]) ** 2 + (py[:, None] - py[None, :]) ** 2
+    reach = d2 <= query_radius_m ** 2
+
+    left = np.ones(len(px), dtype=bool)
+    centers = []
+    while left.any():
+        gain = reach[:, left].sum(axis=1)
+        best = int(np.argmax(gain))
+        centers.append((px[best], py[best]))
+        left &= ~reach[best]
+
+    out = []
+    for cx, cy in centers:
+        c_lat, c_lon = _from_local_m(cx, cy, lat, lon)
+        out.append((float(c_lat), float(c_lon), float(query_radius_m)))
+    return out
+
+
+def _nearby_all_pages(gmaps, **kwargs):
+    """
+    Places Nearby con paginación. Retorna (resultados, llamadas).
+    """
+    response = gmaps.places_nearby(**kwargs)
+    results, calls = list(response.get("results", [])), 1
+    while "next_page_token" in response:
+        time.sleep(2)
+        response = gmaps.places_nearby(page_token=response["next_page_token"])
+        results += response.get("results", [])
+        calls += 1
+    return results, calls
+
+
+def _query_circle(gmaps, *, folio, c_lat, c_lon, c_r, sleep_s):
+    """
+    Un círculo de la media luna: UNA búsqueda sin tipo y
+    clasificación local contra POI_TYPES. Si llega al tope de
+    Places (círculo saturado) se repite por tipo.
+    """
+    results, calls = _nearby_all_pages(gmaps, location=(c_lat, c_lon), radius=c_r)
+
+    rows = []
+    if len(results) < NEARBY_MAX_RESULTS:
+        for r in results:
+            for poi_type in set(r.get("types") or []) & set(POI_TYPES):
+                rows.append(_place_row(
+                    r, folio=folio, lat=c_lat, lon=c_lon, radius_m=c_r, poi_type=poi_type
+                ))
+        return rows, calls
+
+    for poi_type in POI_TYPES:
+        typed, n = _nearby_all_pages(gmaps, location=(c_lat, c_lon), radius=c_r, type=poi_type)
+        calls += n
+        rows += [
+            _place_row(r, folio=folio, lat=c_lat, lon=c_lon, radius_m=c_r, poi_type=poi_type)
+            for r in typed
+        ]
+        time.sleep(sleep_s)
+    return rows, calls
+
+
+def fetch_places_moved(
+    *,
+    folio: str,
+    lat: float,
+    lon: float,
+    radius_m: int = 500,
+    sleep_s: float = 1.0,
+    output_dir: str = "data/google_places",
+    max_shift_frac: float = MOVE_MAX_SHIFT_FRAC
+):
+    """
+    Igual que fetch_places_nearby, pero si el folio ya tiene un
+    área consultada y el pin se movió poco, reusa los lugares en
+    cache y solo consulta la media luna no cubierta.
+
+    Retorna (df_places, conteo_por_tipo, csv_path, stats).
+    """
+    folio_dir = os.path.join(output_dir, f"folio_{folio}")
+    state, df_cache = _load_area_cache(folio_dir)
+
+    def _full(reason):
+        df, conteo, path = fetch_places_nearby(
+            folio=folio, lat=lat, lon=lon, radius_m=radius_m,
+            sleep_s=sleep_s, output_dir=output_dir
+        )
+        return df, conteo, path, {"modo": "completo", "motivo": reason}
+
+    if state is None or not state.get("circles"):
+        return _full("sin_cache")
+
+    fetched_at = state.get("fetched_at") or state.get("updated_at")
+    age_h = (datetime.utcnow() - datetime.fromisoformat(fetched_at)).total_seconds() / 3600
+    if age_h > AREA_MAX_AGE_H:
+        return _full("cache_expirado")
+
+    last_lat, last_lon, last_r = state["circles"][-1]
+    sx, sy = _to_local_m(last_lat, last_lon, lat, lon)
+    shift_m = float(np.hypot(sx, sy))
+
+    if last_r < radius_m or shift_m > max_shift_frac * radius_m:
+        return _full("desplazamiento_grande")
+
+    query_r = float(np.clip(2 * shift_m, MOVE_MIN_QUERY_RADIUS_M, radius_m / 2))
+    circles = uncovered_query_circles(
+        lat=lat, lon=lon, radius_m=radius_m,
+        covered=state["circles"], query_radius_m=query_r
+    )
+
+    # Más círculos que tipos -> más caro que una corrida completa
+    if len(circles) >= len(POI_TYPES):
+        return _full("media_luna_costosa")
+
+    gmaps = get_gmaps_client() if circles else None
+    new_rows, calls = [], 0
+    for c_lat, c_lon, c_r in circles:
+        rows, n = _query_circle(gmaps, folio=folio, c_lat=c_lat, c_lon=c_lon, c_r=c_r, sleep_s=sleep_s)
+        new_rows += rows
+        calls += n
+
+    df_new = pd.DataFrame(new_rows)
+    df_all = (
+        pd.concat([df_cache, df_new], ignore_index=True)
+        .drop_duplicates(subset=["place_id", "poi_type_searched"], keep="first")
+    )
+
+    # Lugares dentro del radio del pin nuevo
+    px, py = _to_local_m(df_all["place_lat"], df_all["place_lon"], lat, lon)
+    in_radius = px ** 2 + py ** 2 <= radius_m ** 2
+
+    # Mismo tope que una corrida completa (60 por tipo); el cache va
+    # primero, así que se conservan los lugares de la corrida previa
+    df_places = (
+        df_all.loc[in_radius]
+        .groupby("poi_type_searched", sort=False)
+        .head(NEARBY_MAX_RESULTS)
+        .copy()
+    )
+    from_cache = df_places.index.to_numpy() < len(df_cache)
+
+    df_places["query_lat"] = lat
+    df_places["query_lon"] = lon
+    df_places["search_radius_m"] = radius_m
+
+    os.makedirs(folio_dir, exist_ok=True)
+    csv_path = os.path.join(folio_dir, "raw_places.csv")
+    df_places.to_csv(csv_path, index=False, encoding="utf-8-sig")
+
+    # El cache se poda al círculo actual: no crece con cada movimiento
+    _save_area_cache(
+        folio_dir,
+        circles=[(lat, lon, radius_m)],
+        df_cache=df_places,
+        fetched_at=fetched_at
+    )
+
+    conteo = defaultdict(int)
+    for poi_type, n in df_places["poi_type_searched"].value_counts().items():
+        conteo[poi_type] = int(n)
+    conteo["total_lugares"] = int(sum(conteo.values()))
+
+    stats = {
+        "modo": "movimiento",
+        "desplazamiento_m": round(shift_m, 1),
+        "circulos_consultados": len(circles),
+        "llamadas_api": calls,
+        "lugares_reutilizados": int(from_cache.sum()),
+        "lugares_nuevos": int((~from_cache).sum()),
+    }
+    return df_places, dict(conteo), csv_path, stats
+
+
+# ======================================================
+# VALORES DE RESPALDO (PRESUPUESTO DE LATENCIA)
+# ======================================================
+def last_known_places_count(
+    *,
+    folio: str,
+    lat: float,
+    lon: float,
+    radius_m: int = 500,
+    output_dir: str = "data/google_places",
+    max_shift_frac: float = MOVE_MAX_SHIFT_FRAC
+) -> Dict[str, int] | None:
+    """
+    Conteos por tipo con los lugares ya en cache del folio, sin
+    llamar a la API. None si no hay cache o el pin se movió
+    demasiado respecto al área consultada.
+    """
+    state, df_cache = _load_area_cache(os.path.join(output_dir, f"folio_{folio}"))
+    if state is None or not state.get("circles") or df_cache.empty:
+        return None
+
+    last_lat, last_lon, _ = state["circles"][-1]
+    sx, sy = _to_local_m(last_lat, last_lon, lat, lon)
+    if np.hypot(sx, sy) > max_shift_frac * radius_m:
+        return None
+
+    px, py = _to_local_m(df_cache["place_lat"], df_cache["place_lon"], lat, lon)
+    df = df_cache.loc[px ** 2 + py ** 2 <= radius_m ** 2]
+
+    conteo = {t: 0 for t in POI_TYPES}
+    for poi_type, n in df["poi_type_searched"].value_counts().items():
+        conteo[poi_type] = int(n)
+    conteo["total_lugares"] = int(sum(conteo.values()))
+    return conteo
+
+
+def coarse_places_count(payloads: List[Dict[str, Any]]) -> Dict[str, int] | None:
+    """
+    Conteos gruesos: promedio por tipo de corridas cercanas
+    (misma celda geohash).
+    """
+    if not payloads:
+        return None
+
+    conteo = {}
+    for key in POI_TYPES + ["total_lugares"]:
+        vals = [p[key] for p in payloads if isinstance(p.get(key), (int, float))]
+        conteo[key] = int(round(sum(vals) / len(vals))) if vals else 0
+    return conteo
@@ -1,6 +1,15 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+
 import geopandas as gpd
-from shapely.geometry import Point
-from typing import Dict
+import numpy as np
+from shapely.geometry import Point, box
+from shapely.strtree import STRtree
+from typing import Dict, List
+
+from expansion.inegi_loader import INEGI_AGEB_DIR
 
 
 # =====================================================
@@ -26,11 +35,17 @@ def load_inegi_gdf(shp_path: str) -> gpd.GeoDataFrame:
 def find_municipio_inegi(
     lat: float,
     lon: float,
-    gdf_inegi: gpd.GeoDataFrame
+    gdf_inegi: gpd.GeoDataFrame,
+    gdf_inegi_m: gpd.GeoDataFrame | None = None
 ) -> Dict:
     """
     Devuelve el municipio INEGI que contiene el punto.
     Incluye fallback por buffer y nearest.
+
+    gdf_inegi_m: misma capa ya proyectada a EPSG:6372; evita
+    reproyectar toda la capa en el fallback nearest. No se asume el
+    mismo orden de filas (el índice espacial FlatGeobuf reordena):
+    los atributos salen de la propia fila de gdf_inegi_m.
     """
 
     pt = gpd.GeoDataFrame(
@@ -39,8 +54,10 @@ def find_municipio_inegi(
     )
 
     # 1. Within
+    # how="left": sin match la fila existe con atributos NaN (la
+    # geometría del punto nunca es NaN); se revisa index_right
     hit = gpd.sjoin(pt, gdf_inegi, how="left", predicate="within")
-    if not hit.empty and not hit.iloc[0].isna().all():
+    if not hit.empty and hit["index_right"].notna().iloc[0]:
         return hit.iloc[0].drop("geometry").to_dict()
 
     # 2. Buffer pequeño (~5m)
@@ -49,22 +66,202 @@ def find_municipio_inegi(
     pt_b = pt_m.to_crs(epsg=4326)
 
     hit = gpd.sjoin(pt_b, gdf_inegi, how="left", predicate="intersects")
-    if not hit.empty and not hit.iloc[0].isna().all():
+    if not hit.empty and hit["index_right"].notna().iloc[0]:
         return hit.iloc[0].drop("geometry").to_dict()
 
     # 3. Nearest (hasta 300m)
     pt_m = pt.to_crs(epsg=6372)
-    gdf_m = gdf_inegi.to_crs(epsg=6372)
+    gdf_m = gdf_inegi_m if gdf_inegi_m is not None else gdf_inegi.to_crs(epsg=6372)
 
-    near = gpd.sjoin_nearest(pt_m, gdf_m, how="left", max_distance=300)
+    near = gpd.sjoin_nearest(pt_m, gdf_m, how="inner", max_distance=300)
     if not near.empty:
-        return gdf_inegi.iloc[
-            near["index_right"].iloc[0]
-        ].drop("geometry").to_dict()
+        return near.iloc[0].drop("geometry").to_dict()
 
     return {"INEGI_FOUND": False}
 
 
+# =====================================================
+# LOOKUP SIN CAPA EN MEMORIA
+# =====================================================
+METERS_PER_DEG = 111_320
+
+
+def find_municipio_inegi_cached(
+    lat: float,
+    lon: float,
+    src_path: str,
+    max_distance_m: float = 300
+) -> Dict:
+    """
+    find_municipio_inegi leyendo del cache FlatGeobuf solo los
+    municipios en una ventana alrededor del punto (bbox que cubre
+    el nearest de `max_distance_m`). La capa completa nunca se carga.
+    """
+    from expansion.inegi_loader import load_inegi_cached
+
+    margin = 1.5 * max_distance_m / METERS_PER_DEG
+    margin_lon = margin / max(np.cos(np.radians(lat)), 0.1)
+
+    window = load_inegi_cached(
+        src_path,
+        epsg=4326,
+        bbox=(lon - margin_lon, lat - margin, lon + margin_lon, lat + margin)
+    )
+    if window.empty:
+        return {"INEGI_FOUND": False}
+
+    return find_municipio_inegi(
+        lat=lat,
+        lon=lon,
+        gdf_inegi=window,
+        gdf_inegi_m=window.to_crs(epsg=6372)
+    )
+
+
+def lookup_municipio(
+    lat: float,
+    lon: float,
+    *,
+    locator=None,
+    src_path: str | None = None
+) -> Dict:
+    """
+    Municipio del punto: malla (inegi_grid.MunicipioGridLocator) si
+    está cargada; si no, ventana por bbox del cache FlatGeobuf.
+    {} si no hay capa INEGI.
+    """
+    if locator is not None:
+        return locator.find(lat, lon)
+    if src_path is not None:
+        return find_municipio_inegi_cached(lat, lon, src_path)
+    return {}
+
+
+# =====================================================
+# CAPAS TESELADAS (AGEB / MANZANA)
+# =====================================================
+class TiledInegiLayer:
+    """
+    Capa INEGI grande (AGEB, manzana) dividida en teselas
+    (por estado o por celda) con un index.json de nivel superior:
+
+    {
+        "layer": "ageb",
+        "crs": "EPSG:4326",
+        "tiles": [{"file": "tiles/09.fgb", "bbox": [minx, miny, maxx, maxy], "n": 2431}, ...]
+    }
+
+    Solo se cargan a memoria las teselas que tocan las consultas
+    (LRU de `max_tiles` teselas). Ver inegi_loader.build_tiled_layer.
+    """
+
+    def __init__(self, layer_dir: str, max_tiles: int = 8):
+        with open(os.path.join(layer_dir, "index.json"), "r", encoding="utf-8") as f:
+            index = json.load(f)
+
+        self.layer_dir = layer_dir
+        self.layer = index.get("layer", os.path.basename(layer_dir))
+        self.max_tiles = max_tiles
+
+        self._tiles = index["tiles"]
+        self._tile_tree = STRtree([box(*t["bbox"]) for t in self._tiles])
+        self._loaded: "OrderedDict[int, gpd.GeoDataFrame]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_tile(self, i: int) -> gpd.GeoDataFrame:
+        with self._lock:
+            gdf = self._loaded.get(i)
+            if gdf is not None:
+                self._loaded.move_to_end(i)
+                return gdf
+
+        gdf = gpd.read_file(os.path.join(self.layer_dir, self._tiles[i]["file"]))
+        if gdf.crs is None:
+            gdf = gdf.set_crs(epsg=4326)
+        elif gdf.crs.to_epsg() != 4326:
+            gdf = gdf.to_crs(epsg=4326)
+        gdf.sindex  # construye el índice espacial una vez
+
+        with self._lock:
+            self._loaded[i] = gdf
+            while len(self._loaded) > self.max_tiles:
+                self._loaded.popitem(last=False)
+        return gdf
+
+    def tiles_for(self, geom) -> List[int]:
+        return [int(i) for i in self._tile_tree.query(geom, predicate="intersects")]
+
+    def locate(self, lat: float, lon: float, max_distance_m: float = 300) -> Dict:
+        """
+        Polígono que contiene el punto (misma semántica que
+        find_municipio_inegi: within -> buffer ~5 m -> nearest).
+        """
+        pt = Point(lon, lat)
+
+        # 1. Within
+        for i in self.tiles_for(pt):
+            gdf = self._get_tile(i)
+            hits = gdf.sindex.query(pt, predicate="within")
+            if len(hits):
+                return gdf.iloc[hits[0]].drop("geometry").to_dict()
+
+        # 2. Buffer (~5 m) y 3. Nearest, sobre teselas cercanas
+        deg = max_distance_m / 111_320
+        area = pt.buffer(deg)
+        best, best_d = None, np.inf
+        for i in self.tiles_for(area):
+            gdf = self._get_tile(i)
+            idx = gdf.sindex.query(area, predicate="intersects")
+            if not len(idx):
+                continue
+            d = gdf.geometry.iloc[idx].distance(pt).to_numpy() * 111_320
+            j = int(np.argmin(d))
+            if d[j] < best_d:
+                best, best_d = gdf.iloc[idx[j]], d[j]
+
+        if best is not None and best_d <= max_distance_m:
+            return best.drop("geometry").to_dict()
+
+        return {"INEGI_FOUND": False}
+
+
+_TILED_LAYERS: Dict[str, TiledInegiLayer] = {}
+_TILED_LOCK = threading.Lock()
+
+
+def get_tiled_layer(layer_dir: str, max_tiles: int = 8) -> TiledInegiLayer | None:
+    """
+    Capa teselada (singleton por directorio); None si no existe.
+    """
+    if not os.path.exists(os.path.join(layer_dir, "index.json")):
+        return None
+    with _TILED_LOCK:
+        layer = _TILED_LAYERS.get(layer_dir)
+        if layer is None:
+            layer = TiledInegiLayer(layer_dir, max_tiles=max_tiles)
+            _TILED_LAYERS[layer_dir] = layer
+        return layer
+
+
+def find_ageb_inegi(
+    lat: float,
+    lon: float,
+    layer_dir: str = INEGI_AGEB_DIR
+) -> Dict:
+    """
+    AGEB que contiene el punto (requiere capa teselada).
+    Llaves con prefijo AGEB_ para no chocar con las del municipio.
+    """
+    layer = get_tiled_layer(layer_dir)
+    if layer is None:
+        return {}
+
+    hit = layer.locate(lat, lon)
+    if hit.get("INEGI_FOUND") is False:
+        return {"AGEB_FOUND": False}
+    return {f"AGEB_{k}": v for k, v in hit.items()}
+
+
 # =====================================================
 # PREFIX KEYS (TU FUNCIÓN ORIGINAL)
 # =====================================================
@@ -0,0 +1,242 @@
+# expansion/inegi_grid.py
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict
+
+import numpy as np
+import geopandas as gpd
+import shapely
+from shapely.geometry import Point, box
+from shapely.strtree import STRtree
+
+from expansion.inegi_loader import INEGI_CACHE_DIR, INEGI_LOCAL_DIR, convert_inegi_layer
+
+
+# =====================================================
+# CONFIG
+# =====================================================
+DEFAULT_GRID_PATH = os.path.join(INEGI_CACHE_DIR, "municipios_grid.npz")
+DEFAULT_MUNICIPIOS_SHP = os.path.join(INEGI_LOCAL_DIR, "00mun.shp")
+DEFAULT_RES_DEG = 0.01          # ~1.1 km
+DEFAULT_SIMPLIFY_TOL_DEG = 0.0005  # ~55 m
+
+CELL_OUTSIDE = 0
+CELL_BOUNDARY = -1
+
+METERS_PER_DEG = 111_320
+
+
+# =====================================================
+# CONSTRUCCIÓN (OFFLINE)
+# =====================================================
+def build_municipio_grid(
+    gdf_inegi: gpd.GeoDataFrame,
+    out_path: str = DEFAULT_GRID_PATH,
+    *,
+    res_deg: float = DEFAULT_RES_DEG,
+    simplify_tol_deg: float = DEFAULT_SIMPLIFY_TOL_DEG
+) -> str:
+    """
+    Rasteriza los municipios a una malla regular (int16):
+
+    -  k > 0 : celda totalmente dentro del municipio k-1
+    -  0     : fuera de todo municipio
+    - -1     : celda que toca un borde (requiere prueba exacta)
+
+    Guarda además atributos (sin geometría) y geometrías simplificadas
+    en WKB (hex), todo en un .npz compacto.
+    """
+    gdf = gdf_inegi.to_crs(epsg=4326).reset_index(drop=True)
+    if len(gdf) >= np.iinfo(np.int16).max:
+        raise ValueError("Demasiados polígonos para una malla int16")
+
+    minx, miny, maxx, maxy = gdf.total_bounds
+    nx = int(np.ceil((maxx - minx) / res_deg))
+    ny = int(np.ceil((maxy - miny) / res_deg))
+    grid = np.zeros((ny, nx), dtype=np.int16)
+
+    for k, geom in enumerate(gdf.geometry.values):
+        shapely.prepare(geom)
+        gx0, gy0, gx1, gy1 = geom.bounds
+        i0 = max(int((gy0 - miny) // res_deg), 0)
+        i1 = min(int((gy1 - miny) // res_deg) + 1, ny)
+        j0 = max(int((gx0 - minx) // res_deg), 0)
+        j1 = min(int((gx1 - minx) // res_deg) + 1, nx)
+
+        jj, ii = np.meshgrid(np.arange(j0, j1), np.arange(i0, i1))
+        cells = shapely.box(
+            minx + jj * res_deg, miny + ii * res_deg,
+            minx + (jj + 1) * res_deg, miny + (ii + 1) * res_deg
+        )
+
+        inside = shapely.contains_properly(geom, cells)
+        touches = shapely.intersects(geom, cells) & ~inside
+
+        block = grid[i0:i1, j0:j1]
+        block[inside] = k + 1
+        block[touches] = CELL_BOUNDARY
+
+    attrs = gdf.drop(columns="geometry")
+    # WKB en hex: el dtype "S" de NumPy recortaría bytes nulos finales
+    simplified = shapely.to_wkb(
+        shapely.simplify(gdf.geometry.values, simplify_tol_deg, preserve_topology=True),
+        hex=True
+    )
+
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    tmp = f"{out_path}.tmp.npz"
+    np.savez_compressed(
+        tmp,
+        grid=grid,
+        origin=np.array([minx, miny]),
+        res=np.array(res_deg),
+        simplify_tol=np.array(simplify_tol_deg),
+        attrs=np.array(attrs.to_json(orient="records", force_ascii=False)),
+        simplified=np.array(list(simplified)),
+    )
+    os.replace(tmp, out_path)
+    return out_path
+
+
+# =====================================================
+# LOCALIZADOR DE DOS NIVELES
+# =====================================================
+class MunicipioGridLocator:
+    """
+    Nivel 1: lectura de la malla (celdas interiores, O(1)).
+    Nivel 2 (solo celdas de borde / fuera): prueba contra geometría
+    simplificada; si el punto queda a menos de la tolerancia de su
+    borde, se confirma con la geometría completa, que se lee por
+    bbox del cache FlatGeobuf (EPSG:4326, con índice espacial; ver
+    inegi_loader.convert_inegi_layer) y se cachea (LRU) — nunca se
+    carga la capa completa.
+    """
+
+    def __init__(
+        self,
+        grid_path: str = DEFAULT_GRID_PATH,
+        full_path: str | None = None,
+        max_full_geoms: int = 64
+    ):
+        """
+        full_path: FlatGeobuf 4326 de la capa; por defecto el cache
+        del shapefile de municipios.
+        """
+        with np.load(grid_path, allow_pickle=False) as z:
+            self._grid = z["grid"]
+            self._minx, self._miny = z["origin"].tolist()
+            self._res = float(z["res"])
+            self._tol = float(z["simplify_tol"])
+            self._attrs = json.loads(str(z["attrs"]))
+            simplified = shapely.from_wkb(z["simplified"].tolist())
+
+        self._simplified = simplified
+        shapely.prepare(self._simplified)
+        self._tree = STRtree(self._simplified)
+
+        self.full_path = full_path or convert_inegi_layer(DEFAULT_MUNICIPIOS_SHP)[4326]
+        self.max_full_geoms = max_full_geoms
+        self._full: "OrderedDict[int, object]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.stats = {"grid": 0, "simplificada": 0, "completa": 0, "sin_match": 0}
+
+    # -------------------------------------------------
+    # GEOMETRÍA COMPLETA (LAZY)
+    # -------------------------------------------------
+    def _full_geometry(self, k: int):
+        with self._lock:
+            geom = self._full.get(k)
+            if geom is not None:
+                self._full.move_to_end(k)
+                return geom
+
+        cvegeo = self._attrs[k].get("CVEGEO")
+        part = gpd.read_file(self.full_path, bbox=box(*self._simplified[k].bounds).buffer(self._tol))
+        part = part[part["CVEGEO"].astype(str) == str(cvegeo)]
+        geom = part.geometry.iloc[0] if not part.empty else self._simplified[k]
+
+        with self._lock:
+            self._full[k] = geom
+            while len(self._full) > self.max_full_geoms:
+                self._full.popitem(last=False)
+        return geom
+
+    def _exact_contains(self, k: int, pt: Point) -> bool:
+        simple = self._simplified[k]
+        near_edge = simple.boundary.distance(pt) <= self._tol
+        if not near_edge:
+            self.stats["simplificada"] += 1
+            return simple.contains(pt)
+        self.stats["completa"] += 1
+        return self._full_geometry(k).covers(pt)
+
+    # -------------------------------------------------
+    # CONSULTA
+    # -------------------------------------------------
+    def find(self, lat: float, lon: float, max_distance_m: float = 300) -> Dict:
+        """
+        Mismo resultado que inegi.find_municipio_inegi
+        (atributos del municipio sin geometría).
+        """
+        i = int((lat - self._miny) // self._res)
+        j = int((lon - self._minx) // self._res)
+
+        if 0 <= i < self._grid.shape[0] and 0 <= j < self._grid.shape[1]:
+            v = int(self._grid[i, j])
+            if v > 0:
+                self.stats["grid"] += 1
+                return dict(self._attrs[v - 1])
+
+        pt = Point(lon, lat)
+
+        tol_area = pt.buffer(self._tol)
+        for k in self._tree.query(tol_area, predicate="intersects"):
+            if self._exact_contains(int(k), pt):
+                return dict(self._attrs[int(k)])
+
+        # Nearest (hasta max_distance_m), verificado con geometría completa
+        deg = max_distance_m / METERS_PER_DEG
+        best, best_d = None, np.inf
+        for k in self._tree.query(pt.buffer(deg), predicate="intersects"):
+            d = self._full_geometry(int(k)).distance(pt)
+            if d < best_d:
+                best, best_d = int(k), d
+
+        if best is not None and best_d <= deg:
+            return dict(self._attrs[best])
+
+        self.stats["sin_match"] += 1
+        return {"INEGI_FOUND": False}
+
+
+# =====================================================
+# CARGA (WARMUP)
+# =====================================================
+def load_municipio_locator(
+    src_path: str = DEFAULT_MUNICIPIOS_SHP,
+    *,
+    gdf_inegi: gpd.GeoDataFrame | None = None,
+    grid_path: str = DEFAULT_GRID_PATH,
+    cache_dir: str = INEGI_CACHE_DIR
+) -> MunicipioGridLocator:
+    """
+    Localizador listo para consultas. La malla se (re)construye solo
+    si no existe o es más vieja que el cache FlatGeobuf (el
+    shapefile cambió); `gdf_inegi` evita releer la capa si ya está
+    en memoria.
+    """
+    full_path = convert_inegi_layer(src_path, cache_dir)[4326]
+
+    if (
+        not os.path.exists(grid_path)
+        or os.stat(grid_path).st_mtime_ns < os.stat(full_path).st_mtime_ns
+    ):
+        if gdf_inegi is None:
+            gdf_inegi = gpd.read_file(full_path)
+        build_municipio_grid(gdf_inegi, grid_path)
+
+    return MunicipioGridLocator(grid_path, full_path)
@@ -1,7 +1,43 @@
 import os
+import json
+import shutil
 import subprocess
 
 INEGI_LOCAL_DIR = "data/inegi/municipios"
+INEGI_AGEB_DIR = "data/inegi/ageb"
+INEGI_CACHE_DIR = "data/inegi/cache"
+
+# Proyección métrica usada en buffers / nearest
+INEGI_PROJECTED_EPSG = 6372
+
+
+def sync_inegi_dataset(
+    manifest_path: str,
+    *,
+    mirror_dir: str | None = None,
+    base_url: str | None = None,
+    target_dir: str = INEGI_LOCAL_DIR
+) -> dict:
+    """
+    Sincroniza los shapefiles INEGI contra un manifest
+    (tamaños + sha256): repara archivos faltantes o corruptos,
+    descarga en paralelo, reanuda y reemplaza el directorio
+    de forma atómica. Si ya está íntegro no descarga nada.
+    """
+    from expansion.dataset_sync import sync_dataset, verify_dataset
+
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    if os.path.exists(target_dir) and not verify_dataset(manifest, target_dir):
+        return {"reutilizados": [e["path"] for e in manifest["files"]], "descargados": []}
+
+    return sync_dataset(
+        manifest=manifest,
+        target_dir=target_dir,
+        mirror_dir=mirror_dir,
+        base_url=base_url
+    )
 
 
 def download_inegi_from_drive(folder_id: str):
@@ -27,3 +63,144 @@ def download_inegi_from_drive(folder_id: str):
         ],
         check=True
     )
+
+
+
+def build_tiled_layer(
+    src_path: str,
+    out_dir: str,
+    *,
+    layer: str,
+    tile_col: str = "CVE_ENT",
+    driver: str = "FlatGeobuf",
+    ext: str = "fgb"
+) -> dict:
+    """
+    Convierte una capa INEGI grande (AGEB / manzana) al layout
+    teselado que usa inegi.TiledInegiLayer: un archivo por valor
+    de `tile_col` (estado) + index.json con bbox por tesela.
+
+    Se corre una vez offline; el index se escribe al final de
+    forma atómica, así una conversión interrumpida no queda visible.
+    """
+    import geopandas as gpd
+
+    gdf = gpd.read_file(src_path)
+    if gdf.crs is None:
+        gdf = gdf.set_crs(epsg=4326)
+    elif gdf.crs.to_epsg() != 4326:
+        gdf = gdf.to_crs(epsg=4326)
+
+    tiles_dir = os.path.join(out_dir, "tiles")
+    os.makedirs(tiles_dir, exist_ok=True)
+
+    tiles = []
+    for key, part in gdf.groupby(tile_col, sort=True):
+        fname = f"{key}.{ext}"
+        part.to_file(os.path.join(tiles_dir, fname), driver=driver)
+        tiles.append({
+            "file": f"tiles/{fname}",
+            "key": str(key),
+            "bbox": [float(v) for v in part.total_bounds],
+            "n": int(len(part)),
+        })
+
+    index = {"layer": layer, "crs": "EPSG:4326", "tiles": tiles}
+
+    tmp = os.path.join(out_dir, "index.json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, os.path.join(out_dir, "index.json"))
+
+    return index
+
+
+
+# =====================================================
+# CACHE FLATGEOBUF (4326 + 6372)
+# =====================================================
+def _source_signature(path: str) -> list:
+    """
+    Firma del shapefile (todas las partes .shp/.dbf/.shx/.prj).
+    """
+    root, _ = os.path.splitext(path)
+    sig = []
+    for ext in (".shp", ".dbf", ".shx", ".prj", ".cpg"):
+        part = root + ext
+        if os.path.exists(part):
+            st = os.stat(part)
+            sig.append([ext, st.st_mtime_ns, st.st_size])
+    return sig
+
+
+def cached_layer_paths(src_path: str, cache_dir: str = INEGI_CACHE_DIR) -> dict:
+    name = os.path.splitext(os.path.basename(src_path))[0]
+    return {
+        4326: os.path.join(cache_dir, f"{name}_4326.fgb"),
+        INEGI_PROJECTED_EPSG: os.path.join(cache_dir, f"{name}_{INEGI_PROJECTED_EPSG}.fgb"),
+        "meta": os.path.join(cache_dir, f"{name}.meta.json"),
+    }
+
+
+def convert_inegi_layer(src_path: str, cache_dir: str = INEGI_CACHE_DIR, force: bool = False) -> dict:
+    """
+    Convierte una capa INEGI (shapefile) UNA vez a FlatGeobuf con
+    índice espacial, en EPSG:4326 y en EPSG:6372. Se reconvierte
+    solo si cambia el shapefile fuente.
+    """
+    import geopandas as gpd
+
+    paths = cached_layer_paths(src_path, cache_dir)
+    signature = _source_signature(src_path)
+
+    if not force and os.path.exists(paths["meta"]):
+        with open(paths["meta"], "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("signature") == signature and all(
+            os.path.exists(paths[k]) for k in (4326, INEGI_PROJECTED_EPSG)
+        ):
+            return paths
+
+    os.makedirs(cache_dir, exist_ok=True)
+
+    gdf = gpd.read_file(src_path)
+    if gdf.crs is None:
+        gdf = gdf.set_crs(epsg=4326)
+    elif gdf.crs.to_epsg() != 4326:
+        gdf = gdf.to_crs(epsg=4326)
+
+    for epsg, layer in ((4326, gdf), (INEGI_PROJECTED_EPSG, gdf.to_crs(epsg=INEGI_PROJECTED_EPSG))):
+        # El temporal debe terminar en .fgb: sin extensión GDAL crea
+        # un dataset directorio y os.replace falla al reconvertir
+        tmp = os.path.splitext(paths[epsg])[0] + ".tmp.fgb"
+        if os.path.isdir(tmp):
+            shutil.rmtree(tmp)
+        elif os.path.exists(tmp):
+            os.remove(tmp)
+        layer.to_file(tmp, driver="FlatGeobuf", SPATIAL_INDEX="YES")
+        os.replace(tmp, paths[epsg])
+
+    tmp = paths["meta"] + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"source": src_path, "signature": signature}, f)
+    os.replace(tmp, paths["meta"])
+
+    return paths
+
+
+def load_inegi_cached(
+    src_path: str,
+    *,
+    epsg: int = 4326,
+    bbox: tuple | None = None,
+    cache_dir: str = INEGI_CACHE_DIR
+):
+    """
+    Lee la capa desde el cache FlatGeobuf (convirtiendo si hace falta).
+    Con `bbox` (minx, miny, maxx, maxy, en el CRS pedido) solo se leen
+    las geometrías que lo intersectan, vía el índice del archivo.
+    """
+    import geopandas as gpd
+
+    paths = convert_inegi_layer(src_path, cache_dir)
+    return gpd.read_file(paths[epsg], bbox=bbox)
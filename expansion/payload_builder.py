@@ -1,8 +1,132 @@
+import math
+from dataclasses import dataclass, field
 from datetime import datetime
 from typing import Dict, Any
 
 
-def build_payload_flat(
+# --------------------------------------------------
+# CAMPOS FIJOS DE TIENDA NETO CERCANA (orden legacy)
+# --------------------------------------------------
+NETO_FIELDS = (
+    "id_tienda_cercana",
+    "distancia_tienda_cercana_km",
+
+    "tienda_cercanaExistencia_Costo",
+    "tienda_cercanaExistencia_Piezas",
+    "tienda_cercanaVenta_Sin_Impuestos",
+    "tienda_cercanaVenta_Costo",
+    "tienda_cercanaVenta_Piezas",
+    "tienda_cercanaTransacciones",
+    "tienda_cercanaTicket_Promedio",
+    "tienda_cercanaProm_Cantidad",
+    "tienda_cercanaProm_Monto_Sin_Imp",
+)
+
+
+def _clean(v):
+    """
+    NaN / inf -> None (y escalares NumPy -> Python) en una pasada.
+    Solo recorre contenedores anidados (listas de competencia).
+    """
+    if isinstance(v, float):
+        return None if math.isnan(v) or math.isinf(v) else v
+    if isinstance(v, (str, int, bool)) or v is None:
+        return v
+    if isinstance(v, dict):
+        return {k: _clean(x) for k, x in v.items()}
+    if isinstance(v, (list, tuple)):
+        return [_clean(x) for x in v]
+    if hasattr(v, "item"):  # escalar NumPy
+        return _clean(v.item())
+    return v
+
+
+def _clean_flat(d: Dict[str, Any] | None) -> Dict[str, Any]:
+    return {k: _clean(v) for k, v in (d or {}).items()}
+
+
+# --------------------------------------------------
+# REGISTRO TIPADO
+# --------------------------------------------------
+@dataclass(slots=True)
+class PayloadFlat:
+    """
+    Payload del sitio con campos fijos tipados y bloques variables
+    (INEGI_*, conteos Places, competencia). Los NaN / inf se
+    convierten a None al construirse; to_json serializa en un paso.
+    """
+    lat: float
+    longitud: float
+    timestamp: str
+    fuente: str
+
+    estado: str | None = None
+    region: str | None = None
+
+    neto: Dict[str, Any] = field(default_factory=dict)
+    inegi: Dict[str, Any] = field(default_factory=dict)
+    places: Dict[str, Any] = field(default_factory=dict)
+    competencia: Dict[str, Any] = field(default_factory=dict)
+
+    def __post_init__(self):
+        self.lat = _clean(self.lat)
+        self.longitud = _clean(self.longitud)
+        self.neto = {k: _clean(self.neto.get(k)) for k in NETO_FIELDS}
+        self.inegi = _clean_flat(self.inegi)
+        self.places = _clean_flat(self.places)
+        self.competencia = _clean_flat(self.competencia)
+
+    # -------------------------------------------------
+    # SALIDAS
+    # -------------------------------------------------
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Dict PLANO legacy-compatible (mismo orden de llaves que
+        build_payload_flat histórico).
+        """
+        return {
+            "timestamp": self.timestamp,
+            "fuente": self.fuente,
+            "lat": self.lat,
+            "longitud": self.longitud,
+            "estado": self.estado,
+            "region": self.region,
+            **self.neto,
+            **self.inegi,
+            **self.places,
+            **self.competencia,
+        }
+
+    def to_json(self) -> bytes:
+        return dumps_json(self.to_dict())
+
+    def to_arrow(self):
+        """
+        Registro Arrow (1 fila) para sinks columnares.
+        Los valores anidados (listas de competencia) van como JSON.
+        """
+        import pyarrow as pa
+
+        row = {
+            k: (dumps_json(v).decode("utf-8") if isinstance(v, (dict, list)) else v)
+            for k, v in self.to_dict().items()
+        }
+        return pa.RecordBatch.from_pylist([row])
+
+
+def dumps_json(obj) -> bytes:
+    """
+    Serialización rápida (orjson). NaN / inf -> null, NumPy nativo.
+    """
+    import orjson
+
+    return orjson.dumps(
+        obj,
+        option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+    )
+
+
+def build_payload_record(
     *,
     lat: float,
     lon: float,
@@ -21,58 +145,61 @@ def build_payload_flat(
 
     # COMPETENCIA (incluye counts + columnas por cadena)
     competencia_data: Dict[str, Any],
-):
+) -> PayloadFlat:
     """
-    Construye el payload FINAL, PLANO y legacy-compatible.
+    Construye el payload como registro tipado.
     """
-
-    payload = {
+    return PayloadFlat(
         # --------------------------------------------------
         # METADATA
         # --------------------------------------------------
-        "timestamp": datetime.utcnow().isoformat(),
-        "fuente": fuente,
-        "lat": lat,
-        "longitud": lon,
+        timestamp=datetime.utcnow().isoformat(),
+        fuente=fuente,
+        lat=lat,
+        longitud=lon,
 
         # --------------------------------------------------
         # ESTADO / REGION (desde tienda cercana)
         # --------------------------------------------------
-        "estado": neto_data.get("estado"),
-        "region": neto_data.get("region"),
-    }
-
-    # --------------------------------------------------
-    # TIENDA NETO CERCANA (PLANO)
-    # --------------------------------------------------
-    payload.update({
-        "id_tienda_cercana": neto_data.get("id_tienda_cercana"),
-        "distancia_tienda_cercana_km": neto_data.get("distancia_tienda_cercana_km"),
-
-        "tienda_cercanaExistencia_Costo": neto_data.get("tienda_cercanaExistencia_Costo"),
-        "tienda_cercanaExistencia_Piezas": neto_data.get("tienda_cercanaExistencia_Piezas"),
-        "tienda_cercanaVenta_Sin_Impuestos": neto_data.get("tienda_cercanaVenta_Sin_Impuestos"),
-        "tienda_cercanaVenta_Costo": neto_data.get("tienda_cercanaVenta_Costo"),
-        "tienda_cercanaVenta_Piezas": neto_data.get("tienda_cercanaVenta_Piezas"),
-        "tienda_cercanaTransacciones": neto_data.get("tienda_cercanaTransacciones"),
-        "tienda_cercanaTicket_Promedio": neto_data.get("tienda_cercanaTicket_Promedio"),
-        "tienda_cercanaProm_Cantidad": neto_data.get("tienda_cercanaProm_Cantidad"),
-        "tienda_cercanaProm_Monto_Sin_Imp": neto_data.get("tienda_cercanaProm_Monto_Sin_Imp"),
-    })
-
-    # --------------------------------------------------
-    # INEGI (YA PREFIJADO)
-    # --------------------------------------------------
-    payload.update(inegi_data)
-
-    # --------------------------------------------------
-    # GOOGLE PLACES (conteos planos)
-    # --------------------------------------------------
-    payload.update(places_count)
+        estado=neto_data.get("estado"),
+        region=neto_data.get("region"),
+
+        neto=neto_data,
+        inegi=inegi_data,
+        places=places_count,
+        competencia=competencia_data,
+    )
+
+
+def build_payload_flat(
+    *,
+    lat: float,
+    lon: float,
 
-    # --------------------------------------------------
-    # COMPETENCIA (counts + columnas por cadena)
-    # --------------------------------------------------
-    payload.update(competencia_data)
+    # metadata
+    fuente: str = "expansion_pipeline_v1",
 
-    return payload
+    # NETO
+    neto_data: Dict[str, Any],
+
+    # INEGI (YA con llaves INEGI_*)
+    inegi_data: Dict[str, Any],
+
+    # GOOGLE PLACES (conteos planos)
+    places_count: Dict[str, Any],
+
+    # COMPETENCIA (incluye counts + columnas por cadena)
+    competencia_data: Dict[str, Any],
+):
+    """
+    Construye el payload FINAL, PLANO y legacy-compatible.
+    """
+    return build_payload_record(
+        lat=lat,
+        lon=lon,
+        fuente=fuente,
+        neto_data=neto_data,
+        inegi_data=inegi_data,
+        places_count=places_count,
+        competencia_data=competencia_data,
+    ).to_dict()
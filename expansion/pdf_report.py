@@ -1,10 +1,15 @@
 from reportlab.lib.pagesizes import A4, landscape
 from reportlab.lib.colors import HexColor, black, white
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.utils import ImageReader
 from reportlab.platypus import (
-    SimpleDocTemplate, Paragraph, Table, TableStyle, Image, Spacer
+    SimpleDocTemplate, Paragraph, Table, TableStyle, Image, Spacer,
+    Flowable, PageBreak
 )
 from reportlab.lib.units import cm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from functools import lru_cache
 import numpy as np
 import os
 
@@ -23,6 +28,12 @@ YELLOW_TX = HexColor("#9A7B00")
 RED_BG = HexColor("#FDE2E2")
 RED_TX = HexColor("#9B1C1C")
 
+# Fuentes TTF opcionales: {nombre_reportlab: ruta_ttf}
+# Si el archivo no existe se usa Helvetica (built-in).
+CUSTOM_FONTS = {}
+
+DECISION_POINTS = {"AVANZAR": 2, "EVALUAR": 1, "DESCARTAR": 0}
+
 
 # ======================================================
 # UTILIDADES
@@ -44,7 +55,12 @@ def _fmt(val):
     return str(val)
 
 
+@lru_cache(maxsize=1)
 def _build_styles():
+    """
+    Hoja de estilos NETO. Se construye una sola vez por proceso.
+    """
+    _register_fonts()
     styles = getSampleStyleSheet()
 
     def add(ps):
@@ -60,6 +76,81 @@ def _build_styles():
     return styles
 
 
+@lru_cache(maxsize=1)
+def _register_fonts():
+    """
+    Registra las fuentes TTF de CUSTOM_FONTS una sola vez por proceso.
+    """
+    registered = []
+    for name, path in CUSTOM_FONTS.items():
+        if name in pdfmetrics.getRegisteredFontNames():
+            registered.append(name)
+            continue
+        if os.path.exists(path):
+            pdfmetrics.registerFont(TTFont(name, path))
+            registered.append(name)
+    return tuple(registered)
+
+
+@lru_cache(maxsize=8)
+def _load_image_reader(path: str) -> ImageReader:
+    """
+    Decodifica una imagen (logo) una sola vez y la reutiliza.
+    """
+    return ImageReader(path)
+
+
+class _CachedImage(Flowable):
+    """
+    Flowable que dibuja un ImageReader ya decodificado
+    (evita re-leer / re-decodificar el logo en cada reporte).
+    """
+
+    def __init__(self, reader: ImageReader, width: float, height: float):
+        super().__init__()
+        self.reader = reader
+        self.width = width
+        self.height = height
+
+    def wrap(self, availWidth, availHeight):
+        return self.width, self.height
+
+    def draw(self):
+        self.canv.drawImage(
+            self.reader, 0, 0,
+            width=self.width, height=self.height, mask="auto"
+        )
+
+
+def warm_report_resources(logo_path: str | None = None):
+    """
+    Precarga estilos, fuentes y logo (útil como initializer de workers).
+    """
+    _build_styles()
+    if logo_path and os.path.exists(logo_path):
+        _load_image_reader(logo_path)
+
+
+def _new_doc(output_path: str) -> SimpleDocTemplate:
+    return SimpleDocTemplate(
+        output_path,
+        pagesize=landscape(A4),
+        rightMargin=1.5 * cm,
+        leftMargin=1.5 * cm,
+        topMargin=1.2 * cm,
+        bottomMargin=1.2 * cm
+    )
+
+
+def _header_table_style():
+    return TableStyle([
+        ("BACKGROUND", (0, 0), (-1, 0), NETO_BLUE),
+        ("TEXTCOLOR", (0, 0), (-1, 0), white),
+        ("GRID", (0, 0), (-1, -1), 0.25, black),
+        ("PADDING", (0, 0), (-1, -1), 6),
+    ])
+
+
 def _build_tienda_cercana_rows(payload: dict):
     return [
         ["ID tienda", _fmt(payload.get("id_tienda_cercana"))],
@@ -72,34 +163,28 @@ def _build_tienda_cercana_rows(payload: dict):
 
 
 # ======================================================
-# FUNCIÓN PRINCIPAL
+# SECCIÓN POR SITIO
 # ======================================================
-def generate_expansion_pdf(
+def _build_site_story(
     *,
     payload: dict,
     df_benchmark,
     decision_modelo_1: dict,
     decision_modelo_2: dict,
-    output_path: str,
     logo_path: str,
     site_image_path: str | None = None
-):
+) -> list:
+    """
+    Arma los flowables de un sitio (se reutiliza en el reporte
+    individual y en el libro de portafolio).
+    """
 
     styles = _build_styles()
 
-    doc = SimpleDocTemplate(
-        output_path,
-        pagesize=landscape(A4),
-        rightMargin=1.5 * cm,
-        leftMargin=1.5 * cm,
-        topMargin=1.2 * cm,
-        bottomMargin=1.2 * cm
-    )
-
     story = []
 
     # ================= HEADER =================
-    logo = Image(logo_path, width=3.8 * cm, height=3.8 * cm)
+    logo = _CachedImage(_load_image_reader(logo_path), 3.8 * cm, 3.8 * cm)
 
     title = Paragraph("Evaluación de sitio – Expansión NETO", styles["NetoTitle"])
 
@@ -210,4 +295,119 @@ def generate_expansion_pdf(
 
     story.append(decisions)
 
-    doc.build(story)
+    return story
+
+
+# ======================================================
+# FUNCIÓN PRINCIPAL
+# ======================================================
+def generate_expansion_pdf(
+    *,
+    payload: dict,
+    df_benchmark,
+    decision_modelo_1: dict,
+    decision_modelo_2: dict,
+    output_path: str,
+    logo_path: str,
+    site_image_path: str | None = None
+):
+
+    story = _build_site_story(
+        payload=payload,
+        df_benchmark=df_benchmark,
+        decision_modelo_1=decision_modelo_1,
+        decision_modelo_2=decision_modelo_2,
+        logo_path=logo_path,
+        site_image_path=site_image_path
+    )
+
+    _new_doc(output_path).build(story)
+
+    return output_path
+
+
+# ======================================================
+# PORTAFOLIO (LIBRO MULTI-SITIO)
+# ======================================================
+def _site_rank_key(site: dict):
+    d1 = site["decision_modelo_1"]["decision"].upper()
+    d2 = site["decision_modelo_2"]["decision"].upper()
+    score = site["payload"].get("integracion_score")
+    score = score if isinstance(score, (int, float)) and score == score else -1
+    return (DECISION_POINTS.get(d1, 0) + DECISION_POINTS.get(d2, 0), score)
+
+
+def _build_portfolio_summary(sites: list, title: str) -> list:
+    styles = _build_styles()
+
+    rows = [["#", "Folio", "Región", "Modelo 1", "Modelo 2", "Integración", "Dist. NETO (km)"]]
+    for i, site in enumerate(sites, start=1):
+        p = site["payload"]
+        dist = p.get("distancia_tienda_cercana_km")
+        rows.append([
+            str(i),
+            str(p.get("id_ubicacion", "-")),
+            str(p.get("region", "-")),
+            site["decision_modelo_1"]["decision"].upper(),
+            site["decision_modelo_2"]["decision"].upper(),
+            _fmt(p.get("integracion_score")),
+            f"{dist:.2f}" if isinstance(dist, (int, float)) and dist == dist else "-",
+        ])
+
+    table = Table(
+        rows,
+        colWidths=[1.2*cm, 4.5*cm, 5*cm, 3.5*cm, 3.5*cm, 3.5*cm, 4*cm],
+        repeatRows=1
+    )
+    style = _header_table_style()
+    for i, site in enumerate(sites, start=1):
+        for col, key in ((3, "decision_modelo_1"), (4, "decision_modelo_2")):
+            bg, tx = _decision_colors(site[key]["decision"])
+            style.add("BACKGROUND", (col, i), (col, i), bg)
+            style.add("TEXTCOLOR", (col, i), (col, i), tx)
+    table.setStyle(style)
+
+    return [
+        Paragraph(title, styles["NetoTitle"]),
+        Spacer(1, 8),
+        Paragraph(f"Sitios evaluados: <b>{len(sites)}</b>", styles["NetoSubtitle"]),
+        Spacer(1, 12),
+        table,
+    ]
+
+
+def generate_portfolio_pdf(
+    *,
+    sites: list,
+    output_path: str,
+    logo_path: str,
+    title: str = "Portafolio de sitios – Expansión NETO"
+):
+    """
+    Genera UN solo PDF con tabla resumen rankeada + una sección
+    por sitio, en una sola pasada de layout.
+
+    Cada elemento de `sites` es un dict con las mismas llaves
+    que generate_expansion_pdf (sin output_path / logo_path):
+    payload, df_benchmark, decision_modelo_1, decision_modelo_2,
+    site_image_path (opcional).
+    """
+
+    ranked = sorted(sites, key=_site_rank_key, reverse=True)
+
+    story = _build_portfolio_summary(ranked, title)
+
+    for site in ranked:
+        story.append(PageBreak())
+        story += _build_site_story(
+            payload=site["payload"],
+            df_benchmark=site["df_benchmark"],
+            decision_modelo_1=site["decision_modelo_1"],
+            decision_modelo_2=site["decision_modelo_2"],
+            logo_path=logo_path,
+            site_image_path=site.get("site_image_path")
+        )
+
+    _new_doc(output_path).build(story)
+
+    return output_path
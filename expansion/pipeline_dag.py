@@ -0,0 +1,333 @@
+# expansion/pipeline_dag.py
+
+import hashlib
+import importlib.util
+import inspect
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import TimeoutError as FuturesTimeout
+from typing import Any, Callable, Dict, List, Iterable
+
+from expansion.deadline import (
+    ASSEMBLY_RESERVE_MS,
+    Deadline,
+    abandon,
+    get_stage_executor,
+    stage_pool_saturated,
+    submit_refinement,
+)
+
+
+# =====================================================
+# CONFIG
+# =====================================================
+DEFAULT_CACHE_DIR = os.environ.get("PIPELINE_CACHE_DIR", "data/pipeline_cache")
+MEMORY_MAX_ENTRIES = int(os.environ.get("PIPELINE_MEMORY_ENTRIES", "256"))
+
+_TIMED_OUT = object()
+
+
+# =====================================================
+# HASHING
+# =====================================================
+def _code_fingerprint(obj) -> str:
+    """
+    Huella del código de una función / módulo (fuente si está
+    disponible; bytecode si no). Un str se toma como nombre de
+    módulo y se lee su archivo SIN importarlo (los módulos pesados
+    siguen siendo lazy).
+    """
+    if isinstance(obj, str):
+        spec = importlib.util.find_spec(obj)
+        if spec is None or not spec.origin or not os.path.exists(spec.origin):
+            return hashlib.sha256(obj.encode("utf-8")).hexdigest()[:16]
+        with open(spec.origin, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()[:16]
+    try:
+        src = inspect.getsource(obj)
+    except (OSError, TypeError):
+        code = getattr(obj, "__code__", None)
+        src = repr((code.co_code, code.co_consts)) if code else repr(obj)
+    return hashlib.sha256(src.encode("utf-8")).hexdigest()[:16]
+
+
+def _stable_repr(value) -> str:
+    if isinstance(value, dict):
+        return "{" + ",".join(f"{k!r}:{_stable_repr(value[k])}" for k in sorted(value, key=str)) + "}"
+    if isinstance(value, (list, tuple)):
+        return "[" + ",".join(_stable_repr(v) for v in value) + "]"
+    return repr(value)
+
+
+def hash_inputs(*parts) -> str:
+    h = hashlib.sha256()
+    for p in parts:
+        h.update(_stable_repr(p).encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+# =====================================================
+# NODO
+# =====================================================
+class Node:
+    """
+    Etapa del pipeline.
+
+    - fn(ctx, params, **deps) -> salida
+    - params: nombres de parámetros del request que usa la etapa
+    - context_keys: recursos de contexto cuya versión entra al hash
+      (p.ej. "df_neto" -> ctx_versions["df_neto"])
+    - code_refs: funciones / módulos (o nombres de módulo) extra cuyo
+      código entra al hash (p.ej. el prompt builder para la etapa LLM)
+    - artifacts(out) -> [rutas]: en un hit se verifica que existan.
+      Estos nodos reciben además `node_key` para escribir sus
+      archivos en rutas únicas por llave (una corrida nueva no pisa
+      el archivo de una llave anterior)
+    - fallback(ctx, params) -> salida gruesa si la etapa no cabe en
+      el deadline del request (ver expansion.deadline)
+    - max_age_s: edad máxima de la salida (datos externos que
+      envejecen). Entra a la llave como ventana de tiempo, así que
+      al expirar también se recalculan los dependientes
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable,
+        *,
+        deps: Iterable[str] = (),
+        params: Iterable[str] = (),
+        context_keys: Iterable[str] = (),
+        code_refs: Iterable[Any] = (),
+        version: str = "1",
+        cacheable: bool = True,
+        artifacts: Callable[[Any], List[str]] | None = None,
+        fallback: Callable[[Dict[str, Any], Dict[str, Any]], Any] | None = None,
+        max_age_s: float | None = None
+    ):
+        self.name = name
+        self.fn = fn
+        self.deps = list(deps)
+        self.params = list(params)
+        self.context_keys = list(context_keys)
+        self.version = version
+        self.cacheable = cacheable
+        self.artifacts = artifacts
+        self.fallback = fallback
+        self.max_age_s = max_age_s
+        self.code_hash = hash_inputs(
+            _code_fingerprint(fn), *[_code_fingerprint(r) for r in code_refs]
+        )
+
+
+# =====================================================
+# DAG
+# =====================================================
+class PipelineDAG:
+    """
+    Ejecuta nodos en orden topológico con cache por hash de
+    entradas (Merkle): llave = H(nodo, versión, código, params
+    propios, versiones de contexto, llaves de dependencias).
+
+    Si solo cambia una etapa downstream, las de arriba son hits
+    y solo se re-ejecutan la etapa y sus dependientes.
+    """
+
+    def __init__(
+        self,
+        nodes: List[Node],
+        cache_dir: str = DEFAULT_CACHE_DIR,
+        memory_max_entries: int = MEMORY_MAX_ENTRIES
+    ):
+        self.nodes = {n.name: n for n in nodes}
+        self.cache_dir = cache_dir
+        self.order = self._toposort()
+        # LRU en memoria; el disco es la capa completa
+        self._memory: "OrderedDict[str, Any]" = OrderedDict()
+        self.memory_max_entries = memory_max_entries
+        self._lock = threading.Lock()
+
+    def _toposort(self) -> List[str]:
+        order, state = [], {}
+
+        def visit(name):
+            if state.get(name) == "done":
+                return
+            if state.get(name) == "visiting":
+                raise ValueError(f"Ciclo en el DAG en '{name}'")
+            if name not in self.nodes:
+                raise KeyError(f"Dependencia desconocida: '{name}'")
+            state[name] = "visiting"
+            for d in self.nodes[name].deps:
+                visit(d)
+            state[name] = "done"
+            order.append(name)
+
+        for name in self.nodes:
+            visit(name)
+        return order
+
+    def _required(self, targets: Iterable[str] | None) -> List[str]:
+        if not targets:
+            return self.order
+        needed = set()
+        stack = list(targets)
+        while stack:
+            n = stack.pop()
+            if n not in needed:
+                needed.add(n)
+                stack.extend(self.nodes[n].deps)
+        return [n for n in self.order if n in needed]
+
+    # -------------------------------------------------
+    # CACHE
+    # -------------------------------------------------
+    def _cache_path(self, node: str, key: str) -> str:
+        return os.path.join(self.cache_dir, node, f"{key}.pkl")
+
+    def _cache_get(self, node: Node, key: str):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return True, self._memory[key]
+
+        path = self._cache_path(node.name, key)
+        if not os.path.exists(path):
+            return False, None
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except Exception:
+            return False, None
+
+        self._memory_put(key, value)
+        return True, value
+
+    def _memory_put(self, key: str, value):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_max_entries:
+                self._memory.popitem(last=False)
+
+    def _cache_put(self, node: Node, key: str, value):
+        self._memory_put(key, value)
+
+        path = self._cache_path(node.name, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            # Salida no serializable: solo cache en memoria
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    # -------------------------------------------------
+    # EJECUCIÓN
+    # -------------------------------------------------
+    def run(
+        self,
+        params: Dict[str, Any],
+        ctx: Dict[str, Any],
+        *,
+        ctx_versions: Dict[str, Any] | None = None,
+        targets: Iterable[str] | None = None,
+        force: Iterable[str] = (),
+        deadline: Deadline | None = None
+    ) -> Dict[str, Any]:
+        """
+        Retorna {"outputs": {nodo: salida}, "report": [{nodo, cache, ms, key}],
+        "degradado": {nodo: motivo}}.
+        `force` re-ejecuta esos nodos aunque haya hit.
+
+        Con `deadline`, un nodo con fallback que no termina a tiempo
+        usa su salida gruesa; el cálculo completo sigue en segundo
+        plano y se guarda en cache bajo la llave real. Nada derivado
+        de una salida degradada se guarda en cache.
+        """
+        ctx_versions = ctx_versions or {}
+        force = set(force)
+        degraded: Dict[str, str] = {}
+
+        outputs: Dict[str, Any] = {}
+        keys: Dict[str, str] = {}
+        report = []
+
+        for name in self._required(targets):
+            node = self.nodes[name]
+
+            key_parts = [
+                node.name,
+                node.version,
+                node.code_hash,
+                {p: params.get(p) for p in node.params},
+                {c: ctx_versions.get(c) for c in node.context_keys},
+                [keys[d] for d in node.deps],
+            ]
+            if node.max_age_s:
+                key_parts.append(int(time.time() // node.max_age_s))
+            key = hash_inputs(*key_parts)
+            keys[name] = key
+
+            t0 = time.perf_counter()
+            hit, value = (False, None)
+            if node.cacheable and name not in force:
+                hit, value = self._cache_get(node, key)
+                if hit and node.artifacts and not all(
+                    os.path.exists(p) for p in node.artifacts(value) if p
+                ):
+                    hit = False
+
+            if not hit:
+                deps = {d: outputs[d] for d in node.deps}
+                if node.artifacts is not None:
+                    deps["node_key"] = key
+                if deadline is not None and deadline.enabled and node.fallback is not None:
+                    value = self._run_with_deadline(node, key, ctx, params, deps, deadline)
+                    if value is _TIMED_OUT:
+                        value = node.fallback(ctx, params)
+                        degraded[name] = "deadline"
+                else:
+                    value = node.fn(ctx, params, **deps)
+
+                if name not in degraded and any(d in degraded for d in node.deps):
+                    degraded[name] = "dependencia_degradada"
+                if node.cacheable and name not in degraded:
+                    self._cache_put(node, key, value)
+
+            outputs[name] = value
+            report.append({
+                "nodo": name,
+                "cache": "hit" if hit else ("degradado" if name in degraded else "miss"),
+                "ms": round((time.perf_counter() - t0) * 1000, 2),
+                "key": key[:12],
+            })
+
+        return {"outputs": outputs, "report": report, "degradado": degraded}
+
+    def _run_with_deadline(self, node: Node, key: str, ctx, params, deps, deadline: Deadline):
+        if stage_pool_saturated():
+            # Pool de etapas lleno de trabajo abandonado: respaldo
+            # directo y cálculo completo en el pool de refinamiento
+            fut = submit_refinement(node.fn, ctx, params, **deps)
+        else:
+            fut = get_stage_executor().submit(node.fn, ctx, params, **deps)
+            try:
+                return fut.result(timeout=deadline.remaining_s(ASSEMBLY_RESERVE_MS))
+            except FuturesTimeout:
+                fut = abandon(fut, node.fn, ctx, params, **deps)
+
+        if fut is not None and node.cacheable:
+            # Refinamiento: el resultado completo queda en cache
+            def _store(f, node=node, key=key):
+                if not f.cancelled() and f.exception() is None:
+                    self._cache_put(node, key, f.result())
+            fut.add_done_callback(_store)
+        return _TIMED_OUT
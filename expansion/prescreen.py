@@ -0,0 +1,205 @@
+# expansion/prescreen.py
+
+import math
+import threading
+from typing import Dict, Any, List
+
+from expansion.agent_evaluator import evaluate_site_dual
+
+
+# =====================================================
+# UMBRALES (CONFIGURABLES)
+# =====================================================
+PRESCREEN_RULES = {
+    # DESCARTAR
+    "neto_min_dist_km": 0.30,        # NETO propia demasiado cerca
+    "aurrera_max_count": 2,          # saturación Bodega Aurrera en el radio
+    "integracion_descartar": {"AISLADO"},
+
+    # AVANZAR
+    "neto_avanzar_dist_km": 1.50,
+    "integracion_avanzar": {"INTEGRADO"},
+    "benchmark_min_share_ok": 0.70,  # % variables con Δ >= tolerancia
+    "benchmark_delta_tol_pct": -10,
+}
+
+_STATS_LOCK = threading.Lock()
+PRESCREEN_STATS = {
+    "total": 0,
+    "descartar": 0,
+    "avanzar": 0,
+    "llm": 0,
+}
+
+
+# =====================================================
+# UTILIDADES
+# =====================================================
+def _num(x) -> float | None:
+    if isinstance(x, bool) or not isinstance(x, (int, float)):
+        return None
+    if math.isnan(x) or math.isinf(x):
+        return None
+    return float(x)
+
+
+def _aurrera_count(payload: Dict[str, Any]) -> int:
+    resumen = payload.get("competencia_resumen")
+    if isinstance(resumen, dict) and "bodega_aurrera" in resumen:
+        return int(resumen["bodega_aurrera"] or 0)
+    lst = payload.get("bodega_aurrera")
+    if isinstance(lst, list):
+        return len(lst)
+    return 0
+
+
+def _benchmark_share_ok(df_benchmark, tol_pct: float) -> float | None:
+    """
+    Proporción de variables del benchmark regional donde el sitio
+    está por encima de (benchmark + tol_pct %).
+    """
+    if df_benchmark is None or len(df_benchmark) == 0:
+        return None
+
+    deltas = df_benchmark["Δ vs benchmark (%)"].dropna()
+    if deltas.empty:
+        return None
+
+    return float((deltas >= tol_pct).mean())
+
+
+def _record(outcome: str):
+    with _STATS_LOCK:
+        PRESCREEN_STATS["total"] += 1
+        PRESCREEN_STATS[outcome] += 1
+
+
+def prescreen_stats() -> Dict[str, Any]:
+    """
+    Contadores + tasa de llamadas LLM evitadas.
+    """
+    with _STATS_LOCK:
+        stats = dict(PRESCREEN_STATS)
+
+    total = stats["total"]
+    stats["llm_call_rate"] = round(stats["llm"] / total, 4) if total else None
+    stats["llm_calls_avoided_rate"] = (
+        round(1 - stats["llm"] / total, 4) if total else None
+    )
+    return stats
+
+
+# =====================================================
+# SCORER DETERMINISTA
+# =====================================================
+def prescreen_site(
+    *,
+    payload: Dict[str, Any],
+    df_benchmark=None,
+    region_vector: Dict[str, Any] | None = None,
+    rules: Dict[str, Any] = PRESCREEN_RULES
+) -> Dict[str, Any]:
+    """
+    Decide localmente los casos obvios. region_vector se acepta
+    por compatibilidad (el equilibrio regional ya entra vía
+    df_benchmark).
+
+    Retorna:
+    {
+        "decision": "DESCARTAR" | "AVANZAR" | None,   # None => ir al LLM
+        "motivos": [str, ...]
+    }
+    """
+    motivos: List[str] = []
+
+    dist = _num(payload.get("distancia_tienda_cercana_km"))
+    integracion = str(payload.get("integracion_clasificacion") or "").upper()
+    aurrera = _aurrera_count(payload)
+
+    # -----------------------------
+    # DESCARTAR (cualquiera basta)
+    # -----------------------------
+    if dist is not None and dist < rules["neto_min_dist_km"]:
+        motivos.append(
+            f"Tienda NETO existente a {dist * 1000:.0f} m "
+            f"(mínimo {rules['neto_min_dist_km'] * 1000:.0f} m)."
+        )
+
+    if integracion in rules["integracion_descartar"]:
+        motivos.append(f"Integración comercial {integracion}.")
+
+    if aurrera >= rules["aurrera_max_count"]:
+        motivos.append(f"Saturación Bodega Aurrera: {aurrera} tiendas en el radio.")
+
+    if motivos:
+        return {"decision": "DESCARTAR", "motivos": motivos}
+
+    # -----------------------------
+    # AVANZAR (todas deben cumplirse)
+    # -----------------------------
+    # Todo con datos del candidato: las ventas de la tienda NETO
+    # cercana no dicen nada del sitio y no entran aquí
+    share_ok = _benchmark_share_ok(df_benchmark, rules["benchmark_delta_tol_pct"])
+
+    if (
+        dist is not None and dist >= rules["neto_avanzar_dist_km"]
+        and integracion in rules["integracion_avanzar"]
+        and aurrera == 0
+        and share_ok is not None and share_ok >= rules["benchmark_min_share_ok"]
+    ):
+        return {
+            "decision": "AVANZAR",
+            "motivos": [
+                f"Sin NETO en {rules['neto_avanzar_dist_km']} km, "
+                f"integración {integracion}, sin Bodega Aurrera y "
+                f"{share_ok:.0%} de variables en línea con el equilibrio regional."
+            ]
+        }
+
+    return {"decision": None, "motivos": []}
+
+
+# =====================================================
+# EVALUACIÓN CON PRE-FILTRO
+# =====================================================
+def evaluate_site_with_prescreen(
+    *,
+    payload: dict,
+    region_vector: dict,
+    tabla_global: dict,
+    tabla_maduras: dict,
+    df_benchmark=None
+) -> Dict[str, Any]:
+    """
+    Aplica el pre-filtro y solo llama al LLM en casos ambiguos.
+    Misma salida que evaluate_site_dual + "fuente_decision".
+    """
+    pre = prescreen_site(
+        payload=payload,
+        df_benchmark=df_benchmark,
+        region_vector=region_vector
+    )
+
+    if pre["decision"] is not None:
+        _record(pre["decision"].lower())
+        explicacion = "Decisión por reglas de pre-filtro: " + " ".join(pre["motivos"])
+        return {
+            "decision_modelo_1": pre["decision"],
+            "explicacion_1": explicacion,
+
+            "decision_modelo_2": pre["decision"],
+            "explicacion_2": explicacion,
+
+            "fuente_decision": "prescreen"
+        }
+
+    _record("llm")
+
+    out = evaluate_site_dual(
+        payload=payload,
+        region_vector=region_vector,
+        tabla_global=tabla_global,
+        tabla_maduras=tabla_maduras
+    )
+    out["fuente_decision"] = "llm"
+    return out
@@ -1,7 +1,9 @@
 # expansion/prompt_builder.py
 
-from typing import Dict, Any
+from typing import Dict, Any, Tuple
 import json
+import math
+import os
 
 
 # ======================================================
@@ -97,3 +99,254 @@ def _build_output_schema() -> str:
         "}\n\n"
         "NO agregues comentarios, encabezados ni texto fuera del JSON."
     )
+
+
+# ======================================================
+# BUILDER COMPACTO (PREFIJO ESTÁTICO CACHEABLE)
+# ======================================================
+# Orden: primero TODO lo estático (header, reglas, schema) para que
+# el proveedor pueda reutilizar el prefijo entre sitios; después
+# región (memoizada), sitio y benchmarks en formato tabular compacto.
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))
+
+# Campos del payload que no aportan a la decisión
+IRRELEVANT_PAYLOAD_KEYS = {
+    "timestamp",
+    "fuente",
+    "lat",
+    "longitud",
+    "INEGI_geometry",
+    "INEGI_index_right",
+    "INEGI_CVE_ENT",
+    "INEGI_CVE_MUN",
+}
+
+_REGION_SECTION_CACHE: Dict[tuple, str] = {}
+_REGION_SECTION_CACHE_MAX = 64
+
+
+def build_expansion_prompt_compact(
+    *,
+    payload: Dict[str, Any],
+    region_vector: Dict[str, Any],
+    tabla_global: Any,
+    tabla_maduras: Any,
+) -> str:
+    """
+    Igual que build_expansion_prompt_semaforo_v12 pero compacto
+    y con las secciones estáticas al inicio.
+    """
+    prompt, _ = build_expansion_prompt_compact_with_stats(
+        payload=payload,
+        region_vector=region_vector,
+        tabla_global=tabla_global,
+        tabla_maduras=tabla_maduras,
+    )
+    return prompt
+
+
+def build_expansion_prompt_compact_with_stats(
+    *,
+    payload: Dict[str, Any],
+    region_vector: Dict[str, Any],
+    tabla_global: Any,
+    tabla_maduras: Any,
+    token_budget: int = PROMPT_TOKEN_BUDGET,
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Retorna (prompt, stats) donde stats reporta tokens estimados
+    del prefijo estático, de la parte dinámica y contra el presupuesto.
+    """
+    static = _static_prefix()
+
+    dynamic_sections = [
+        _build_region_context_compact(region_vector, payload),
+        _build_payload_context_compact(payload, region_vector),
+        _build_benchmarks_context_compact(tabla_global, tabla_maduras),
+    ]
+    dynamic = "\n\n".join(dynamic_sections)
+
+    prompt = f"{static}\n\n{dynamic}"
+
+    tokens_static = estimate_tokens(static)
+    tokens_total = estimate_tokens(prompt)
+
+    stats = {
+        "tokens_static": tokens_static,
+        "tokens_dynamic": tokens_total - tokens_static,
+        "tokens_total": tokens_total,
+        "token_budget": token_budget,
+        "over_budget": tokens_total > token_budget,
+    }
+
+    return prompt, stats
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Conteo de tokens con tiktoken si está instalado;
+    si no, aproximación de ~4 caracteres por token.
+    """
+    try:
+        import tiktoken
+    except ImportError:
+        return math.ceil(len(text) / 4)
+
+    return len(_get_encoding(tiktoken).encode(text))
+
+
+_ENCODING = None
+
+
+def _get_encoding(tiktoken):
+    global _ENCODING
+    if _ENCODING is None:
+        _ENCODING = tiktoken.get_encoding("o200k_base")
+    return _ENCODING
+
+
+_STATIC_PREFIX = None
+
+
+def _static_prefix() -> str:
+    global _STATIC_PREFIX
+    if _STATIC_PREFIX is None:
+        _STATIC_PREFIX = "\n\n".join([
+            _build_header(),
+            _build_decision_rules(),
+            _build_output_schema(),
+            (
+                "FORMATO DE DATOS:\n"
+                "Las tablas siguientes usan '|' como separador. "
+                "Los campos vacíos o nulos se omiten."
+            ),
+        ])
+    return _STATIC_PREFIX
+
+
+# ======================================================
+# ENCODING COMPACTO
+# ======================================================
+def _is_missing(v: Any) -> bool:
+    if v is None:
+        return True
+    if isinstance(v, float) and (math.isnan(v) or math.isinf(v)):
+        return True
+    if isinstance(v, (str, list, dict)) and len(v) == 0:
+        return True
+    return False
+
+
+def _fmt_compact(v: Any) -> str:
+    if isinstance(v, bool):
+        return "1" if v else "0"
+    if isinstance(v, float):
+        if v.is_integer():
+            return str(int(v))
+        return f"{v:.4g}" if abs(v) < 1000 else str(round(v))
+    if isinstance(v, (dict, list)):
+        return json.dumps(v, ensure_ascii=False, separators=(",", ":"))
+    return str(v)
+
+
+def _build_region_context_compact(
+    region_vector: Dict[str, Any],
+    payload: Dict[str, Any]
+) -> str:
+    region = region_vector.get("region", "-")
+    vector = region_vector.get("vector_equilibrio", {})
+    profile = vector.get("profile_equilibrio", {}) or {}
+
+    header = _region_header_cached(region, vector, profile)
+
+    rows = ["variable|equilibrio|sitio"]
+    for k, bench in profile.items():
+        if _is_missing(bench):
+            continue
+        site = payload.get(k)
+        rows.append(
+            f"{k}|{_fmt_compact(bench)}|"
+            f"{'' if _is_missing(site) else _fmt_compact(site)}"
+        )
+
+    return header + "\n".join(rows)
+
+
+def _region_header_cached(region: str, vector: Dict[str, Any], profile: Dict[str, Any]) -> str:
+    """
+    Parte fija por región (metadatos del vector). Memoizada por
+    región + huella del perfil.
+    """
+    key = (
+        region,
+        vector.get("break_even"),
+        vector.get("n_equilibrio"),
+        tuple(profile.keys()),
+        tuple(profile.values()),
+    )
+    cached = _REGION_SECTION_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    meta = [
+        f"{k}={_fmt_compact(v)}"
+        for k, v in vector.items()
+        if k != "profile_equilibrio" and not _is_missing(v)
+    ]
+
+    section = (
+        "CONTEXTO REGIONAL:\n"
+        f"Región evaluada: {region}\n"
+        f"{' '.join(meta)}\n\n"
+        "Perfil de equilibrio regional vs sitio candidato:\n"
+    )
+
+    if len(_REGION_SECTION_CACHE) >= _REGION_SECTION_CACHE_MAX:
+        _REGION_SECTION_CACHE.clear()
+    _REGION_SECTION_CACHE[key] = section
+
+    return section
+
+
+def _build_payload_context_compact(
+    payload: Dict[str, Any],
+    region_vector: Dict[str, Any]
+) -> str:
+    profile = (
+        region_vector.get("vector_equilibrio", {})
+        .get("profile_equilibrio", {})
+    ) or {}
+
+    lines = [
+        f"{k}={_fmt_compact(v)}"
+        for k, v in payload.items()
+        if k not in IRRELEVANT_PAYLOAD_KEYS
+        and k not in profile
+        and not _is_missing(v)
+    ]
+
+    return (
+        "DATOS DEL SITIO CANDIDATO (campos no incluidos en la tabla regional):\n"
+        + "\n".join(lines)
+    )
+
+
+def _encode_table(tabla: Any) -> str:
+    if _is_missing(tabla):
+        return "-"
+    if hasattr(tabla, "to_csv"):
+        return tabla.to_csv(sep="|", index=False).strip()
+    if isinstance(tabla, (dict, list)):
+        return json.dumps(tabla, ensure_ascii=False, separators=(",", ":"))
+    return str(tabla)
+
+
+def _build_benchmarks_context_compact(tabla_global: Any, tabla_maduras: Any) -> str:
+    return (
+        "BENCHMARKS DE REFERENCIA:\n"
+        "Comparativos globales:\n"
+        f"{_encode_table(tabla_global)}\n\n"
+        "Comparativos de tiendas maduras:\n"
+        f"{_encode_table(tabla_maduras)}"
+    )
@@ -0,0 +1,186 @@
+# expansion/region_similarity.py
+
+from typing import Dict, Any, Iterable, List
+
+import numpy as np
+
+from expansion.region_vectors import (
+    DEFAULT_REGION_VECTORS_PATH,
+    feature_to_float,
+    get_region_registry,
+)
+
+
+# =====================================================
+# CONFIG
+# =====================================================
+DEFAULT_CHUNK_SIZE = 2048
+MIN_SHARED_FEATURES = 10
+
+
+# =====================================================
+# UTILIDADES
+# =====================================================
+def candidates_to_matrix(
+    candidates: Iterable[Dict[str, Any]],
+    feature_cols: Iterable[str]
+) -> np.ndarray:
+    """
+    Lista de payloads planos -> matriz (N, F) alineada a feature_cols.
+    Variables ausentes / no numéricas quedan como NaN.
+    """
+    cols = list(feature_cols)
+    rows = [[feature_to_float(c.get(col)) for col in cols] for c in candidates]
+    if not rows:
+        return np.empty((0, len(cols)))
+    return np.asarray(rows, dtype=float)
+
+
+# =====================================================
+# SCORING VECTORIZADO
+# =====================================================
+def score_regions_matrix(
+    X: np.ndarray,
+    *,
+    json_path: str = DEFAULT_REGION_VECTORS_PATH,
+    top_k: int = 3,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    min_features: int = MIN_SHARED_FEATURES
+) -> Dict[str, Any]:
+    """
+    Distancia de N candidatos contra los R perfiles de equilibrio
+    en una sola operación matricial (por bloques de `chunk_size`).
+
+    Con robust scaling por región:
+        z_site    = (x - center_r) / scale_r
+        z_profile = (profile_r - center_r) / scale_r
+        gap       = z_site - z_profile = (x - profile_r) / scale_r
+
+    distancia = RMS de los gaps sobre las variables presentes en
+    ambos (candidato y región). Regiones con menos de
+    `min_features` variables compartidas quedan en +inf.
+
+    X debe estar alineada a registry.stacked()["feature_cols"].
+
+    Retorna:
+    {
+        "regions": [str] (R),
+        "distances": np.ndarray (N, R),
+        "n_features": np.ndarray (N, R),
+        "top_idx": np.ndarray (N, k),
+        "top_regions": [[str]],
+        "top_distances": np.ndarray (N, k)
+    }
+    """
+    st = get_region_registry(json_path).stacked()
+    profile, scale = st["profile"], st["scale"]
+    R = profile.shape[0]
+
+    X = np.asarray(X, dtype=float)
+    N = X.shape[0]
+
+    distances = np.full((N, R), np.inf)
+    n_features = np.zeros((N, R), dtype=int)
+
+    for start in range(0, N, chunk_size):
+        Xc = X[start:start + chunk_size]
+
+        # (n, R, F)
+        gaps = (Xc[:, None, :] - profile[None, :, :]) / scale[None, :, :]
+        valid = np.isfinite(gaps)
+
+        cnt = valid.sum(axis=2)
+        sq = np.where(valid, gaps * gaps, 0.0).sum(axis=2)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            d = np.sqrt(sq / cnt)
+        d[cnt < min_features] = np.inf
+
+        distances[start:start + chunk_size] = d
+        n_features[start:start + chunk_size] = cnt
+
+    k = min(top_k, R)
+    top_idx = np.argsort(distances, axis=1)[:, :k]
+    top_distances = np.take_along_axis(distances, top_idx, axis=1)
+
+    regions = st["regions"]
+
+    return {
+        "regions": regions,
+        "distances": distances,
+        "n_features": n_features,
+        "top_idx": top_idx,
+        "top_regions": [[regions[i] for i in row] for row in top_idx],
+        "top_distances": top_distances,
+    }
+
+
+def region_feature_gaps(
+    x: np.ndarray,
+    region: str,
+    *,
+    json_path: str = DEFAULT_REGION_VECTORS_PATH
+) -> Dict[str, float]:
+    """
+    Gaps escalados por variable (sitio - perfil) / scale para UNA región,
+    ordenados por magnitud. x alineada a stacked()["feature_cols"].
+    """
+    st = get_region_registry(json_path).stacked()
+    r = st["regions"].index(get_region_registry(json_path).get(region)["region"])
+
+    gaps = (np.asarray(x, dtype=float) - st["profile"][r]) / st["scale"][r]
+
+    out = {
+        col: round(float(g), 3)
+        for col, g in zip(st["feature_cols"], gaps)
+        if np.isfinite(g)
+    }
+    return dict(sorted(out.items(), key=lambda kv: -abs(kv[1])))
+
+
+# =====================================================
+# API DE ALTO NIVEL
+# =====================================================
+def score_candidates_regions(
+    candidates: List[Dict[str, Any]],
+    *,
+    json_path: str = DEFAULT_REGION_VECTORS_PATH,
+    top_k: int = 3,
+    with_gaps: bool = False
+) -> List[Dict[str, Any]]:
+    """
+    Para cada payload candidato retorna las `top_k` regiones cuyo
+    perfil de equilibrio se parece más, con distancia y (opcional)
+    gaps por variable contra la mejor región.
+    """
+    st = get_region_registry(json_path).stacked()
+    X = candidates_to_matrix(candidates, st["feature_cols"])
+
+    res = score_regions_matrix(X, json_path=json_path, top_k=top_k)
+
+    out = []
+    for n in range(X.shape[0]):
+        matches = [
+            {
+                "region": res["regions"][i],
+                "distancia": float(res["top_distances"][n, j]),
+                "n_variables": int(res["n_features"][n, i]),
+            }
+            for j, i in enumerate(res["top_idx"][n])
+            # inf = sin variables en común con la región
+            if np.isfinite(res["top_distances"][n, j])
+        ]
+
+        row = {
+            "region_mas_similar": matches[0]["region"] if matches else None,
+            "regiones_similares": matches,
+        }
+
+        if with_gaps and matches:
+            row["gaps_region_mas_similar"] = region_feature_gaps(
+                X[n], matches[0]["region"], json_path=json_path
+            )
+
+        out.append(row)
+
+    return out
@@ -0,0 +1,259 @@
+# expansion/region_vector_pipeline.py
+
+import hashlib
+import json
+import os
+from typing import Dict, Any, List
+
+import numpy as np
+import pandas as pd
+
+from expansion.region_vectors import DEFAULT_REGION_VECTORS_PATH
+
+
+# =====================================================
+# CONFIG
+# =====================================================
+PIPELINE_VERSION = "1"
+
+SALES_COL = "Venta Sin Impuestos"
+DEFAULT_BREAK_EVEN = 850000
+
+# Tiendas "en equilibrio": ventas dentro de ±banda del break-even
+EQUILIBRIO_BAND = 0.15
+
+# Una variable entra al vector de la región si al menos esta
+# proporción de sus tiendas la tiene
+MIN_FEATURE_COVERAGE = 0.80
+
+MIN_STORES_PER_REGION = 5
+
+
+# =====================================================
+# RUTAS
+# =====================================================
+def binary_path_for(json_path: str) -> str:
+    root, _ = os.path.splitext(json_path)
+    return f"{root}.npz"
+
+
+def _state_path_for(json_path: str) -> str:
+    root, _ = os.path.splitext(json_path)
+    return f"{root}.state.json"
+
+
+# =====================================================
+# CÁLCULO POR REGIÓN
+# =====================================================
+def _robust_scaler(X: np.ndarray):
+    center = np.nanmedian(X, axis=0)
+    q75, q25 = np.nanpercentile(X, [75, 25], axis=0)
+    scale = q75 - q25
+    scale = np.where((scale == 0) | ~np.isfinite(scale), 1.0, scale)
+    return center, scale
+
+
+def compute_region_vector(
+    region: str,
+    df_region: pd.DataFrame,
+    feature_cols: List[str],
+    break_even: float
+) -> Dict[str, Any] | None:
+    """
+    Vector de equilibrio de UNA región (mismo formato que
+    vectores_promedio_region.json).
+
+    - scaler_center / scaler_scale: mediana / IQR de las tiendas usadas
+    - profile_equilibrio: mediana de las tiendas con ventas dentro
+      de ±EQUILIBRIO_BAND del break-even (si no hay, todas las usadas)
+
+    None si ninguna tienda queda completa (ventas + features con
+    cobertura): el vector saldría todo NaN.
+    """
+    coverage = df_region[feature_cols].notna().mean()
+    cols = [c for c in feature_cols if coverage.get(c, 0) >= MIN_FEATURE_COVERAGE]
+
+    used = df_region.dropna(subset=cols + [SALES_COL])
+    if used.empty or not cols:
+        return None
+
+    X = used[cols].to_numpy(dtype=float)
+
+    center, scale = _robust_scaler(X)
+
+    sales = used[SALES_COL].to_numpy(dtype=float)
+    in_band = np.abs(sales - break_even) <= EQUILIBRIO_BAND * break_even
+    X_eq = X[in_band] if in_band.any() else X
+
+    profile = np.nanmedian(X_eq, axis=0)
+
+    return {
+        "region": region,
+        "break_even": break_even,
+        "n_tiendas_total": int(len(df_region)),
+        "n_tiendas_usadas": int(len(used)),
+        "n_equilibrio": int(in_band.sum()),
+        "feature_cols": cols,
+        "profile_equilibrio": {
+            c: float(v) for c, v in zip(cols, profile)
+        },
+        "scaler_center": [float(v) for v in center],
+        "scaler_scale": [float(v) for v in scale],
+        "has_inegi": any(c.startswith("INEGI_") for c in cols),
+    }
+
+
+def _region_fingerprint(df_region: pd.DataFrame, feature_cols: List[str], break_even: float) -> str:
+    """
+    Huella de las tiendas de una región (ids, ventas y features).
+    Si no cambia, el vector de la región no se recalcula.
+    """
+    cols = ["STORE_ID", SALES_COL] + feature_cols
+    frame = df_region[cols].sort_values("STORE_ID")
+
+    h = hashlib.sha256()
+    h.update(f"{PIPELINE_VERSION}|{break_even}|{','.join(feature_cols)}".encode("utf-8"))
+    h.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+# =====================================================
+# PIPELINE INCREMENTAL
+# =====================================================
+def rebuild_region_vectors(
+    *,
+    df_neto: pd.DataFrame,
+    df_features: pd.DataFrame,
+    json_path: str = DEFAULT_REGION_VECTORS_PATH,
+    break_even_by_region: Dict[str, float] | None = None,
+    force: bool = False
+) -> Dict[str, Any]:
+    """
+    Recalcula vectores_promedio_region.json desde el master NETO
+    + features por tienda (ver analog_stores.build_store_feature_frame).
+
+    Solo se recalculan las regiones cuyas tiendas cambiaron
+    (huella por región); el resto se copia del JSON previo.
+    Escribe JSON + binario .npz de forma atómica.
+
+    Retorna {"recalculadas": [...], "sin_cambios": [...], "omitidas": [...]}.
+    """
+    previous = {}
+    if os.path.exists(json_path):
+        with open(json_path, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+
+    state_path = _state_path_for(json_path)
+    state = {}
+    if os.path.exists(state_path) and not force:
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+
+    feature_cols = [c for c in df_features.columns if c != "STORE_ID"]
+
+    df = df_neto[["STORE_ID", "FCREGION", SALES_COL]].merge(
+        df_features, on="STORE_ID", how="left"
+    )
+
+    out, new_state = {}, {}
+    report = {"recalculadas": [], "sin_cambios": [], "omitidas": []}
+
+    for region, df_region in df.groupby("FCREGION", sort=True):
+        if len(df_region) < MIN_STORES_PER_REGION:
+            # Muy pocas tiendas: se conserva el vector previo (si existe)
+            if region in previous:
+                out[region] = previous[region]
+            report["omitidas"].append(region)
+            continue
+
+        break_even = (
+            (break_even_by_region or {}).get(region)
+            or previous.get(region, {}).get("break_even")
+            or DEFAULT_BREAK_EVEN
+        )
+
+        fp = _region_fingerprint(df_region, feature_cols, break_even)
+
+        if state.get(region) == fp and region in previous:
+            new_state[region] = fp
+            out[region] = previous[region]
+            report["sin_cambios"].append(region)
+            continue
+
+        vector = compute_region_vector(region, df_region, feature_cols, break_even)
+        if vector is None:
+            # Sin tiendas completas: se conserva el vector previo (si
+            # existe) y sin huella, para reintentar en la siguiente corrida
+            if region in previous:
+                out[region] = previous[region]
+            report["omitidas"].append(region)
+            continue
+
+        new_state[region] = fp
+        out[region] = vector
+        report["recalculadas"].append(region)
+
+    write_region_vectors(out, json_path)
+
+    _atomic_write_text(state_path, json.dumps(new_state, indent=1))
+
+    return report
+
+
+# =====================================================
+# ESCRITURA / LECTURA
+# =====================================================
+def _atomic_write_text(path: str, text: str):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def write_region_vectors(data: Dict[str, Any], json_path: str = DEFAULT_REGION_VECTORS_PATH):
+    """
+    Escribe el JSON (compatible con el formato actual) y un .npz
+    hermano de carga rápida. Ambos vía archivo temporal + os.replace.
+    """
+    _atomic_write_text(json_path, json.dumps(data, ensure_ascii=False, indent=2))
+
+    meta = {}
+    arrays = {}
+    for i, (region, v) in enumerate(data.items()):
+        meta[region] = {
+            "idx": i,
+            **{
+                k: val for k, val in v.items()
+                if k not in ("profile_equilibrio", "scaler_center", "scaler_scale")
+            }
+        }
+        cols = v["feature_cols"]
+        arrays[f"profile_{i}"] = np.array(
+            [v["profile_equilibrio"].get(c, np.nan) for c in cols], dtype=float
+        )
+        arrays[f"center_{i}"] = np.asarray(v["scaler_center"], dtype=float)
+        arrays[f"scale_{i}"] = np.asarray(v["scaler_scale"], dtype=float)
+
+    bin_path = binary_path_for(json_path)
+    tmp = f"{bin_path}.tmp.npz"
+    np.savez(tmp, __meta__=np.array(json.dumps(meta, ensure_ascii=False)), **arrays)
+    os.replace(tmp, bin_path)
+
+
+def load_region_vectors_binary(bin_path: str) -> Dict[str, Any]:
+    """
+    Lee el .npz y reconstruye el mismo dict que el JSON.
+    """
+    with np.load(bin_path, allow_pickle=False) as z:
+        meta = json.loads(str(z["__meta__"]))
+        data = {}
+        for region, m in meta.items():
+            i = m.pop("idx")
+            cols = m["feature_cols"]
+            data[region] = {
+                **m,
+                "profile_equilibrio": dict(zip(cols, z[f"profile_{i}"].tolist())),
+                "scaler_center": z[f"center_{i}"],
+                "scaler_scale": z[f"scale_{i}"],
+            }
+    return data
@@ -1,4 +1,16 @@
 import json
+import os
+import threading
+import time
+
+import numpy as np
+
+
+DEFAULT_REGION_VECTORS_PATH = "data/vectores_promedio_region.json"
+
+# Llaves internas que no van al prompt
+PROMPT_BLACKLIST = {"scaler_center", "scaler_scale", "feature_cols"}
+
 
 def normalize_region_name(region: str) -> str:
     return (
@@ -14,32 +26,243 @@ def normalize_region_name(region: str) -> str:
     )
 
 
-def load_region_vector_for_prompt(json_path: str, region: str) -> dict:
-    with open(json_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
+def feature_to_float(x) -> float:
+    """
+    Valor de una variable del payload para compararla contra los
+    vectores / tiendas: numéricos y strings numéricos ("1234",
+    " 5.6 ") -> float (los INEGI_* llegan como str: data_hogares
+    se lee con dtype=str). Misma coerción que
+    pd.to_numeric(errors="coerce"); todo lo demás -> NaN.
+    """
+    if isinstance(x, list):
+        x = x[0] if x else None
+    if x is None or isinstance(x, bool):
+        return np.nan
+    try:
+        return float(x.strip() if isinstance(x, str) else x)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+# =====================================================
+# REGISTRY EN MEMORIA
+# =====================================================
+class RegionVectorRegistry:
+    """
+    Carga el JSON de vectores regionales UNA vez y mantiene por región:
+
+    - feature_cols (tuple)
+    - profile  : np.ndarray alineado a feature_cols (profile_equilibrio)
+    - center   : np.ndarray (scaler_center)
+    - scale    : np.ndarray (scaler_scale, 0 -> 1)
+    - prompt   : dict listo para el prompt (sin llaves de scaler)
+
+    Recarga solo si el JSON o su .npz cambian (mtime / tamaño), revisando
+    como máximo cada `check_interval_s` segundos.
+    """
 
-    region_norm = normalize_region_name(region)
+    def __init__(self, json_path: str, check_interval_s: float = 5.0):
+        self.json_path = json_path
+        self.check_interval_s = check_interval_s
 
-    region_map = {
-        normalize_region_name(k): k
-        for k in data.keys()
-    }
+        self._lock = threading.Lock()
+        self._signature = None
+        self._last_check = 0.0
+        self._regions = {}
+        self._name_map = {}
+        self._stacked = None
 
-    if region_norm not in region_map:
-        raise KeyError(
-            f"Región '{region}' no encontrada. "
-            f"Disponibles: {list(data.keys())}"
-        )
+    # -------------------------------------------------
+    # CARGA / RECARGA
+    # -------------------------------------------------
+    def _binary_path(self) -> str:
+        root, _ = os.path.splitext(self.json_path)
+        return f"{root}.npz"
 
-    region_key = region_map[region_norm]
-    region_data = data[region_key]
+    def _file_signature(self):
+        """
+        JSON + .npz hermano: un .npz reescrito también recarga.
+        """
+        st = os.stat(self.json_path)
+        try:
+            st_bin = os.stat(self._binary_path())
+            bin_sig = (st_bin.st_mtime_ns, st_bin.st_size)
+        except FileNotFoundError:
+            bin_sig = None
+        return (st.st_mtime_ns, st.st_size, bin_sig)
 
-    blacklist = {"scaler_center", "scaler_scale", "feature_cols"}
+    def _read_data(self) -> dict:
+        """
+        Usa el .npz hermano (escrito por region_vector_pipeline)
+        si es al menos tan reciente como el JSON.
+        """
+        bin_path = self._binary_path()
+        if (
+            os.path.exists(bin_path)
+            and os.stat(bin_path).st_mtime_ns >= os.stat(self.json_path).st_mtime_ns
+        ):
+            from expansion.region_vector_pipeline import load_region_vectors_binary
+            return load_region_vectors_binary(bin_path)
 
-    return {
-        "region": region_key,
-        "vector_equilibrio": {
-            k: v for k, v in region_data.items()
-            if k not in blacklist
+        with open(self.json_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _ensure_loaded(self):
+        now = time.monotonic()
+        if self._signature is not None and now - self._last_check < self.check_interval_s:
+            return
+
+        with self._lock:
+            if self._signature is not None and now - self._last_check < self.check_interval_s:
+                return
+
+            signature = self._file_signature()
+            self._last_check = now
+            if signature == self._signature:
+                return
+
+            data = self._read_data()
+
+            self._regions = {
+                key: self._build_entry(key, region_data)
+                for key, region_data in data.items()
+            }
+            self._name_map = {
+                normalize_region_name(k): k for k in self._regions
+            }
+            self._stacked = None
+            self._signature = signature
+
+    @staticmethod
+    def _build_entry(key: str, region_data: dict) -> dict:
+        cols = tuple(region_data.get("feature_cols") or region_data["profile_equilibrio"].keys())
+        profile = region_data["profile_equilibrio"]
+
+        scale = np.asarray(region_data.get("scaler_scale", [1.0] * len(cols)), dtype=float)
+        scale = np.where((scale == 0) | ~np.isfinite(scale), 1.0, scale)
+
+        return {
+            "region": key,
+            "feature_cols": cols,
+            "col_index": {c: i for i, c in enumerate(cols)},
+            "profile": np.array(
+                [np.nan if profile.get(c) is None else profile[c] for c in cols],
+                dtype=float
+            ),
+            "center": np.asarray(
+                region_data.get("scaler_center", [0.0] * len(cols)), dtype=float
+            ),
+            "scale": scale,
+            "prompt": {
+                "region": key,
+                "vector_equilibrio": {
+                    k: v for k, v in region_data.items()
+                    if k not in PROMPT_BLACKLIST
+                }
+            },
         }
-    }
+
+    # -------------------------------------------------
+    # LOOKUPS
+    # -------------------------------------------------
+    @property
+    def version(self):
+        """Firma (mtime, tamaño) del JSON y su .npz cargados."""
+        self._ensure_loaded()
+        return self._signature
+
+    def regions(self) -> list:
+        self._ensure_loaded()
+        return list(self._regions.keys())
+
+    def get(self, region: str) -> dict:
+        """
+        Entrada completa (arrays NumPy incluidos). O(1).
+        """
+        self._ensure_loaded()
+
+        region_key = self._name_map.get(normalize_region_name(region))
+        if region_key is None:
+            raise KeyError(
+                f"Región '{region}' no encontrada. "
+                f"Disponibles: {list(self._regions.keys())}"
+            )
+        return self._regions[region_key]
+
+    def stacked(self) -> dict:
+        """
+        Todas las regiones apiladas sobre la UNIÓN de feature_cols
+        (cada región tiene su propio subconjunto de columnas):
+
+        - regions      : list[str]           (R)
+        - feature_cols : tuple[str]          (F)
+        - profile      : np.ndarray (R, F)   NaN donde la región no tiene la variable
+        - center       : np.ndarray (R, F)
+        - scale        : np.ndarray (R, F)   1.0 donde no aplica
+        """
+        self._ensure_loaded()
+
+        stacked = self._stacked
+        if stacked is not None:
+            return stacked
+
+        with self._lock:
+            if self._stacked is not None:
+                return self._stacked
+
+            regions = list(self._regions.keys())
+            cols = []
+            seen = set()
+            for key in regions:
+                for c in self._regions[key]["feature_cols"]:
+                    if c not in seen:
+                        seen.add(c)
+                        cols.append(c)
+            col_index = {c: i for i, c in enumerate(cols)}
+
+            R, F = len(regions), len(cols)
+            profile = np.full((R, F), np.nan)
+            center = np.full((R, F), np.nan)
+            scale = np.ones((R, F))
+
+            for r, key in enumerate(regions):
+                entry = self._regions[key]
+                idx = [col_index[c] for c in entry["feature_cols"]]
+                profile[r, idx] = entry["profile"]
+                center[r, idx] = entry["center"]
+                scale[r, idx] = entry["scale"]
+
+            self._stacked = {
+                "regions": regions,
+                "feature_cols": tuple(cols),
+                "col_index": col_index,
+                "profile": profile,
+                "center": center,
+                "scale": scale,
+            }
+            return self._stacked
+
+    def prompt_vector(self, region: str) -> dict:
+        """
+        Vector regional en el formato de load_region_vector_for_prompt.
+        Tratarlo como solo-lectura (se comparte entre llamadas).
+        """
+        return self.get(region)["prompt"]
+
+
+_REGISTRIES = {}
+_REGISTRIES_LOCK = threading.Lock()
+
+
+def get_region_registry(json_path: str = DEFAULT_REGION_VECTORS_PATH) -> RegionVectorRegistry:
+    path = os.path.abspath(json_path)
+    with _REGISTRIES_LOCK:
+        registry = _REGISTRIES.get(path)
+        if registry is None:
+            registry = RegionVectorRegistry(path)
+            _REGISTRIES[path] = registry
+        return registry
+
+
+def load_region_vector_for_prompt(json_path: str, region: str) -> dict:
+    return get_region_registry(json_path).prompt_vector(region)
@@ -0,0 +1,120 @@
+# expansion/report_service.py
+
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, List
+
+from expansion.pdf_report import (
+    generate_expansion_pdf,
+    generate_portfolio_pdf,
+    warm_report_resources,
+)
+
+
+# =====================================================
+# CONFIG
+# =====================================================
+DEFAULT_LOGO_PATH = os.environ.get("NETO_LOGO_PATH", "data/logo_neto.png")
+DEFAULT_MAX_WORKERS = int(os.environ.get("PDF_MAX_WORKERS", "2"))
+
+
+# =====================================================
+# SERVICIO DE REPORTES
+# =====================================================
+class ReportService:
+    """
+    Genera PDFs fuera del request en un pool de procesos.
+
+    Cada worker precarga estilos, fuentes y logo UNA vez
+    (initializer) y los reutiliza en todos sus reportes.
+    """
+
+    def __init__(
+        self,
+        *,
+        logo_path: str = DEFAULT_LOGO_PATH,
+        max_workers: int = DEFAULT_MAX_WORKERS
+    ):
+        self.logo_path = logo_path
+        self.max_workers = max_workers
+        self._pool = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                initializer=warm_report_resources,
+                initargs=(self.logo_path,)
+            )
+        return self._pool
+
+    # -------------------------------------------------
+    # REPORTE INDIVIDUAL
+    # -------------------------------------------------
+    def submit_report(self, *, output_path: str, **site) -> Future:
+        """
+        Encola un reporte individual. `site` lleva las mismas llaves
+        que generate_expansion_pdf (payload, df_benchmark, ...).
+        """
+        return self._get_pool().submit(
+            _render_site,
+            output_path,
+            self.logo_path,
+            site
+        )
+
+    def render_many(self, jobs: List[Dict]) -> List[str]:
+        """
+        Renderiza muchos reportes individuales en paralelo.
+        Cada job: {"output_path": ..., "payload": ..., ...}
+        """
+        futures = [self.submit_report(**job) for job in jobs]
+        return [f.result() for f in futures]
+
+    # -------------------------------------------------
+    # PORTAFOLIO
+    # -------------------------------------------------
+    def submit_portfolio(
+        self,
+        *,
+        sites: List[Dict],
+        output_path: str,
+        title: str | None = None
+    ) -> Future:
+        """
+        Encola un libro multi-sitio (un solo PDF).
+        """
+        kwargs = {"title": title} if title else {}
+        return self._get_pool().submit(
+            generate_portfolio_pdf,
+            sites=sites,
+            output_path=output_path,
+            logo_path=self.logo_path,
+            **kwargs
+        )
+
+    def shutdown(self, wait: bool = True):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+            self._pool = None
+
+
+def _render_site(output_path: str, logo_path: str, site: Dict) -> str:
+    return generate_expansion_pdf(
+        output_path=output_path,
+        logo_path=logo_path,
+        **site
+    )
+
+
+# =====================================================
+# SINGLETON DE PROCESO
+# =====================================================
+_SERVICE = None
+
+
+def get_report_service() -> ReportService:
+    global _SERVICE
+    if _SERVICE is None:
+        _SERVICE = ReportService()
+    return _SERVICE
@@ -0,0 +1,351 @@
+# expansion/run_history.py
+
+import atexit
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Any, List
+
+from expansion.payload_builder import dumps_json
+
+logger = logging.getLogger(__name__)
+
+
+# =====================================================
+# CONFIG
+# =====================================================
+DEFAULT_HISTORY_PATH = os.environ.get("RUN_HISTORY_PATH", "data/run_history.sqlite")
+BATCH_SIZE = 200
+WRITE_RETRIES = 3
+FLUSH_INTERVAL_S = 2.0
+GEOHASH_PRECISION = 7  # ~150 m
+
+_GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts TEXT NOT NULL,
+    folio TEXT,
+    region TEXT,
+    cvegeo TEXT,
+    geohash TEXT,
+    lat REAL,
+    lon REAL,
+    integracion_score REAL,
+    integracion_clasificacion TEXT,
+    competencia_resumen TEXT,
+    decision_modelo_1 TEXT,
+    decision_modelo_2 TEXT,
+    payload_flat TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_runs_folio ON runs (folio);
+CREATE INDEX IF NOT EXISTS ix_runs_region ON runs (region);
+CREATE INDEX IF NOT EXISTS ix_runs_cvegeo ON runs (cvegeo);
+CREATE INDEX IF NOT EXISTS ix_runs_geohash ON runs (geohash);
+CREATE INDEX IF NOT EXISTS ix_runs_ts ON runs (ts);
+"""
+
+COLUMNS = [
+    "ts", "folio", "region", "cvegeo", "geohash", "lat", "lon",
+    "integracion_score", "integracion_clasificacion", "competencia_resumen",
+    "decision_modelo_1", "decision_modelo_2", "payload_flat",
+]
+
+
+# =====================================================
+# GEOHASH
+# =====================================================
+def geohash_encode(lat: float, lon: float, precision: int = GEOHASH_PRECISION) -> str:
+    lat_rng, lon_rng = [-90.0, 90.0], [-180.0, 180.0]
+    out, bit, ch, even = [], 0, 0, True
+
+    while len(out) < precision:
+        rng, val = (lon_rng, lon) if even else (lat_rng, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if val >= mid:
+            ch |= 1 << (4 - bit)
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+
+        if bit < 4:
+            bit += 1
+        else:
+            out.append(_GEOHASH_BASE32[ch])
+            bit, ch = 0, 0
+
+    return "".join(out)
+
+
+_STOP = object()
+
+
+# =====================================================
+# STORE
+# =====================================================
+class RunHistoryStore:
+    """
+    Historial local de corridas en SQLite (índices por folio,
+    región, CVEGEO y geohash). Las escrituras se encolan y un
+    hilo las inserta en lotes (BATCH_SIZE o FLUSH_INTERVAL_S).
+    """
+
+    def __init__(self, path: str = DEFAULT_HISTORY_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._flushed = threading.Condition()
+        self._pending = 0
+        self._writer = threading.Thread(target=self._writer_loop, name="run-history", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # -------------------------------------------------
+    # ESCRITURA
+    # -------------------------------------------------
+    def append(
+        self,
+        *,
+        payload_flat: Dict[str, Any],
+        folio: str | None = None,
+        decision: Dict[str, Any] | None = None
+    ):
+        """
+        Encola una corrida (no bloquea el request).
+        """
+        p = payload_flat
+        decision = decision or {}
+        lat, lon = p.get("lat"), p.get("longitud")
+        resumen = p.get("competencia_resumen")
+
+        row = (
+            p.get("timestamp") or datetime.utcnow().isoformat(),
+            folio or p.get("id_ubicacion"),
+            p.get("region"),
+            p.get("INEGI_CVEGEO"),
+            geohash_encode(lat, lon) if lat is not None and lon is not None else None,
+            lat,
+            lon,
+            p.get("integracion_score"),
+            p.get("integracion_clasificacion"),
+            json.dumps(resumen, ensure_ascii=False) if resumen is not None else None,
+            decision.get("decision_modelo_1", p.get("decision_modelo_1")),
+            decision.get("decision_modelo_2", p.get("decision_modelo_2")),
+            dumps_json(p).decode("utf-8"),
+        )
+
+        with self._flushed:
+            self._pending += 1
+        self._queue.put(row)
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """
+        Espera a que todo lo encolado esté escrito.
+        """
+        with self._flushed:
+            return self._flushed.wait_for(lambda: self._pending == 0, timeout=timeout)
+
+    def close(self, timeout: float | None = 10.0):
+        """
+        Escribe lo pendiente y detiene el hilo escritor (shutdown;
+        el hilo es daemon y perdería el último lote).
+        """
+        if self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._writer.join(timeout=timeout)
+
+    def _write_batch(self, conn: sqlite3.Connection, sql: str, batch: list):
+        """
+        Un error NUNCA sale del hilo escritor: errores transitorios
+        (base bloqueada, disco) se reintentan; si el lote sigue
+        fallando se inserta fila por fila y solo se descartan (con
+        log) las filas que fallan.
+        """
+        for attempt in range(WRITE_RETRIES):
+            try:
+                with conn:
+                    conn.executemany(sql, batch)
+                return
+            except sqlite3.OperationalError as e:
+                logger.warning("run_history: lote de %d falló (%s), intento %d", len(batch), e, attempt + 1)
+                time.sleep(0.5 * 2 ** attempt)
+            except Exception as e:
+                logger.warning("run_history: lote de %d falló (%s)", len(batch), e)
+                break
+
+        for row in batch:
+            try:
+                with conn:
+                    conn.execute(sql, row)
+            except Exception as e:
+                logger.error("run_history: fila descartada (folio=%s): %s", row[1], e)
+
+    def _writer_loop(self):
+        conn = self._connect()
+        sql = f"INSERT INTO runs ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+
+        stop = False
+        while not stop:
+            batch = []
+            item = self._queue.get()
+            if item is _STOP:
+                stop = True
+            else:
+                batch.append(item)
+
+            deadline = time.monotonic() + FLUSH_INTERVAL_S
+            while not stop and len(batch) < BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                else:
+                    batch.append(item)
+
+            # Al detener: drenar lo que quede en la cola
+            while stop:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not _STOP:
+                    batch.append(item)
+
+            if not batch:
+                continue
+
+            try:
+                self._write_batch(conn, sql, batch)
+            except Exception:
+                logger.exception("run_history: error inesperado en el escritor")
+            finally:
+                with self._flushed:
+                    self._pending -= len(batch)
+                    self._flushed.notify_all()
+
+        conn.close()
+
+    # -------------------------------------------------
+    # CONSULTA
+    # -------------------------------------------------
+    def query(
+        self,
+        *,
+        folio: str | None = None,
+        region: str | None = None,
+        cvegeo: str | None = None,
+        geohash_prefix: str | None = None,
+        since: str | None = None,
+        until: str | None = None,
+        include_payload: bool = True,
+        limit: int = 1000,
+        offset: int = 0
+    ) -> List[Dict[str, Any]]:
+        where, args = [], []
+        if folio:
+            where.append("folio = ?")
+            args.append(folio)
+        if region:
+            where.append("region = ?")
+            args.append(region)
+        if cvegeo:
+            where.append("cvegeo = ?")
+            args.append(cvegeo)
+        if geohash_prefix:
+            # Rango sobre el índice (equivale a LIKE 'prefijo%')
+            where.append("geohash >= ? AND geohash < ?")
+            args += [geohash_prefix, geohash_prefix + "~"]
+        if since:
+            where.append("ts >= ?")
+            args.append(since)
+        if until:
+            where.append("ts < ?")
+            args.append(until)
+
+        cols = COLUMNS if include_payload else [c for c in COLUMNS if c != "payload_flat"]
+        sql = f"SELECT id, {', '.join(cols)} FROM runs"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY id DESC LIMIT ? OFFSET ?"
+        args += [limit, offset]
+
+        with self._connect() as conn:
+            rows = conn.execute(sql, args).fetchall()
+
+        out = []
+        for r in rows:
+            rec = dict(zip(["id"] + cols, r))
+            for k in ("payload_flat", "competencia_resumen"):
+                if rec.get(k):
+                    rec[k] = json.loads(rec[k])
+            out.append(rec)
+        return out
+
+    def nearby_payloads(
+        self,
+        *,
+        lat: float,
+        lon: float,
+        precision: int = 6,
+        limit: int = 20
+    ) -> List[Dict[str, Any]]:
+        """
+        Payloads completos (no degradados) de corridas en la misma
+        celda geohash (~1.2 km con precisión 6). Base de los
+        valores gruesos del modo con presupuesto de latencia.
+        """
+        rows = self.query(
+            geohash_prefix=geohash_encode(lat, lon, precision),
+            limit=limit
+        )
+        return [
+            r["payload_flat"] for r in rows
+            if r.get("payload_flat") and not r["payload_flat"].get("degradado")
+        ]
+
+
+# =====================================================
+# SINGLETON DE PROCESO
+# =====================================================
+_STORE = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_history_store() -> RunHistoryStore:
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            _STORE = RunHistoryStore()
+            atexit.register(_STORE.close)
+        return _STORE
+
+
+def close_history_store():
+    """
+    Shutdown: escribe lo pendiente si el store llegó a crearse.
+    """
+    with _STORE_LOCK:
+        store = _STORE
+    if store is not None:
+        store.close()
@@ -0,0 +1,119 @@
+# expansion/site_move.py
+
+from typing import Dict, Any, Tuple
+
+from expansion.geo import get_nearest_neto_store, haversine_km
+from expansion.inegi import lookup_municipio, prefix_inegi_keys
+from expansion.google_places import fetch_places_moved
+
+
+# =====================================================
+# MUNICIPIO TRAS MOVER EL PIN
+# =====================================================
+def municipio_after_move(
+    *,
+    lat: float,
+    lon: float,
+    prev_cvegeo: str | None,
+    municipio_locator=None,
+    inegi_src_path: str | None = None
+) -> Tuple[Dict[str, Any] | None, bool]:
+    """
+    Retorna (inegi_geo_raw, cruzo_frontera).
+
+    Si el punto sigue en el municipio previo retorna (None, False):
+    el caller reusa los datos INEGI que ya tenía. El lookup es la
+    malla (O(1) en celdas interiores) o una ventana por bbox del
+    cache FlatGeobuf; nunca la capa completa.
+    """
+    geo_raw = lookup_municipio(lat, lon, locator=municipio_locator, src_path=inegi_src_path)
+
+    if prev_cvegeo and str(geo_raw.get("CVEGEO")) == str(prev_cvegeo):
+        return None, False
+    return geo_raw, str(geo_raw.get("CVEGEO")) != str(prev_cvegeo)
+
+
+# =====================================================
+# RE-EVALUACIÓN INCREMENTAL
+# =====================================================
+def rerun_moved_site(
+    *,
+    folio: str,
+    lat: float,
+    lon: float,
+    prev_payload: Dict[str, Any] | None,
+    df_stores,
+    municipio_locator=None,
+    inegi_src_path: str | None = None,
+    df_inegi_tabular=None,
+    radius_m: int = 500
+) -> Dict[str, Any]:
+    """
+    Re-evalúa solo lo que depende de la distancia cuando el pin
+    se mueve unos metros:
+
+    - tienda NETO más cercana (siempre; es barato)
+    - municipio INEGI solo si el pin cruzó la frontera
+    - Places: reusa el área en cache y consulta la media luna
+
+    Los anillos (integración, generadores, competencia) se
+    recalculan río abajo a partir del CSV nuevo.
+    """
+    prev_payload = prev_payload or {}
+
+    nearest_store = get_nearest_neto_store(lat=lat, lon=lon, df_stores=df_stores)
+
+    # ---------------------------
+    # INEGI
+    # ---------------------------
+    inegi_data, crossed, recalculado = {}, False, False
+    if municipio_locator is not None or inegi_src_path:
+        geo_raw, crossed = municipio_after_move(
+            lat=lat,
+            lon=lon,
+            prev_cvegeo=prev_payload.get("INEGI_CVEGEO"),
+            municipio_locator=municipio_locator,
+            inegi_src_path=inegi_src_path
+        )
+
+        recalculado = geo_raw is not None
+        if geo_raw is None:
+            inegi_data = {k: v for k, v in prev_payload.items() if k.startswith("INEGI_")}
+        else:
+            tab_raw = {}
+            cvegeo = geo_raw.get("CVEGEO")
+            if cvegeo and df_inegi_tabular is not None:
+                row = df_inegi_tabular.loc[df_inegi_tabular["CVEGEO"] == str(cvegeo)]
+                if not row.empty:
+                    tab_raw = row.iloc[0].to_dict()
+            inegi_data = prefix_inegi_keys({**geo_raw, **tab_raw})
+
+    # ---------------------------
+    # GOOGLE PLACES
+    # ---------------------------
+    df_places, places_count, csv_path, places_stats = fetch_places_moved(
+        folio=folio,
+        lat=lat,
+        lon=lon,
+        radius_m=radius_m
+    )
+
+    prev_lat, prev_lon = prev_payload.get("lat"), prev_payload.get("longitud")
+    shift_m = (
+        round(float(haversine_km(prev_lat, prev_lon, lat, lon)) * 1000, 1)
+        if prev_lat is not None and prev_lon is not None else None
+    )
+
+    return {
+        "nearest_store": nearest_store,
+        "inegi_data": inegi_data,
+        "df_places": df_places,
+        "places_count": places_count,
+        "csv_path": csv_path,
+        "stats": {
+            "desplazamiento_m": shift_m,
+            "municipio_recalculado": recalculado,
+            "cruzo_frontera": bool(crossed),
+            "places": places_stats,
+        },
+    }
@@ -0,0 +1,7 @@
+# tests/conftest.py
+
+import os
+import sys
+
+# Raíz del repo importable (paquete `expansion`) también con `pytest` a secas
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,112 @@
+# tests/test_agent_evaluator.py
+#
+# Evaluación dual contra un stub local compatible con la API de
+# OpenAI (OPENAI_BASE_URL), sin red ni llave real.
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("openai")
+
+from expansion import agent_evaluator  # noqa: E402
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append(body)
+        self.server.peers.add(self.client_address)
+
+        content = json.dumps({"decision": "avanzar", "explicacion": " ok "})
+        out = json.dumps({
+            "id": "stub",
+            "object": "chat.completion",
+            "created": 0,
+            "model": body["model"],
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": content},
+            }],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        }).encode("utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_openai(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    server.requests, server.peers = [], set()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    monkeypatch.setenv("OPENAI_BASE_URL", f"http://127.0.0.1:{server.server_port}/v1")
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    agent_evaluator.reset_agent_client()
+    agent_evaluator.clear_agent_cache()
+
+    yield server
+
+    agent_evaluator.reset_agent_client()
+    server.shutdown()
+
+
+def _evaluate(region: str):
+    return agent_evaluator.evaluate_site_dual(
+        payload={"region": region, "lat": 19.4, "longitud": -99.1},
+        region_vector={},
+        tabla_global=None,
+        tabla_maduras=None
+    )
+
+
+def test_dual_evaluation_parses_both_slots(stub_openai):
+    out = _evaluate("CENTRO")
+
+    assert out["decision_modelo_1"] == "AVANZAR"
+    assert out["decision_modelo_2"] == "AVANZAR"
+    assert out["explicacion_1"] == "ok"
+    assert len(stub_openai.requests) == 2
+
+    stats = out["prompt_stats"]
+    assert stats["tokens_total"] == stats["tokens_static"] + stats["tokens_dynamic"] > 0
+
+
+def test_sync_calls_reuse_client_and_connections(stub_openai):
+    _evaluate("CENTRO")
+    _evaluate("SUR")
+
+    assert len(stub_openai.requests) == 4
+    assert len(agent_evaluator._CLIENTS) == 1
+    # Dos llamadas en paralelo abren a lo más dos conexiones; la
+    # segunda evaluación las reutiliza
+    assert len(stub_openai.peers) <= 2
+
+
+def test_cached_prompt_skips_the_model(stub_openai):
+    _evaluate("CENTRO")
+    _evaluate("CENTRO")
+
+    assert len(stub_openai.requests) == 2
+
+
+def test_sync_wrapper_works_inside_running_loop(stub_openai):
+    import asyncio
+
+    async def _inside_loop():
+        return _evaluate("NORTE")
+
+    out = asyncio.run(_inside_loop())
+    assert out["decision_modelo_1"] == "AVANZAR"
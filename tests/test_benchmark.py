@@ -0,0 +1,59 @@
+# tests/test_benchmark.py
+#
+# Benchmark por lote: regiones desconocidas o faltantes dan filas
+# NaN sin tumbar el resto del lote.
+
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from expansion import benchmark
+from expansion.benchmark import build_region_benchmark_matrix
+
+VARIABLES_MAP = {
+    "Hogares": {"vector": "INEGI_hogares", "payload": "INEGI_hogares"},
+    "Ventas": {"vector": "ventas", "payload": "ventas"},
+}
+
+
+@pytest.fixture
+def vectors_path(tmp_path):
+    path = tmp_path / "vectores.json"
+    path.write_text(json.dumps({
+        "CENTRO": {
+            "feature_cols": ["INEGI_hogares", "ventas"],
+            "profile_equilibrio": {"INEGI_hogares": 100.0, "ventas": 50.0},
+        },
+    }))
+    return str(path)
+
+
+def test_unknown_and_missing_regions_get_nan_rows(vectors_path):
+    df = pd.DataFrame({
+        "id_ubicacion": ["a", "b", "c", "d"],
+        "region": ["Centro", "MARTE", None, np.nan],
+        "INEGI_hogares": [110.0, 110.0, 110.0, 110.0],
+        "ventas": [25.0, 25.0, 25.0, 25.0],
+    })
+
+    out = build_region_benchmark_matrix(
+        payloads=df, variables_map=VARIABLES_MAP, json_path=vectors_path
+    )
+
+    assert out.loc["a"].tolist() == [10.0, -50.0]
+    assert out.loc[["b", "c", "d"]].isna().all().all()
+
+
+def test_region_cache_is_bounded(vectors_path, monkeypatch):
+    monkeypatch.setattr(benchmark, "_REGION_BENCH_CACHE_MAX", 2)
+    benchmark._REGION_BENCH_CACHE.clear()
+
+    build_region_benchmark_matrix(
+        payloads=[{"id_ubicacion": str(i), "region": f"R{i}"} for i in range(5)],
+        variables_map=VARIABLES_MAP,
+        json_path=vectors_path
+    )
+
+    assert len(benchmark._REGION_BENCH_CACHE) == 2
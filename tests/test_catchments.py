@@ -0,0 +1,71 @@
+# tests/test_catchments.py
+#
+# Áreas de influencia (Voronoi recortado) y actualización incremental
+# contra una reconstrucción completa.
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("geopandas")
+
+from expansion.catchments import StoreCatchments  # noqa: E402
+
+
+def _network(n: int = 12, seed: int = 7) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "STORE_ID": [f"T{i:02d}" for i in range(n)],
+        "FCLATITUD": 19.40 + rng.uniform(0, 0.08, n),
+        "FCLONGITUD": -99.15 + rng.uniform(0, 0.08, n),
+    })
+
+
+def _assert_same_cells(a: StoreCatchments, b: StoreCatchments):
+    assert set(a._cells) == set(b._cells)
+    for store_id, cell in b._cells.items():
+        assert a._cells[store_id].symmetric_difference(cell).area < 1.0, store_id
+
+
+def test_build_assigns_each_store_its_own_cell():
+    df = _network()
+    catch = StoreCatchments(max_radius_m=1500).build(df)
+
+    assert set(catch._cells) == set(df["STORE_ID"])
+    for row in df.itertuples():
+        assert catch.locate_point(row.FCLATITUD, row.FCLONGITUD) == row.STORE_ID
+
+    overlap = catch.overlap(df["FCLATITUD"].iloc[0], df["FCLONGITUD"].iloc[0], 500)
+    assert overlap["STORE_ID"].iloc[0] == df["STORE_ID"].iloc[0]
+    assert (overlap["porcentaje_area_tienda"] > 0).all()
+
+
+def test_single_store_gets_circle():
+    catch = StoreCatchments(max_radius_m=1000).build(_network(1))
+
+    cell = catch._cells["T00"]
+    assert cell.area == pytest.approx(np.pi * 1000 ** 2, rel=0.01)
+
+
+def test_incremental_update_matches_full_rebuild():
+    df = _network()
+    catch = StoreCatchments(max_radius_m=1500).build(df)
+
+    df2 = df[df["STORE_ID"] != "T03"].copy()
+    df2.loc[df2["STORE_ID"] == "T05", "FCLATITUD"] += 0.01
+    df2 = pd.concat([df2, pd.DataFrame({
+        "STORE_ID": ["T99"], "FCLATITUD": [19.44], "FCLONGITUD": [-99.11],
+    })], ignore_index=True)
+
+    stats = catch.update(df2)
+
+    assert (stats["altas"], stats["bajas"], stats["movidas"]) == (1, 1, 1)
+    assert 0 < stats["recalculadas"] <= len(df2)
+    _assert_same_cells(catch, StoreCatchments(max_radius_m=1500).build(df2))
+
+
+def test_update_without_changes_recalculates_nothing():
+    df = _network()
+    catch = StoreCatchments(max_radius_m=1500).build(df)
+
+    assert catch.update(df)["recalculadas"] == 0
@@ -0,0 +1,281 @@
+# tests/test_drive_queue.py
+#
+# Cola de subidas contra un endpoint Drive local (fake) vía
+# GOOGLE_DRIVE_API_ENDPOINT, sin red ni service account real.
+
+import json
+import threading
+import time
+import urllib.parse
+import uuid
+import zipfile
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("googleapiclient")
+
+from google.auth.credentials import AnonymousCredentials  # noqa: E402
+from googleapiclient import discovery  # noqa: E402
+
+from expansion import drive_queue, drive_uploader  # noqa: E402
+
+
+class _FakeDriveHandler(BaseHTTPRequestHandler):
+    """
+    Subida resumable mínima: POST/PATCH ?uploadType=resumable abre
+    sesión (Location), PUT a la sesión sube el contenido.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def _reply(self, status: int, body: dict | None = None, headers: dict | None = None):
+        out = json.dumps(body or {}).encode("utf-8")
+        self.send_response(status)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def _read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def _open_session(self):
+        self._read_body()
+        srv = self.server
+        srv.calls.append((self.command, self.path))
+
+        if srv.fail_next > 0:
+            srv.fail_next -= 1
+            self._reply(503, {"error": {"code": 503, "message": "backend error"}})
+            return
+
+        file_id = self.path.split("?")[0].rstrip("/").split("/")[-1]
+        if file_id == "files":
+            file_id = uuid.uuid4().hex[:12]
+        elif file_id not in srv.files:
+            self._reply(404, {"error": {"code": 404, "message": "File not found"}})
+            return
+        session = f"/session/{file_id}"
+        self._reply(200, headers={"Location": f"http://127.0.0.1:{srv.server_port}{session}"})
+
+    do_POST = _open_session
+    do_PATCH = _open_session
+
+    def do_PUT(self):
+        data = self._read_body()
+        file_id = self.path.rstrip("/").split("/")[-1]
+        self.server.files[file_id] = data
+        self._reply(200, {
+            "id": file_id,
+            "name": f"{file_id}.csv",
+            "webViewLink": f"https://drive.test/{file_id}",
+        })
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def fake_drive(monkeypatch, tmp_path):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeDriveHandler)
+    server.calls, server.files, server.fail_next = [], {}, 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    creds = AnonymousCredentials()
+    monkeypatch.setattr(drive_uploader, "DRIVE_API_ENDPOINT", f"http://127.0.0.1:{server.server_port}/")
+    monkeypatch.setattr(drive_uploader, "_load_credentials", lambda: creds)
+    monkeypatch.setattr(drive_uploader, "DRIVE_MANIFEST_DB", str(tmp_path / "manifest.sqlite"))
+    monkeypatch.setattr(drive_uploader, "DRIVE_MANIFEST_PATH", str(tmp_path / "manifest.json"))
+    monkeypatch.setattr(drive_uploader, "DRIVE_LOCK_DIR", str(tmp_path / "locks"))
+    # Con api_endpoint el cliente solo cambia el host de la URL de
+    # subida (queda https); el fake es http
+    monkeypatch.setattr(
+        discovery, "_fix_up_media_path_base_url",
+        lambda url, base: urllib.parse.urlunparse(
+            urllib.parse.urlparse(url)._replace(
+                scheme=urllib.parse.urlparse(base).scheme,
+                netloc=urllib.parse.urlparse(base).netloc
+            )
+        )
+    )
+
+    yield server
+
+    server.shutdown()
+
+
+def _queue(tmp_path, **kwargs) -> drive_queue.DriveUploadQueue:
+    kwargs.setdefault("backoff_base_s", 0.01)
+    kwargs.setdefault("backoff_max_s", 0.01)
+    return drive_queue.DriveUploadQueue(state_path=str(tmp_path / "state.sqlite"), **kwargs)
+
+
+def _wait_status(q, job_id, statuses=("done", "failed"), timeout=15.0):
+    t_end = time.monotonic() + timeout
+    while time.monotonic() < t_end:
+        job = q.get_status(job_id)
+        if job and job["status"] in statuses:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} sigue en {q.get_status(job_id)}")
+
+
+def _csv(tmp_path, name="sitio.csv", text="a,b\n1,2\n"):
+    path = tmp_path / name
+    path.write_text(text)
+    return str(path)
+
+
+def test_upload_retries_transient_error_and_status_is_shared(fake_drive, tmp_path):
+    fake_drive.fail_next = 1
+    q = _queue(tmp_path)
+    other_worker = _queue(tmp_path)
+    try:
+        job_id = q.enqueue(local_path=_csv(tmp_path), drive_folder_id="folder")
+
+        job = _wait_status(other_worker, job_id)
+        assert job["status"] == "done"
+        assert job["attempts"] == 2
+        assert job["result"]["action"] == "created"
+        assert list(fake_drive.files.values()) == [b"a,b\n1,2\n"]
+    finally:
+        q.shutdown()
+        other_worker.shutdown()
+
+
+def test_missing_file_fails_without_retry(fake_drive, tmp_path):
+    q = _queue(tmp_path)
+    try:
+        job_id = q.enqueue(local_path=str(tmp_path / "no_existe.csv"), drive_folder_id="folder")
+
+        job = _wait_status(q, job_id)
+        assert job["status"] == "failed"
+        assert job["attempts"] == 1
+        assert fake_drive.calls == []
+    finally:
+        q.shutdown()
+
+
+def test_deleted_drive_file_is_recreated_and_manifest_rewritten(fake_drive, tmp_path):
+    path = _csv(tmp_path)
+    drive_uploader._set_manifest_entry("folder", "sitio.csv", {
+        "file_id": "borrado", "name": "sitio.csv",
+        "webViewLink": "https://drive.test/borrado", "sha256": "viejo",
+    })
+
+    q = _queue(tmp_path)
+    try:
+        job = _wait_status(q, q.enqueue(local_path=path, drive_folder_id="folder"))
+    finally:
+        q.shutdown()
+
+    assert job["status"] == "done"
+    assert job["result"]["action"] == "created"
+    entry = drive_uploader._get_manifest_entry("folder", "sitio.csv")
+    assert entry["file_id"] == job["result"]["file_id"] != "borrado"
+    assert entry["sha256"] == drive_uploader.file_sha256(path)
+
+
+def test_same_hash_is_skipped_and_new_content_updates_in_place(fake_drive, tmp_path):
+    path = _csv(tmp_path)
+
+    created = drive_uploader.upload_or_update_file(local_path=path, drive_folder_id="folder")
+    n_calls = len(fake_drive.calls)
+
+    skipped = drive_uploader.upload_or_update_file(local_path=path, drive_folder_id="folder")
+    assert skipped["action"] == "skipped"
+    assert skipped["file_id"] == created["file_id"]
+    assert len(fake_drive.calls) == n_calls
+
+    _csv(tmp_path, text="a,b\n3,4\n")
+    updated = drive_uploader.upload_or_update_file(local_path=path, drive_folder_id="folder")
+    assert updated["action"] == "updated"
+    assert updated["file_id"] == created["file_id"]
+    assert fake_drive.files == {created["file_id"]: b"a,b\n3,4\n"}
+    assert drive_uploader._get_manifest_entry("folder", "sitio.csv")["sha256"] == drive_uploader.file_sha256(path)
+
+
+def test_concurrent_uploads_of_same_name_create_one_file(fake_drive, tmp_path):
+    path = _csv(tmp_path)
+    queues = [_queue(tmp_path) for _ in range(2)]
+    try:
+        job_ids = [q.enqueue(local_path=path, drive_folder_id="folder") for q in queues for _ in range(2)]
+        jobs = [_wait_status(queues[0], j) for j in job_ids]
+    finally:
+        for q in queues:
+            q.shutdown()
+
+    assert sorted(j["result"]["action"] for j in jobs) == ["created", "skipped", "skipped", "skipped"]
+    assert len(fake_drive.files) == 1
+
+
+def test_legacy_json_manifest_is_imported(fake_drive, tmp_path):
+    (tmp_path / "manifest.json").write_text(json.dumps({
+        "folder": {"viejo.csv": {"file_id": "x1", "name": "viejo.csv", "webViewLink": "l", "sha256": "s"}},
+    }))
+
+    assert drive_uploader._get_manifest_entry("folder", "viejo.csv")["file_id"] == "x1"
+
+
+def test_bundle_names_do_not_collide(tmp_path):
+    paths = []
+    for folder in ("a", "b"):
+        (tmp_path / folder).mkdir()
+        paths.append(_csv(tmp_path / folder, text=folder))
+
+    bundle = drive_uploader.build_artifact_bundle(paths, str(tmp_path / "bundle.zip"))
+
+    with zipfile.ZipFile(bundle) as zf:
+        assert sorted(zf.namelist()) == ["sitio.csv", "sitio_2.csv"]
+        assert {zf.read(n) for n in zf.namelist()} == {b"a", b"b"}
+
+
+def _insert_job(q, *, owner, lease_until, status="pending", updated_at=None, request=None):
+    job_id = uuid.uuid4().hex
+    now = updated_at or datetime.now(timezone.utc).isoformat()
+    with q._db() as conn:
+        conn.execute(
+            "INSERT INTO drive_jobs (job_id, kind, status, attempts, owner, lease_until, "
+            "created_at, updated_at, request) VALUES (?, 'file', ?, 0, ?, ?, ?, ?, ?)",
+            (job_id, status, owner, lease_until, now, now, json.dumps(request or {}))
+        )
+    return job_id
+
+
+def test_resume_claims_only_jobs_with_expired_lease(fake_drive, tmp_path):
+    seed = _queue(tmp_path)
+    seed.shutdown()
+
+    path = _csv(tmp_path)
+    request = {"local_path": path, "drive_folder_id": "folder", "filename": None, "mimetype": "text/csv"}
+    dead = _insert_job(seed, owner="otro:1", lease_until=time.time() - 1, request=request)
+    alive = _insert_job(seed, owner="otro:2", lease_until=time.time() + 3600, request=request)
+
+    q = _queue(tmp_path)
+    try:
+        assert _wait_status(q, dead)["status"] == "done"
+
+        job = q.get_status(alive)
+        assert job["status"] == "pending"
+        assert job["owner"] == "otro:2"
+    finally:
+        q.shutdown()
+
+
+def test_old_finished_jobs_are_pruned(fake_drive, tmp_path):
+    seed = _queue(tmp_path)
+    seed.shutdown()
+
+    old = (datetime.now(timezone.utc) - timedelta(days=2)).isoformat()
+    stale_done = _insert_job(seed, owner=None, lease_until=None, status="done", updated_at=old)
+    recent_done = _insert_job(seed, owner=None, lease_until=None, status="done")
+
+    q = _queue(tmp_path)
+    try:
+        assert q.get_status(stale_done) is None
+        assert q.get_status(recent_done)["status"] == "done"
+    finally:
+        q.shutdown()
@@ -0,0 +1,61 @@
+# tests/test_inegi_lookup.py
+#
+# Lookup de municipio sin la capa completa en memoria: malla +
+# geometrías por bbox del cache FlatGeobuf.
+
+import pytest
+
+gpd = pytest.importorskip("geopandas")
+pytest.importorskip("pyogrio")
+
+from shapely.geometry import box  # noqa: E402
+
+from expansion.inegi import find_municipio_inegi_cached, lookup_municipio  # noqa: E402
+from expansion.inegi_grid import load_municipio_locator  # noqa: E402
+
+
+@pytest.fixture
+def municipios_shp(tmp_path, monkeypatch):
+    # Rutas relativas por defecto (cache INEGI) dentro de tmp
+    monkeypatch.chdir(tmp_path)
+    gdf = gpd.GeoDataFrame(
+        {"CVEGEO": ["09001", "09002"], "NOMGEO": ["Oeste", "Este"]},
+        geometry=[box(-99.20, 19.30, -99.10, 19.40), box(-99.10, 19.30, -99.00, 19.40)],
+        crs="EPSG:4326"
+    )
+    path = tmp_path / "mun" / "00mun.shp"
+    path.parent.mkdir()
+    gdf.to_file(path)
+    return str(path)
+
+
+@pytest.mark.parametrize("lat,lon,cvegeo", [
+    (19.35, -99.15, "09001"),     # interior
+    (19.35, -99.1001, "09001"),   # a ~10 m del borde
+    (19.35, -99.0999, "09002"),
+    (19.35, -98.9990, "09002"),   # fuera, a ~100 m (nearest)
+])
+def test_grid_locator_and_bbox_window_agree(municipios_shp, lat, lon, cvegeo):
+    locator = load_municipio_locator(municipios_shp, grid_path="grid.npz", cache_dir="cache")
+
+    assert locator.find(lat, lon)["CVEGEO"] == cvegeo
+    assert find_municipio_inegi_cached(lat, lon, municipios_shp)["CVEGEO"] == cvegeo
+
+
+def test_far_point_is_not_found(municipios_shp):
+    assert find_municipio_inegi_cached(25.0, -105.0, municipios_shp) == {"INEGI_FOUND": False}
+    assert lookup_municipio(19.35, -99.15) == {}
+
+
+def test_move_within_municipio_reuses_previous_data(municipios_shp):
+    pytest.importorskip("requests")
+    from expansion.site_move import municipio_after_move
+
+    locator = load_municipio_locator(municipios_shp, grid_path="grid.npz", cache_dir="cache")
+
+    assert municipio_after_move(lat=19.35, lon=-99.15, prev_cvegeo="09001",
+                                municipio_locator=locator) == (None, False)
+
+    geo_raw, crossed = municipio_after_move(lat=19.35, lon=-99.05, prev_cvegeo="09001",
+                                            inegi_src_path=municipios_shp)
+    assert crossed and geo_raw["CVEGEO"] == "09002"
@@ -0,0 +1,41 @@
+# tests/test_pipeline_dag.py
+#
+# Cache del DAG: nodos con max_age_s expiran por ventana de tiempo
+# y arrastran a sus dependientes.
+
+import time
+
+from expansion.pipeline_dag import Node, PipelineDAG
+
+
+def _dag(tmp_path, calls):
+    def _fuente(ctx, params):
+        calls.append("fuente")
+        return len(calls)
+
+    def _derivado(ctx, params, fuente):
+        calls.append("derivado")
+        return fuente * 10
+
+    return PipelineDAG([
+        Node("fuente", _fuente, params=("x",), max_age_s=3600),
+        Node("derivado", _derivado, deps=["fuente"]),
+    ], cache_dir=str(tmp_path))
+
+
+def test_max_age_expires_node_and_dependents(tmp_path, monkeypatch):
+    calls = []
+    dag = _dag(tmp_path, calls)
+    now = [1_000 * 3600.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+
+    first = dag.run({"x": 1}, {})
+    assert [r["cache"] for r in first["report"]] == ["miss", "miss"]
+
+    now[0] += 1800
+    assert [r["cache"] for r in dag.run({"x": 1}, {})["report"]] == ["hit", "hit"]
+
+    now[0] += 3600
+    expired = dag.run({"x": 1}, {})
+    assert [r["cache"] for r in expired["report"]] == ["miss", "miss"]
+    assert calls == ["fuente", "derivado", "fuente", "derivado"]